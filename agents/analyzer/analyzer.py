@@ -1,18 +1,25 @@
 import json
-import os
 import logging
-from typing import List, Literal, Optional
+from itertools import chain, groupby, islice
+from typing import Callable, Dict, Iterable, Iterator, List, Literal, Optional
 from pydantic import BaseModel, Field
-from langchain_anthropic import ChatAnthropic
 from langchain_core.messages import SystemMessage, HumanMessage
 
+from agents.analyzer.sharding import number_tasks
+from agents.coder.file_tools import current_file_cache
 from agents.prompts.analyzer_prompts import ANALYZER_SYSTEM_TEMPLATE, FIX_SYSTEM_TEMPLATE
-from agents.tools.io.json_handlers import load_json_file, save_json_file
+from agents.tools.io.json_handlers import iter_jsonl, load_json_file, save_json_file
+from agents.tools import llm_gateway
+from agents.tools.api_diff import UNCHANGED_STATUS
+from agents.tools.budget import DEFERRED_STATUS, current_budget, priority
+from agents.tools.libraries import library_spec, prompt_fields, state_libraries
+from agents.tools.model_router import call_routed
+from agents.tools.recipes import recipe_task
+from agents.tools.telemetry import current_metrics
 
 logger = logging.getLogger(__name__)
 
 BATCH_SIZE = 10
-ANALYZER_MODEL = "claude-opus-4-6"
 
 
 class MigrationExample(BaseModel):
@@ -36,6 +43,7 @@ class MigrationTask(BaseModel):
     title: str = Field(..., description="Short summary of the task")
     description: str = Field(..., description="Detailed technical instruction for the coder. MUST include the 'after' code example.")
     files: List[str]
+    pattern_ids: List[int] = Field(default_factory=list, description="pattern_id of the patterns this task covers")
     status: Literal["pending"] = "pending"
 
 
@@ -43,65 +51,150 @@ class MigrationBatch(BaseModel):
     tasks: List[MigrationTask]
 
 
+def build_planner_llm(model: str):
+    return llm_gateway.chat_model(model).with_structured_output(MigrationBatch)
+
+
+def build_system_message(system_template: str, library: str, old_version: str, new_version: str,
+                         additional_instructions: str) -> SystemMessage:
+    formatted_system_text = system_template.format(
+        library=library,
+        old_version=old_version,
+        new_version=new_version,
+        additional_instructions=additional_instructions
+    )
+
+    return llm_gateway.cached_system_message(formatted_system_text)
+
+
+def order_by_shared_files(tasks: List[dict]) -> List[dict]:
+    """
+    Orders tasks so the ones touching the same files run back-to-back, which keeps the coder's
+    cached file prefix warm. Tasks without overlap keep their original order.
+    """
+    remaining = list(tasks)
+    ordered = []
+    while remaining:
+        if ordered:
+            last_files = set(ordered[-1].get("files", []))
+            next_task = max(remaining, key=lambda task: len(last_files & set(task.get("files", []))))
+        else:
+            next_task = remaining[0]
+        ordered.append(next_task)
+        remaining.remove(next_task)
+    return ordered
+
+
+def order_by_library(tasks: List[dict], libraries: List[Dict]) -> List[dict]:
+    """
+    Orders tasks library by library, in the order the libraries were given (the library the others build on,
+    e.g. numpy before pandas, goes first), and by shared files within a library. Tasks of no particular
+    library (fix tasks) go last.
+    """
+    rank = {spec["library"]: index for index, spec in enumerate(libraries)}
+    ordered = []
+    for _, group in groupby(sorted(tasks, key=lambda task: rank.get(task.get("library"), len(rank))),
+                            key=lambda task: task.get("library")):
+        ordered.extend(order_by_shared_files(list(group)))
+    return ordered
+
+
+def iter_batches(items: Iterable[dict], size: int, key: Optional[Callable[[dict], object]] = None
+                 ) -> Iterator[List[dict]]:
+    """
+    Yields batches of up to size items. With key, a batch also ends where key changes, so every batch
+    holds items of one kind (the patterns of one library).
+    """
+    if key is not None:
+        for _, group in groupby(items, key=key):
+            yield from iter_batches(group, size)
+        return
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def pattern_library(pattern: dict) -> Optional[str]:
+    return pattern.get("library")
+
+
+def without_recipe_patterns(patterns: Iterable[dict], libraries: List[Dict], project_path: str,
+                            recipe_tasks: List[dict]) -> Iterator[dict]:
+    """
+    Yields the patterns the LLM has to plan. Patterns a learned recipe fully covers become recipe tasks
+    (appended to recipe_tasks) that the coder replays without an LLM call.
+    """
+    for pattern in patterns:
+        spec = library_spec(libraries, pattern.get("library")) or libraries[0]
+        task = recipe_task(pattern, spec, project_path, current_file_cache().read)
+        if task is None:
+            yield pattern
+        else:
+            recipe_tasks.append(task)
+
+
+def build_batch_message(batch: List[dict], mode: str) -> HumanMessage:
+    batch_json_str = json.dumps(batch, indent=2)
+    if mode == "fixing":
+        return HumanMessage(content=f"Fix these runtime errors:\n{batch_json_str}")
+    return HumanMessage(content=f"Analyze this batch of usage patterns:\n{batch_json_str}")
+
+
 def analyzer_node(state):
     logger.info("Analyzer: Starting process...")
 
-    usage_path = state.get("usage_path", "usage.json")
+    usage_path = state.get("usage_path", "usage.jsonl")
     plan_path = state.get("plan_path", "migration_plan.json")
     errors_path = state.get("errors_path", "errors.json")
 
     user_message = state.get("message")
     additional_instructions = user_message if user_message else "No additional instructions provided."
 
-    library = state.get("library")
-    old_version = state.get("old_version")
-    new_version = state.get("new_version")
-    api_key = os.getenv("ANTHROPIC_API_KEY")
+    libraries = state_libraries(state)
 
     errors_data = load_json_file(errors_path)
+    recipe_tasks = []
 
     if errors_data:
         logger.info(f"Fixing mode activated. Found {len(errors_data)} errors.")
         mode = "fixing"
-        input_data = errors_data
+        input_data = iter(errors_data)
         system_template = FIX_SYSTEM_TEMPLATE
+        reverted_tasks = state.get("reverted_tasks", [])
+        if reverted_tasks:
+            additional_instructions += (
+                "\nThese earlier fix tasks were reverted because they introduced new errors. "
+                f"Use a different approach: {json.dumps(reverted_tasks)}"
+            )
     else:
         logger.info("Planning mode activated.")
         mode = "planning"
-        input_data = load_json_file(usage_path)
+        # Patterns are streamed from the JSON Lines file batch by batch instead of being loaded whole.
+        input_data = (pattern for pattern in iter_jsonl(usage_path)
+                      if pattern.get("status") not in (UNCHANGED_STATUS, DEFERRED_STATUS))
         system_template = ANALYZER_SYSTEM_TEMPLATE
-
-    if not input_data:
+        if current_budget() is not None:
+            # By priority within each library; the libraries keep their order.
+            rank = {spec["library"]: index for index, spec in enumerate(libraries)}
+            input_data = iter(sorted(sorted(input_data, key=priority, reverse=True),
+                                     key=lambda pattern: rank.get(pattern.get("library"), len(rank))))
+        input_data = without_recipe_patterns(input_data, libraries, state.get("project_path", "."), recipe_tasks)
+
+    first_batch = list(islice(input_data, BATCH_SIZE))
+    if not first_batch and not recipe_tasks:
         logger.warning("No input data found for processing. Exiting.")
         return {"status": "done", "plan_path": plan_path}
 
-    try:
-        llm = ChatAnthropic(
-            model_name=ANALYZER_MODEL,
-            temperature=0,
-            api_key=api_key
-        )
-        structured_llm = llm.with_structured_output(MigrationBatch)
-    except Exception as e:
-        logger.critical(f"Failed to initialize LLM: {e}")
-        return {"status": "error", "error": "LLM init failed"}
+    # Planning batches hold the patterns of one library and are planned for that library; fix batches span all.
+    system_messages = {}
 
-    formatted_system_text = system_template.format(
-        library=library,
-        old_version=old_version,
-        new_version=new_version,
-        additional_instructions=additional_instructions
-    )
-
-    system_message = SystemMessage(
-        content=[
-            {
-                "type": "text",
-                "text": formatted_system_text,
-                "cache_control": {"type": "ephemeral"}
-            }
-        ]
-    )
+    def system_message_for(batch: List[dict]) -> SystemMessage:
+        library = pattern_library(batch[0]) if mode == "planning" else None
+        if library not in system_messages:
+            system_messages[library] = build_system_message(
+                system_template, **prompt_fields(libraries, library), additional_instructions=additional_instructions
+            )
+        return system_messages[library]
 
     existing_plan = []
     if mode == "fixing":
@@ -113,32 +206,35 @@ def analyzer_node(state):
     if existing_plan:
         current_max_id = max([t.get("task_id", 0) for t in existing_plan])
 
-    total_items = len(input_data)
     new_tasks = []
 
-    logger.info(f"Processing {total_items} items in batches of {BATCH_SIZE} with Prompt Caching")
+    logger.info(f"Processing items in batches of {BATCH_SIZE} with Prompt Caching")
+    budget = current_budget()
 
-    for i in range(0, total_items, BATCH_SIZE):
-        batch = input_data[i: i + BATCH_SIZE]
-        batch_json_str = json.dumps(batch, indent=2)
-        batch_num = (i // BATCH_SIZE) + 1
+    batch_key = pattern_library if mode == "planning" else None
+    for batch_num, batch in enumerate(iter_batches(chain(first_batch, input_data), BATCH_SIZE, batch_key), 1):
+        if mode == "planning" and budget is not None and budget.exhausted():
+            deferred_before = len(budget.deferred_patterns)
+            budget.defer(patterns=chain(batch, input_data), stage="planning")
+            logger.warning(f"Analyzer: Budget exhausted. "
+                           f"{len(budget.deferred_patterns) - deferred_before} patterns left unplanned.")
+            break
 
         try:
             logger.debug(f"Sending batch {batch_num} to LLM...")
 
-            if mode == "fixing":
-                user_content = f"Fix these runtime errors:\n{batch_json_str}"
-            else:
-                user_content = f"Analyze this batch of usage patterns:\n{batch_json_str}"
+            system_message = system_message_for(batch)
+            human_message = build_batch_message(batch, mode)
+            signals = {"chars": len(human_message.content), "fix_iteration": state.get("fix_iteration", 0)}
 
-            human_message = HumanMessage(content=user_content)
+            with current_metrics().span(f"{mode}_batch_{batch_num}", "analyzer_batch"):
+                result: MigrationBatch = call_routed(mode, signals, lambda model: llm_gateway.invoke(
+                    build_planner_llm(model), [system_message, human_message], model=model
+                ))
 
-            result: MigrationBatch = structured_llm.invoke([system_message, human_message])
-
-            for task in result.tasks:
-                current_max_id += 1
-                task.task_id = current_max_id
-                new_tasks.append(task.model_dump())
+            library = pattern_library(batch[0]) if mode == "planning" else None
+            new_tasks.extend({**task.model_dump(), "library": library} if library else task.model_dump()
+                             for task in result.tasks)
 
             logger.info(f"Batch {batch_num} processed successfully. Generated {len(result.tasks)} tasks.")
 
@@ -146,6 +242,10 @@ def analyzer_node(state):
             logger.error(f"Error processing batch {batch_num}: {e}", exc_info=True)
             continue
 
+    if recipe_tasks:
+        logger.info(f"Analyzer: {len(recipe_tasks)} patterns are covered by learned recipes and were not sent to the LLM.")
+    new_tasks = number_tasks(order_by_library(recipe_tasks + new_tasks, libraries), state.get("project_path", "."), current_max_id)
+
     if mode == "fixing":
         final_plan = existing_plan + new_tasks
         save_json_file(errors_path, [])
@@ -0,0 +1,196 @@
+import os
+import ast
+import logging
+from typing import Dict, List, Set
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+SHARD_TOKEN_BUDGET = 24000
+MAX_SHARD_FILES = 12
+SOURCE_ROOTS = {"src", "lib"}
+SHARDED_STATUS = "sharded"
+
+
+def _module_names(path: str) -> List[str]:
+    """
+    Dotted names a repo-relative file can be imported as: from the repo root, and from src/ or lib/.
+    """
+    parts = os.path.splitext(path.replace(os.sep, "/"))[0].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    if not parts:
+        return []
+    names = [".".join(parts)]
+    if len(parts) > 1 and parts[0] in SOURCE_ROOTS:
+        names.append(".".join(parts[1:]))
+    return names
+
+
+def _imported_modules(source: str, path: str) -> Set[str]:
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError, RecursionError):
+        return set()
+
+    package = [part for part in os.path.dirname(path.replace(os.sep, "/")).split("/") if part]
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                if node.level - 1 > len(package):
+                    continue
+                base_parts = package[:len(package) - (node.level - 1)]
+                base = ".".join(base_parts + ([node.module] if node.module else []))
+            else:
+                base = node.module or ""
+            if base:
+                modules.add(base)
+            modules.update(f"{base}.{alias.name}" if base else alias.name for alias in node.names)
+    return modules
+
+
+def import_groups(project_path: str, files: List[str]) -> List[List[str]]:
+    """
+    Splits files into connected components of the import graph restricted to these files,
+    so modules that import each other end up in the same group.
+    """
+    by_module = {}
+    for path in files:
+        for name in _module_names(path):
+            by_module.setdefault(name, path)
+
+    parent = {path: path for path in files}
+
+    def find(path: str) -> str:
+        while parent[path] != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    for path in files:
+        if not path.endswith(".py"):
+            continue
+        try:
+            with open(os.path.join(project_path, path), "r", encoding="utf-8", errors="replace") as f:
+                source = f.read()
+        except OSError:
+            continue
+        for module in _imported_modules(source, path):
+            other = by_module.get(module)
+            if other and other != path:
+                parent[find(other)] = find(path)
+
+    groups: Dict[str, List[str]] = {}
+    for path in files:
+        groups.setdefault(find(path), []).append(path)
+    return [sorted(group) for group in groups.values()]
+
+
+def estimate_tokens(project_path: str, path: str) -> int:
+    try:
+        return os.path.getsize(os.path.join(project_path, path)) // CHARS_PER_TOKEN
+    except OSError:
+        return 0
+
+
+def pack_shards(project_path: str, files: List[str], token_budget: int = SHARD_TOKEN_BUDGET,
+                max_files: int = MAX_SHARD_FILES) -> List[List[str]]:
+    """
+    Packs the import groups of files into shards of at most token_budget tokens and max_files files
+    (first fit, largest group first). A group larger than one shard is split in path order.
+    """
+    tokens = {path: estimate_tokens(project_path, path) for path in files}
+
+    pieces = []
+    for group in import_groups(project_path, files):
+        piece, piece_tokens = [], 0
+        for path in group:
+            if piece and (piece_tokens + tokens[path] > token_budget or len(piece) >= max_files):
+                pieces.append(piece)
+                piece, piece_tokens = [], 0
+            piece.append(path)
+            piece_tokens += tokens[path]
+        pieces.append(piece)
+
+    shards: List[List[str]] = []
+    shard_tokens: List[int] = []
+    for piece in sorted(pieces, key=lambda piece: (-sum(tokens[path] for path in piece), piece[0])):
+        size = sum(tokens[path] for path in piece)
+        for index, shard in enumerate(shards):
+            if shard_tokens[index] + size <= token_budget and len(shard) + len(piece) <= max_files:
+                shard.extend(piece)
+                shard_tokens[index] += size
+                break
+        else:
+            shards.append(list(piece))
+            shard_tokens.append(size)
+
+    return sorted((sorted(shard) for shard in shards), key=lambda shard: shard[0])
+
+
+def split_task(task: Dict, project_path: str, token_budget: int = SHARD_TOKEN_BUDGET) -> List[Dict]:
+    """
+    Returns the shards of a task that is too wide for one coder request, or [] if it fits.
+    The task itself is marked SHARDED_STATUS and is done once all of its shards are; every shard
+    is a regular pending task with parent_task_id set, so it is coded, committed and bisected on its own.
+    Task ids of the shards are assigned by the caller.
+    """
+    files = sorted(set(task.get("files", [])))
+    total = sum(estimate_tokens(project_path, path) for path in files)
+    if total <= token_budget and len(files) <= MAX_SHARD_FILES:
+        return []
+
+    shards = pack_shards(project_path, files, token_budget)
+    if len(shards) < 2:
+        return []
+
+    task["status"] = SHARDED_STATUS
+    task["shards"] = len(shards)
+    logger.info(f"Sharding: Task {task.get('task_id')} ({task['title']}) covers {len(files)} files "
+                f"(~{total} tokens). Split into {len(shards)} shards.")
+
+    return [{
+        **{key: value for key, value in task.items() if key not in ("task_id", "shards")},
+        "title": f"{task['title']} (part {number}/{len(shards)})",
+        "files": shard,
+        "status": "pending",
+        "parent_task_id": task.get("task_id"),
+        "shard": f"{number}/{len(shards)}"
+    } for number, shard in enumerate(shards, 1)]
+
+
+def number_tasks(tasks: List[Dict], project_path: str, start_id: int) -> List[Dict]:
+    """
+    Assigns task ids after start_id and inserts the shards of wide tasks right after their parent.
+    """
+    numbered = []
+    for task in tasks:
+        start_id += 1
+        task["task_id"] = start_id
+        numbered.append(task)
+        for shard in split_task(task, project_path):
+            start_id += 1
+            shard["task_id"] = start_id
+            numbered.append(shard)
+    return numbered
+
+
+def complete_parent(plan: List[Dict], task: Dict) -> bool:
+    """
+    Marks the parent of a finished shard as done once none of its shards is left to do.
+    """
+    parent_id = task.get("parent_task_id")
+    if parent_id is None:
+        return False
+    shards = [other for other in plan if other.get("parent_task_id") == parent_id]
+    if any(shard.get("status") in ("pending", "in_progress") for shard in shards):
+        return False
+    for other in plan:
+        if other.get("task_id") == parent_id and other.get("status") == SHARDED_STATUS:
+            other["status"] = "done"
+            logger.info(f"Sharding: All {len(shards)} shards of task {parent_id} are done.")
+            return True
+    return False
@@ -0,0 +1,164 @@
+import json
+import shutil
+import logging
+import tempfile
+from typing import Dict, List, Optional, Set
+
+from agents.tools.io.json_handlers import load_json_file, save_json_file
+from agents.tools.git_ops import (
+    add_worktree, checkout_worktree, remove_worktree,
+    list_commits_since, revert_commit, get_head_commit
+)
+from agents.tools.testing.common import fingerprint_error, fingerprint_errors
+from agents.tester.tester import collect_errors
+from agents.tools.recipes import recipe_failed
+from agents.tools.telemetry import current_metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_TASK_ATTEMPTS = 2
+
+
+class CommitProbe:
+    """
+    Runs the tester against arbitrary commits in a detached worktree and memoizes the fingerprint sets.
+    """
+
+    def __init__(self, project_path: str, worktree_path: str):
+        self.project_path = project_path
+        self.worktree_path = worktree_path
+        self.cache: Dict[str, Set[str]] = {}
+        self.started = False
+
+    def fingerprints(self, commit: str) -> Set[str]:
+        if commit in self.cache:
+            return self.cache[commit]
+
+        if not self.started:
+            add_worktree(self.project_path, self.worktree_path, commit)
+            self.started = True
+        else:
+            checkout_worktree(self.worktree_path, commit)
+
+        logger.info(f"Bisector: Running tester on {commit[:8]}...")
+        errors = collect_errors(self.worktree_path)
+        self.cache[commit] = set(fingerprint_errors(errors)) if errors else set()
+        return self.cache[commit]
+
+    def close(self):
+        if self.started:
+            remove_worktree(self.project_path, self.worktree_path)
+        shutil.rmtree(self.worktree_path, ignore_errors=True)
+
+
+def find_first_bad_commit(probe: CommitProbe, commits: List[str], fingerprint: str) -> Optional[str]:
+    """
+    Binary search for the first commit whose tester run contains the fingerprint.
+    The last commit is expected to contain it and the base (before commits[0]) is expected not to.
+    """
+    if not commits:
+        return None
+
+    lo, hi = 0, len(commits) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if fingerprint in probe.fingerprints(commits[mid]):
+            hi = mid
+        else:
+            lo = mid + 1
+    return commits[lo]
+
+
+def _requeue_task(task: Dict, errors: List[Dict]):
+    error_lines = [
+        {"file": err.get("file"), "line": err.get("line"), "message": err.get("message")}
+        for err in errors
+    ]
+    task["status"] = "pending"
+    task["attempts"] = task.get("attempts", 1) + 1
+    task["reverted_commit"] = task.pop("commit", "")
+    task["description"] = (
+        f"{task.get('description', '')}\n\n"
+        "PREVIOUS ATTEMPT WAS REVERTED because it introduced these errors. Apply the change without them:\n"
+        f"{json.dumps(error_lines, indent=2)}"
+    )
+
+
+def bisector_node(state):
+    logger.info("Bisector: Start working...")
+
+    project_path = state.get("project_path", ".")
+    plan_path = state.get("plan_path", "migration_plan.json")
+    errors_path = state.get("errors_path", "errors.json")
+    base_commit = state.get("migration_base_commit")
+
+    errors = load_json_file(errors_path)
+    migration_plan = load_json_file(plan_path)
+
+    if not base_commit or not errors or not isinstance(migration_plan, list):
+        logger.info("Bisector: Nothing to bisect. Passing errors to analyzer.")
+        return {"status": "bisect_skipped", "has_pending_tasks": False}
+
+    task_by_commit = {
+        task["commit"]: task for task in migration_plan
+        if task.get("commit") and task.get("status") == "done"
+    }
+    commits = list_commits_since(project_path, base_commit)
+    if not task_by_commit or not commits:
+        return {"status": "bisect_skipped", "has_pending_tasks": False}
+
+    errors_by_fp: Dict[str, List[Dict]] = {}
+    for err in errors:
+        errors_by_fp.setdefault(fingerprint_error(err), []).append(err)
+
+    probe = CommitProbe(project_path, tempfile.mkdtemp(prefix="migrator-bisect-"))
+    probe.cache[commits[-1]] = set(errors_by_fp)
+    culprits: Dict[str, List[str]] = {}
+
+    try:
+        base_fps = probe.fingerprints(base_commit)
+        new_fps = [fp for fp in errors_by_fp if fp not in base_fps]
+        logger.info(f"Bisector: {len(new_fps)} error clusters were introduced during the migration.")
+
+        for fp in new_fps:
+            culprit = find_first_bad_commit(probe, commits, fp)
+            if culprit in task_by_commit:
+                culprits.setdefault(culprit, []).append(fp)
+    except Exception as e:
+        logger.error(f"Bisector: Bisection failed: {e}")
+        culprits = {}
+    finally:
+        probe.close()
+
+    attributed = set()
+    requeued = 0
+    for commit in sorted(culprits, key=commits.index, reverse=True):
+        task = task_by_commit[commit]
+        if task.get("attempts", 1) >= MAX_TASK_ATTEMPTS:
+            logger.info(f"Bisector: Task {task['task_id']} already retried. Leaving its errors to the analyzer.")
+            continue
+        if not revert_commit(project_path, commit):
+            continue
+
+        task_errors = [err for fp in culprits[commit] for err in errors_by_fp[fp]]
+        if task.get("recipe"):
+            # The retry is coded by the LLM.
+            recipe_failed(task)
+        _requeue_task(task, task_errors)
+        attributed.update(culprits[commit])
+        requeued += 1
+        current_metrics().count("retries.task")
+        logger.info(f"Bisector: Task {task['task_id']} ({task['title']}) introduced "
+                    f"{len(task_errors)} errors. Reverted and re-queued.")
+
+    save_json_file(plan_path, migration_plan)
+
+    remaining = [err for fp, errs in errors_by_fp.items() if fp not in attributed for err in errs]
+    save_json_file(errors_path, remaining)
+
+    return {
+        "status": "bisected",
+        "has_pending_tasks": requeued > 0,
+        "needs_analysis": bool(remaining),
+        "fix_base_commit": get_head_commit(project_path)
+    }
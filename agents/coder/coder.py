@@ -1,34 +1,292 @@
 import os
 import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import HumanMessage, ToolMessage
 
-from agents.tools.io.json_handlers import load_json_file, save_json_file
+from agents.tools.io.json_handlers import iter_jsonl, load_json_file, save_json_file
 from agents.tools.io.file_ops import read_file, write_file
 from agents.tools.git_ops import create_commit
-from agents.prompts.coder_prompts import CODER_SYSTEM_TEMPLATE
+from agents.analyzer.sharding import CHARS_PER_TOKEN, complete_parent
+from agents.coder.file_tools import FileTools, current_file_cache
+from agents.tools.budget import BUDGET_EXHAUSTED, current_budget
+from agents.tools.token_usage import current_usage
+from agents.tools import llm_gateway
+from agents.tools.model_router import call_routed, classify_task
+from agents.tools.telemetry import current_metrics
+from agents.tools.libraries import prompt_fields, state_libraries
+from agents.tools.recipes import replay_task
+from agents.prompts.coder_prompts import (
+    CODER_FINAL_TURN_PROMPT, CODER_SYSTEM_TEMPLATE, CODER_TASK_TEMPLATE, CODER_TOOLS_SYSTEM_TEMPLATE
+)
 
 logger = logging.getLogger(__name__)
 
-CODER_MODEL = "claude-opus-4-6"
+MAX_PARALLEL_SHARDS = 4
 
+# Tasks whose files are larger than this are coded with a tool loop over file regions instead of
+# sending the files whole. The loop stops after MAX_TOOL_TURNS model calls or TOOL_LOOP_TOKEN_BUDGET tokens.
+TOOL_LOOP_MIN_CHARS = 32_000
+MAX_TOOL_TURNS = 12
+TOOL_LOOP_TOKEN_BUDGET = 60_000
 
-def coder_node(state):
-    logger.info("Coder: Start working...")
+# Writing files and committing stay serialized: create_commit stages the whole worktree,
+# so shards coded in parallel must not interleave their writes.
+COMMIT_LOCK = threading.Lock()
+
+
+def reset_interrupted_tasks(plan_path: str) -> int:
+    """
+    Puts tasks left "in_progress" by an interrupted run back to "pending".
+    """
+    migration_plan = load_json_file(plan_path)
+    if not isinstance(migration_plan, list):
+        return 0
+
+    interrupted = 0
+    for task in migration_plan:
+        if task.get("status") == "in_progress":
+            task["status"] = "pending"
+            interrupted += 1
+
+    if interrupted:
+        save_json_file(plan_path, migration_plan)
+        logger.info(f"Coder: Re-queued {interrupted} interrupted tasks.")
+    return interrupted
+
+
+def validate_edits(ai_msg):
+    """
+    Rejects tool calls that could not be applied, so the router can retry on a stronger model.
+    """
+    for tool_call in ai_msg.tool_calls or []:
+        if tool_call["name"] not in ("write_file", "edit_file"):
+            continue
+        args = tool_call.get("args") or {}
+        if not isinstance(args.get("file_path"), str) or not args["file_path"].strip():
+            raise ValueError(f"{tool_call['name']} call without a file path")
+        fields = ("content",) if tool_call["name"] == "write_file" else ("old_text", "new_text")
+        for field in fields:
+            if not isinstance(args.get(field), str):
+                raise ValueError(f"{tool_call['name']} call for {args['file_path']} without {field}")
+    return ai_msg
+
+
+def _file_chars(project_path: str, files: List[str]) -> int:
+    total = 0
+    for file_path in files:
+        try:
+            total += os.path.getsize(os.path.join(project_path, file_path))
+        except OSError:
+            pass
+    return total
+
+
+def _message_tokens(ai_msg) -> int:
+    usage = getattr(ai_msg, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+    return len(str(ai_msg.content)) // CHARS_PER_TOKEN
+
+
+def _edits_in_one_call(task: dict, project_path: str, files_to_edit: List[str], system_text: str,
+                       task_text: str) -> Dict[str, str]:
+    """
+    Sends the task's files whole and returns the files the model rewrote (path -> content).
+    """
+    file_blocks = []
+    for file_path in files_to_edit:
+        full_read_path = os.path.join(project_path, file_path)
+        content = read_file(full_read_path)
+        file_blocks.append({"type": "text", "text": f"\n--- FILE: {file_path} ---\n{content}\n"})
+    files_context = "".join(block["text"] for block in file_blocks)
+    if file_blocks:
+        file_blocks[-1] = llm_gateway.cached_block(file_blocks[-1]["text"])
+
+    # Stable prefix (system prompt, then file contents) with cache breakpoints; the task text goes last.
+    messages = [
+        llm_gateway.cached_system_message(system_text),
+        HumanMessage(content=[{"type": "text", "text": "Here is the code context:"}, *file_blocks,
+                              {"type": "text", "text": task_text}])
+    ]
+
+    logger.info("Coder: Invoking LLM to perform edits...")
+    signals = {
+        "chars": len(files_context),
+        "files": len(files_to_edit),
+        "kind": classify_task(task),
+        "attempts": task.get("attempts", 1)
+    }
+    ai_msg = call_routed("code", signals, lambda model: validate_edits(llm_gateway.invoke(
+        llm_gateway.chat_model(model).bind_tools([write_file]), messages, model=model
+    )))
 
+    return {tool_call["args"]["file_path"]: tool_call["args"]["content"]
+            for tool_call in ai_msg.tool_calls or [] if tool_call["name"] == "write_file"}
+
+
+def _edits_with_tools(task: dict, project_path: str, files_to_edit: List[str], system_text: str,
+                      task_text: str, total_chars: int) -> Dict[str, str]:
+    """
+    Lets the model pull the regions it needs (read_file_range, grep_in_file, list_symbols) and edit them,
+    for at most MAX_TOOL_TURNS calls and TOOL_LOOP_TOKEN_BUDGET tokens. The last call only offers the edit
+    tools. Returns the edited files (path -> content).
+    """
+    tools = FileTools(project_path, files_to_edit, current_file_cache())
+    outline = "\n".join(tools.outline(file_path) for file_path in files_to_edit)
+    messages = [
+        llm_gateway.cached_system_message(system_text),
+        HumanMessage(content=[llm_gateway.cached_block(f"Outline of the files to edit:\n{outline}\n"),
+                              {"type": "text", "text": task_text}])
+    ]
+    # Routed by the size of the files, as if they were sent whole, so the tier matches the one-call path.
+    signals = {
+        "chars": total_chars,
+        "files": len(files_to_edit),
+        "kind": classify_task(task),
+        "attempts": task.get("attempts", 1)
+    }
+
+    logger.info(f"Coder: Task {task.get('task_id')} covers ~{total_chars // CHARS_PER_TOKEN} tokens of files. "
+                f"Using the file tool loop.")
+    spent = 0
+    turn = 0
+    for turn in range(1, MAX_TOOL_TURNS + 1):
+        final = turn == MAX_TOOL_TURNS or spent >= TOOL_LOOP_TOKEN_BUDGET
+        if final and turn > 1:
+            messages.append(HumanMessage(content=CODER_FINAL_TURN_PROMPT))
+        available = tools.edit_tools() if final else tools.read_tools() + tools.edit_tools()
+
+        ai_msg = call_routed("code", signals, lambda model: validate_edits(llm_gateway.invoke(
+            llm_gateway.chat_model(model).bind_tools(available), messages, model=model
+        )))
+        spent += _message_tokens(ai_msg)
+        messages.append(ai_msg)
+
+        if not ai_msg.tool_calls:
+            break
+        for tool_call in ai_msg.tool_calls:
+            messages.append(ToolMessage(content=tools.run(tool_call), tool_call_id=tool_call["id"]))
+        if final:
+            logger.warning(f"Coder: Task {task.get('task_id')} reached the tool loop budget "
+                           f"({turn} turns, {spent} tokens).")
+            break
+
+    metrics = current_metrics()
+    metrics.count("coder.tool_loop_tasks")
+    metrics.count("coder.tool_loop_turns", turn)
+    metrics.count("coder.tool_calls", tools.calls)
+    logger.info(f"Coder: Tool loop finished after {turn} turns and {tools.calls} tool calls "
+                f"({spent} tokens), {len(tools.staged)} files edited.")
+    return tools.staged
+
+
+def apply_task(task: dict, state) -> str:
+    """
+    Asks the LLM to perform one task (or replays its recipe), writes the edited files and commits them.
+    Returns the commit hash, or "" if no changes were needed. Raises if the LLM call fails.
+    """
     user_message = state.get("message")
     additional_instructions = user_message if user_message else "No additional instructions provided."
 
-    plan_path = state.get("plan_path", "migration_plan.json")
     project_path = state.get("project_path", ".")
+    # A task planned for one library is coded for that library; fix tasks get all of the run's libraries.
+    versions = prompt_fields(state_libraries(state), task.get("library"))
+
+    # Sorted so tasks on the same files send an identical, cacheable prefix.
+    files_to_edit = sorted(set(task.get("files", [])))
+
+    edits = None
+    if task.get("recipe"):
+        edits = replay_task(task, project_path, current_file_cache().read)
+        if edits is None:
+            logger.info(f"Coder: Recipe of task {task['task_id']} no longer covers its files. Asking the LLM.")
+            task.pop("recipe")
+        else:
+            logger.info(f"Coder: Replayed recipe {task['recipe']} on {len(edits)} files.")
+
+    if edits is None:
+        total_chars = _file_chars(project_path, files_to_edit)
+        use_tools = total_chars > TOOL_LOOP_MIN_CHARS
+
+        formatted_system = (CODER_TOOLS_SYSTEM_TEMPLATE if use_tools else CODER_SYSTEM_TEMPLATE).format(
+            **versions,
+            additional_instructions=additional_instructions,
+            max_turns=MAX_TOOL_TURNS
+        )
+        formatted_task = CODER_TASK_TEMPLATE.format(
+            task_title=task['title'],
+            task_description=task['description'],
+            file_list=", ".join(files_to_edit)
+        )
+
+        if use_tools:
+            edits = _edits_with_tools(task, project_path, files_to_edit, formatted_system, formatted_task,
+                                      total_chars)
+        else:
+            edits = _edits_in_one_call(task, project_path, files_to_edit, formatted_system, formatted_task)
+
+    if not edits:
+        logger.info("Coder: LLM decided no changes are needed for these files.")
 
-    library = state.get("library", "library")
-    old_version = state.get("old_version", "old")
-    new_version = state.get("new_version", "new")
-    api_key = os.getenv("ANTHROPIC_API_KEY")
+    with COMMIT_LOCK:
+        for file_path, content in edits.items():
+            full_path = os.path.join(project_path, file_path)
+            logger.info(f"Coder: Executing write_file for {full_path}")
+            write_file(full_path, content)
+
+        if not edits:
+            logger.info(f"Coder: Skipping commit for task {task['task_id']} (no changes made).")
+            return ""
+
+        commit_msg = f"Refactor: {task['title']}"
+        description = task.get("description")
+        if task.get("parent_task_id") is not None:
+            description = f"Shard {task.get('shard')} of task {task['parent_task_id']}.\n\n{description or ''}".strip()
+        return create_commit(project_path, commit_msg, description=description)
+
+
+def apply_tasks(tasks: List[Dict], state) -> List:
+    """
+    Runs apply_task for independent tasks (shards of one task, which touch disjoint files) in parallel.
+    Returns the commit hash or the raised exception of each task, in order.
+    """
+    def run(task):
+        try:
+            return apply_task(task, state)
+        except Exception as e:
+            return e
+
+    if len(tasks) == 1:
+        return [run(tasks[0])]
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_SHARDS, len(tasks)), thread_name_prefix="coder") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, run, task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+def coder_node(state):
+    logger.info("Coder: Start working...")
+
+    plan_path = state.get("plan_path", "migration_plan.json")
 
     migration_plan = load_json_file(plan_path)
+
+    budget = current_budget()
+    pending = [task for task in migration_plan or [] if task.get("status") == "pending"]
+    if budget is not None and (pending or budget.deferred_patterns) and budget.exhausted():
+        budget.defer_tasks(pending, iter_jsonl(state.get("usage_path", "usage.jsonl")), "coding")
+        logger.warning(f"Coder: Budget exhausted ({budget.describe()}). Stopping with {len(pending)} tasks left "
+                       f"after checking the committed work.")
+        return {
+            "status": BUDGET_EXHAUSTED,
+            "final_status": f"{BUDGET_EXHAUSTED}_{budget.kind}",
+            "plan_path": plan_path,
+            "has_pending_tasks": False
+        }
+
     if not migration_plan:
         logger.warning("Migration plan is empty or invalid.")
         return {
@@ -37,14 +295,7 @@ def coder_node(state):
             "has_pending_tasks": False
         }
 
-    current_task = None
-    task_index = -1
-
-    for idx, task in enumerate(migration_plan):
-        if task.get("status") == "pending":
-            current_task = task
-            task_index = idx
-            break
+    current_task = next((task for task in migration_plan if task.get("status") == "pending"), None)
 
     if not current_task:
         logger.info("Coder: No pending tasks found. All done.")
@@ -54,91 +305,52 @@ def coder_node(state):
             "has_pending_tasks": False
         }
 
-    logger.info(f"Coder: Picked up task {current_task['task_id']}: {current_task['title']}")
+    # Shards of one task touch disjoint files, so all pending ones are coded together.
+    current_tasks = [current_task]
+    if current_task.get("parent_task_id") is not None:
+        current_tasks = [task for task in migration_plan if task.get("status") == "pending"
+                         and task.get("parent_task_id") == current_task["parent_task_id"]]
+        logger.info(f"Coder: Picked up {len(current_tasks)} shards of task {current_task['parent_task_id']}: "
+                    f"{', '.join(str(task['task_id']) for task in current_tasks)}")
+    else:
+        logger.info(f"Coder: Picked up task {current_task['task_id']}: {current_task['title']}")
 
-    migration_plan[task_index]["status"] = "in_progress"
+    for task in current_tasks:
+        task["status"] = "in_progress"
     save_json_file(plan_path, migration_plan)
 
-    files_to_edit = current_task.get("files", [])
-    files_context = ""
-
-    for file_path in files_to_edit:
-        full_read_path = os.path.join(project_path, file_path)
-        content = read_file(full_read_path)
-        files_context += f"\n--- FILE: {file_path} ---\n{content}\n"
+    results = dict(zip((task["task_id"] for task in current_tasks), apply_tasks(current_tasks, state)))
+    # Tasks whose recipe did not apply were coded by the LLM instead.
+    fell_back = {task["task_id"] for task in current_tasks if "recipe" not in task}
 
-    tools = [write_file]
-
-    try:
-        llm = ChatAnthropic(
-            model_name=CODER_MODEL,
-            temperature=0,
-            api_key=api_key
-        )
-        llm_with_tools = llm.bind_tools(tools)
-    except Exception as e:
-        logger.critical(f"Failed to initialize Coder LLM: {e}")
-        return {
-            "status": "error",
-            "plan_path": plan_path,
-            "has_pending_tasks": False
-        }
-
-    formatted_system = CODER_SYSTEM_TEMPLATE.format(
-        library=library,
-        old_version=old_version,
-        new_version=new_version,
-        task_title=current_task['title'],
-        task_description=current_task['description'],
-        file_list=", ".join(files_to_edit),
-        additional_instructions=additional_instructions
-    )
+    migration_plan = load_json_file(plan_path)
 
-    messages = [
-        SystemMessage(content=formatted_system),
-        HumanMessage(content=f"Here is the code context:\n{files_context}\n\nPlease perform the task.")
-    ]
+    failed = False
+    for task in migration_plan:
+        if task["task_id"] not in results:
+            continue
+        result = results[task["task_id"]]
+        if isinstance(result, Exception):
+            logger.error(f"Coder: LLM execution failed for task {task['task_id']}: {result}")
+            failed = True
+            continue
+        task["status"] = "done"
+        if result:
+            task["commit"] = result
+        if task["task_id"] in fell_back:
+            task.pop("recipe", None)
+        complete_parent(migration_plan, task)
+        logger.info(f"Coder: Task {task['task_id']} completed and saved.")
 
-    changes_made = False
-    try:
-        logger.info("Coder: Invoking LLM to perform edits...")
-        ai_msg = llm_with_tools.invoke(messages)
-
-        if ai_msg.tool_calls:
-            for tool_call in ai_msg.tool_calls:
-                if tool_call["name"] == "write_file":
-                    args = tool_call["args"]
-                    args["file_path"] = os.path.join(project_path, args["file_path"])
-                    logger.info(f"Coder: Executing write_file for {tool_call['args']['file_path']}")
-                    write_file(**tool_call["args"])
-                    changes_made = True
-        else:
-            logger.info("Coder: LLM decided no changes are needed for these files.")
+    save_json_file(plan_path, migration_plan)
 
-    except Exception as e:
-        logger.error(f"Coder: LLM execution failed: {e}")
+    if failed:
         return {
             "status": "error",
             "plan_path": plan_path,
             "has_pending_tasks": False
         }
 
-    if changes_made:
-        commit_msg = f"Refactor: {current_task['title']}"
-        create_commit(project_path, commit_msg, description=current_task.get("description"))
-    else:
-        logger.info(f"Coder: Skipping commit for task {current_task['task_id']} (no changes made).")
-
-    migration_plan = load_json_file(plan_path)
-
-    for task in migration_plan:
-        if task["task_id"] == current_task["task_id"]:
-            task["status"] = "done"
-            break
-
-    save_json_file(plan_path, migration_plan)
-    logger.info(f"Coder: Task {current_task['task_id']} completed and saved.")
-
     has_pending_tasks = any(task.get("status") == "pending" for task in migration_plan)
     if has_pending_tasks:
         logger.info("Coder: Pending tasks remain after this run.")
@@ -148,5 +360,6 @@ def coder_node(state):
     return {
         "status": "coding" if has_pending_tasks else "all_done",
         "plan_path": plan_path,
-        "has_pending_tasks": has_pending_tasks
+        "has_pending_tasks": has_pending_tasks,
+        "tokens_used": current_usage().total_tokens
     }
@@ -0,0 +1,229 @@
+import os
+import re
+import ast
+import logging
+import threading
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_RANGE_LINES = 400
+MAX_GREP_MATCHES = 50
+MAX_CONTEXT_LINES = 10
+
+
+class FileCache:
+    """
+    In-memory cache of the project files the coder reads during one run.
+    Entries are checked against the file's mtime and size on every read, so files written by the coder,
+    reverted by the bisector or changed by hand are read again.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, path: str) -> Optional[str]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                self.hits += 1
+                return entry[2]
+
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                content = f.read()
+        except OSError:
+            return None
+
+        with self._lock:
+            self.misses += 1
+            self._entries[path] = (stat.st_mtime_ns, stat.st_size, content)
+        return content
+
+
+RUN_FILE_CACHE = FileCache()
+_CURRENT_FILE_CACHE: ContextVar[FileCache] = ContextVar("current_file_cache", default=RUN_FILE_CACHE)
+
+
+def current_file_cache() -> FileCache:
+    return _CURRENT_FILE_CACHE.get()
+
+
+def use_file_cache(cache: FileCache):
+    _CURRENT_FILE_CACHE.set(cache)
+
+
+def _numbered(lines: List[str], start: int) -> str:
+    return "\n".join(f"{number:>6}\t{line}" for number, line in enumerate(lines, start))
+
+
+class FileTools:
+    """
+    The coder's view of the project during one task. Reads are served from the run's FileCache;
+    edits are staged in memory (later reads see them) and written by the caller when the task is committed.
+    Any file inside the project can be read; only the task's files can be edited.
+    """
+
+    def __init__(self, project_path: str, editable: List[str], cache: FileCache):
+        self.project_path = os.path.abspath(project_path)
+        self.editable = {self._relative(path) for path in editable}
+        self.cache = cache
+        self.staged: Dict[str, str] = {}
+        self.calls = 0
+
+    def _relative(self, file_path: str) -> Optional[str]:
+        full_path = os.path.normpath(os.path.join(self.project_path, file_path))
+        relative = os.path.relpath(full_path, self.project_path)
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            return None
+        return relative
+
+    def _content(self, file_path: str) -> Tuple[Optional[str], str]:
+        relative = self._relative(file_path)
+        if relative is None:
+            return None, f"Error: {file_path} is outside the project."
+        if relative in self.staged:
+            return self.staged[relative], relative
+        content = self.cache.read(os.path.join(self.project_path, relative))
+        if content is None:
+            return None, f"Error: {file_path} does not exist."
+        return content, relative
+
+    def outline(self, file_path: str) -> str:
+        content, relative = self._content(file_path)
+        if content is None:
+            return f"--- FILE: {file_path} ---\n{relative}"
+        return f"--- FILE: {relative} ({len(content.splitlines())} lines) ---\n{self.list_symbols(relative)}"
+
+    def read_file_range(self, file_path: str, start_line: int, end_line: int) -> str:
+        """
+        Returns lines start_line to end_line (1-based, inclusive) of a project file, each prefixed with
+        its line number and a tab. At most 400 lines per call.
+        """
+        content, relative = self._content(file_path)
+        if content is None:
+            return relative
+        lines = content.splitlines()
+        start = max(1, start_line)
+        end = min(len(lines), end_line, start + MAX_RANGE_LINES - 1)
+        if start > len(lines):
+            return f"{relative} has only {len(lines)} lines."
+        return _numbered(lines[start - 1:end], start)
+
+    def grep_in_file(self, file_path: str, pattern: str, context_lines: int = 2) -> str:
+        """
+        Searches a project file for a regular expression (plain text if it is not a valid one) and returns
+        the matching lines with their line numbers and context_lines lines around each match.
+        """
+        content, relative = self._content(file_path)
+        if content is None:
+            return relative
+        try:
+            regex = re.compile(pattern)
+        except re.error:
+            regex = re.compile(re.escape(pattern))
+
+        lines = content.splitlines()
+        matches = [number for number, line in enumerate(lines) if regex.search(line)]
+        if not matches:
+            return f"No matches for {pattern!r} in {relative}."
+
+        context_lines = max(0, min(context_lines, MAX_CONTEXT_LINES))
+        blocks, last_end = [], -1
+        for number in matches[:MAX_GREP_MATCHES]:
+            start, end = max(0, number - context_lines), min(len(lines), number + context_lines + 1)
+            if start <= last_end and blocks:
+                blocks[-1] = (blocks[-1][0], end)
+            else:
+                blocks.append((start, end))
+            last_end = end
+        result = "\n--\n".join(_numbered(lines[start:end], start + 1) for start, end in blocks)
+        if len(matches) > MAX_GREP_MATCHES:
+            result += f"\n... {len(matches) - MAX_GREP_MATCHES} more matches. Use a narrower pattern."
+        return result
+
+    def list_symbols(self, file_path: str) -> str:
+        """
+        Lists the imports, classes, functions and methods of a Python file with their line ranges.
+        """
+        content, relative = self._content(file_path)
+        if content is None:
+            return relative
+        line_count = len(content.splitlines())
+        if not relative.endswith(".py"):
+            return f"{relative} is not a Python file ({line_count} lines)."
+        try:
+            tree = ast.parse(content)
+        except (SyntaxError, ValueError) as e:
+            return f"Cannot parse {relative} ({line_count} lines): {e}"
+
+        entries = []
+
+        def visit(nodes, depth: int):
+            for node in nodes:
+                if isinstance(node, (ast.Import, ast.ImportFrom)) and depth == 0:
+                    entries.append(f"{node.lineno:>6}\t{ast.unparse(node)}")
+                elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    kind = "class" if isinstance(node, ast.ClassDef) else "def"
+                    entries.append(f"{node.lineno:>6}-{node.end_lineno}\t{'    ' * depth}{kind} {node.name}")
+                    if isinstance(node, ast.ClassDef):
+                        visit(node.body, depth + 1)
+
+        visit(tree.body, 0)
+        return "\n".join(entries) or f"No imports, classes or functions in {relative} ({line_count} lines)."
+
+    def edit_file(self, file_path: str, old_text: str, new_text: str) -> str:
+        """
+        Replaces old_text with new_text in one of the task's files. old_text must occur exactly once,
+        including indentation, so read the region first. Later reads see the edited file.
+        """
+        content, relative = self._content(file_path)
+        if content is None:
+            return relative
+        if relative not in self.editable:
+            return f"Error: {relative} is not one of the files of this task."
+        count = content.count(old_text) if old_text else 0
+        if count != 1:
+            return (f"Error: old_text occurs {count} times in {relative}; "
+                    f"it must occur exactly once. Include more surrounding lines.")
+        start_line = content[:content.index(old_text)].count("\n") + 1
+        end_line = start_line + old_text.rstrip("\n").count("\n")
+        self.staged[relative] = content.replace(old_text, new_text, 1)
+        return f"Edited {relative}: replaced lines {start_line}-{end_line}."
+
+    def write_file(self, file_path: str, content: str) -> str:
+        """
+        Overwrites one of the task's files with its full new content. Prefer edit_file for large files.
+        """
+        relative = self._relative(file_path)
+        if relative is None or relative not in self.editable:
+            return f"Error: {file_path} is not one of the files of this task."
+        self.staged[relative] = content
+        return f"Wrote {relative} ({len(content.splitlines())} lines)."
+
+    def read_tools(self) -> List[Callable]:
+        return [self.read_file_range, self.grep_in_file, self.list_symbols]
+
+    def edit_tools(self) -> List[Callable]:
+        return [self.edit_file, self.write_file]
+
+    def run(self, tool_call: Dict) -> str:
+        self.calls += 1
+        tool = next((tool for tool in self.read_tools() + self.edit_tools()
+                     if tool.__name__ == tool_call["name"]), None)
+        if tool is None:
+            return f"Error: Unknown tool {tool_call['name']}."
+        try:
+            return tool(**(tool_call.get("args") or {}))
+        except Exception as e:
+            logger.warning(f"Coder: Tool {tool_call['name']} failed: {e}")
+            return f"Error: {e}"
@@ -0,0 +1,295 @@
+import os
+import math
+import logging
+from typing import Dict, List, Optional
+
+from agents.analyzer.analyzer import BATCH_SIZE
+from agents.analyzer.sharding import CHARS_PER_TOKEN, pack_shards
+from agents.coder.coder import MAX_PARALLEL_SHARDS
+from agents.prompts.analyzer_prompts import ANALYZER_SYSTEM_TEMPLATE
+from agents.prompts.coder_prompts import CODER_SYSTEM_TEMPLATE
+from agents.prompts.searcher_prompts import (
+    DISCOVERY_SYSTEM_PROMPT, REFINE_MIGRATION_BATCH_PROMPT, SEARCH_USAGES_SYSTEM_PROMPT
+)
+from agents.searcher.searcher import REFINE_BATCH_SIZE, RepoSearcher
+from agents.searcher.symbol_resolver import is_foreign, resolve_symbols
+from agents.searcher.usage_store import UsageStore
+from agents.tools.advice_pack import lookup_advice
+from agents.tools.api_diff import get_api_diff
+from agents.tools.budget import cost_of
+from agents.tools.doc_ranker import DOC_TOKEN_BUDGET
+from agents.tools.io.json_handlers import load_json_file, save_json_file
+from agents.tools.limits import CONTEXT7_LIMITER, LLM_LIMITER
+from agents.tools.model_router import choose_model
+from agents.tools.response_cache import CACHE_ROOT
+
+logger = logging.getLogger(__name__)
+
+HISTORY_PATH = os.path.join(CACHE_ROOT, "run_history.json")
+HISTORY_RUNS = 20
+
+# Used for routes no recorded run has made calls on yet.
+DEFAULT_OUTPUT_TOKENS = {"discovery": 40, "extraction": 350, "refine": 1200, "planning": 2500, "fixing": 2000}
+DEFAULT_BASE_SECONDS = 2.0
+DEFAULT_OUTPUT_TOKENS_PER_SECOND = 60
+DEFAULT_CONTEXT7_SECONDS = 1.5
+PLANNING_TOKENS_PER_PATTERN = 350
+MESSAGE_OVERHEAD_TOKENS = 50
+
+# Calls of one route that the pipeline issues concurrently (the rest run one after another).
+ROUTE_PARALLELISM = {"code": MAX_PARALLEL_SHARDS}
+
+
+def record_run(summary: Dict):
+    """
+    Appends the billed LLM calls, latencies and tokens per route and the Context7 calls of a finished run
+    to the history the dry-run estimator projects from.
+    """
+    routes: Dict[str, Dict] = {}
+    for route, models in summary.get("routing", {}).items():
+        entry = {"calls": 0, "seconds": 0.0, "input_tokens": 0, "output_tokens": 0}
+        for stats in models.values():
+            entry["calls"] += stats.get("llm_calls", 0)
+            entry["seconds"] += stats.get("llm_seconds", 0.0)
+            entry["input_tokens"] += stats.get("input_tokens", 0)
+            entry["output_tokens"] += stats.get("output_tokens", 0)
+        if entry["calls"]:
+            routes[route] = entry
+    if not routes:
+        return
+
+    context7 = summary.get("categories", {}).get("context7", {})
+    history = load_json_file(HISTORY_PATH)
+    if not isinstance(history, list):
+        history = []
+    history.append({
+        "routes": routes,
+        "context7": {"calls": context7.get("calls", 0), "seconds": context7.get("seconds", 0.0)},
+        "wall_seconds": summary.get("wall_seconds", 0.0)
+    })
+    os.makedirs(os.path.dirname(HISTORY_PATH), exist_ok=True)
+    save_json_file(HISTORY_PATH, history[-HISTORY_RUNS:])
+
+
+class RouteModel:
+    """
+    Per-call output tokens and latency of each route, averaged over the recorded runs.
+    """
+
+    def __init__(self, history: List[Dict]):
+        self.runs = len(history)
+        self.routes: Dict[str, Dict] = {}
+        context7_calls, context7_seconds = 0, 0.0
+        for run in history:
+            for route, stats in run.get("routes", {}).items():
+                entry = self.routes.setdefault(route, {"calls": 0, "seconds": 0.0, "output_tokens": 0})
+                for key in entry:
+                    entry[key] += stats.get(key, 0)
+            context7_calls += run.get("context7", {}).get("calls", 0)
+            context7_seconds += run.get("context7", {}).get("seconds", 0.0)
+        self.context7_seconds = context7_seconds / context7_calls if context7_calls else DEFAULT_CONTEXT7_SECONDS
+
+    def output_tokens(self, route: str) -> int:
+        stats = self.routes.get(route)
+        if stats and stats["calls"]:
+            return round(stats["output_tokens"] / stats["calls"])
+        return DEFAULT_OUTPUT_TOKENS.get(route, 1000)
+
+    def seconds(self, route: str, output_tokens: int) -> float:
+        """
+        Latency of one call, scaled by its output size: generation time dominates LLM latency.
+        """
+        stats = self.routes.get(route)
+        if stats and stats["calls"] and stats["output_tokens"]:
+            return stats["seconds"] / stats["output_tokens"] * output_tokens
+        if stats and stats["calls"]:
+            return stats["seconds"] / stats["calls"]
+        return DEFAULT_BASE_SECONDS + output_tokens / DEFAULT_OUTPUT_TOKENS_PER_SECOND
+
+    def calls_per_run(self, route: str) -> float:
+        stats = self.routes.get(route)
+        return stats["calls"] / self.runs if stats and self.runs else 0.0
+
+
+def _tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def _local_import_names(library: str) -> List[str]:
+    """
+    The real run asks the LLM for import names; the dry run guesses them from the distribution name.
+    """
+    return sorted({library, library.replace("-", "_"), library.replace("-", "_").lower()})
+
+
+def _static_usages(content: str, file_path: str, import_names: List[str]) -> List[Dict]:
+    """
+    Library symbols referenced in a file, the most specific one per reference
+    (pandas.DataFrame.append, not also pandas.DataFrame).
+    """
+    usages = []
+    for line, symbols in resolve_symbols(content, import_names).items():
+        library_symbols = {symbol for symbol in symbols if "." in symbol and not is_foreign(symbol)}
+        for symbol in library_symbols:
+            if not any(other.startswith(f"{symbol}.") for other in library_symbols):
+                usages.append({"file": file_path, "line": line, "symbol": symbol})
+    return usages
+
+
+class Projection:
+    def __init__(self, model: RouteModel):
+        self.model = model
+        self.routes: Dict[str, Dict] = {}
+
+    def add(self, route: str, input_tokens: int, output_tokens: Optional[int] = None, signals: Dict = None):
+        output_tokens = self.model.output_tokens(route) if output_tokens is None else output_tokens
+        llm, _ = choose_model(route, signals or {})
+        entry = self.routes.setdefault(route, {"calls": 0, "input_tokens": 0, "output_tokens": 0,
+                                               "seconds": 0.0, "cost": 0.0})
+        entry["calls"] += 1
+        entry["input_tokens"] += input_tokens
+        entry["output_tokens"] += output_tokens
+        entry["seconds"] += self.model.seconds(route, output_tokens)
+        entry["cost"] += cost_of(llm, {"input_tokens": input_tokens, "output_tokens": output_tokens})
+
+
+async def estimate_run(project_path: str, library: str, old_version: str, new_version: str) -> Dict:
+    """
+    Projects the LLM and Context7 calls, tokens, cost and wall time of a migration from the local parts only:
+    candidate scan, static usage extraction, grouping by symbol and the local API diff. Nothing is sent
+    to the LLM or Context7. Output tokens and latencies come from recorded runs where available.
+    """
+    history = load_json_file(HISTORY_PATH)
+    model = RouteModel(history if isinstance(history, list) else [])
+    projection = Projection(model)
+    import_names = _local_import_names(library)
+
+    searcher = RepoSearcher(project_path)
+    await searcher.serena.start()
+    extraction_system = _tokens(SEARCH_USAGES_SYSTEM_PROMPT)
+    store = UsageStore()
+    file_tokens: Dict[str, int] = {}
+    projection.add("discovery", _tokens(DISCOVERY_SYSTEM_PROMPT) + MESSAGE_OVERHEAD_TOKENS)
+    try:
+        candidate_files = sorted(await searcher.serena.find_candidate_files(import_names))
+        for file_path in candidate_files:
+            content = await searcher.serena.read_file(file_path)
+            if not content:
+                continue
+            file_tokens[file_path] = _tokens(content)
+            projection.add("extraction", extraction_system + file_tokens[file_path] + MESSAGE_OVERHEAD_TOKENS,
+                           signals={"chars": len(content)})
+            store.add_file(file_path, _static_usages(content, file_path, import_names))
+    finally:
+        searcher.serena.release()
+
+    api_diff = await get_api_diff(library, old_version, new_version, import_names)
+    groups = store.groups(api_diff.canonical if api_diff is not None else None)
+    changed = {symbol: group for symbol, group in groups.items()
+               if api_diff is None or api_diff.changes_for(symbol) != []}
+
+    symbols = list(changed)
+    # Symbols answered by a loaded advice pack skip Context7 and the refiner.
+    looked_up = [symbol for symbol in symbols if lookup_advice(library, old_version, new_version, symbol) is None]
+
+    refine_system = _tokens(REFINE_MIGRATION_BATCH_PROMPT)
+    for start in range(0, len(looked_up), REFINE_BATCH_SIZE):
+        elements = len(looked_up[start:start + REFINE_BATCH_SIZE])
+        chars = elements * DOC_TOKEN_BUDGET * CHARS_PER_TOKEN
+        projection.add("refine", refine_system + elements * DOC_TOKEN_BUDGET,
+                       signals={"chars": chars, "files": elements})
+
+    planning_system = _tokens(ANALYZER_SYSTEM_TEMPLATE)
+    for start in range(0, len(symbols), BATCH_SIZE):
+        patterns = len(symbols[start:start + BATCH_SIZE])
+        projection.add("planning", planning_system + patterns * PLANNING_TOKENS_PER_PATTERN)
+
+    coder_system = _tokens(CODER_SYSTEM_TEMPLATE)
+    for group in changed.values():
+        for shard in pack_shards(project_path, group.affected_files()):
+            tokens = sum(file_tokens.get(path, 0) for path in shard)
+            # The coder rewrites whole files, so the output is about as large as the files it edits.
+            projection.add("code", coder_system + tokens + MESSAGE_OVERHEAD_TOKENS, output_tokens=tokens,
+                           signals={"chars": tokens * CHARS_PER_TOKEN, "files": len(shard)})
+
+    fixing_calls = round(model.calls_per_run("fixing"))
+    for _ in range(fixing_calls):
+        projection.add("fixing", _tokens(ANALYZER_SYSTEM_TEMPLATE) + PLANNING_TOKENS_PER_PATTERN * 2)
+
+    context7_requests = len(looked_up) + (1 if looked_up else 0)
+    llm_concurrency = LLM_LIMITER.max_concurrency
+    context7_parallel = min(REFINE_BATCH_SIZE, CONTEXT7_LIMITER.max_concurrency or REFINE_BATCH_SIZE)
+
+    wall_seconds = math.ceil(context7_requests / context7_parallel) * model.context7_seconds
+    for route, entry in projection.routes.items():
+        parallel = ROUTE_PARALLELISM.get(route, 1)
+        if llm_concurrency:
+            parallel = min(parallel, llm_concurrency)
+        entry["seconds"] = round(entry["seconds"], 1)
+        entry["cost"] = round(entry["cost"], 4)
+        wall_seconds += entry["seconds"] / parallel
+
+    routes = projection.routes
+    return {
+        "project_path": project_path,
+        "library": library,
+        "old_version": old_version,
+        "new_version": new_version,
+        "import_names": import_names,
+        "candidate_files": len(candidate_files),
+        "candidate_tokens": sum(file_tokens.values()),
+        "usages": store.usages,
+        "usage_groups": len(groups),
+        "unchanged_groups": len(groups) - len(changed),
+        "advice_pack_groups": len(symbols) - len(looked_up),
+        "api_diff": api_diff is not None,
+        "groups": sorted(({"symbol": symbol, "occurrence_count": group.count,
+                           "affected_files": len(group.files),
+                           "unchanged": symbol not in changed}
+                          for symbol, group in groups.items()),
+                         key=lambda group: (group["occurrence_count"], group["affected_files"]), reverse=True),
+        "routes": routes,
+        "context7_requests": context7_requests,
+        "llm_calls": sum(entry["calls"] for entry in routes.values()),
+        "input_tokens": sum(entry["input_tokens"] for entry in routes.values()),
+        "output_tokens": sum(entry["output_tokens"] for entry in routes.values()),
+        "cost": round(sum(entry["cost"] for entry in routes.values()), 2),
+        "wall_seconds": round(wall_seconds, 1),
+        "llm_concurrency": llm_concurrency,
+        "history_runs": model.runs
+    }
+
+
+def format_estimate(estimate: Dict) -> str:
+    lines = [
+        f"Dry run: {estimate['library']} {estimate['old_version']} -> {estimate['new_version']} "
+        f"in {estimate['project_path']}",
+        f"candidate files: {estimate['candidate_files']} (~{estimate['candidate_tokens']} tokens), "
+        f"static usages: {estimate['usages']} in {estimate['usage_groups']} groups, "
+        f"unchanged per API diff: {estimate['unchanged_groups']}"
+        + ("" if estimate["api_diff"] else " (no local API diff)")
+        + f", answered by advice packs: {estimate['advice_pack_groups']}",
+        ""
+    ]
+    header = f"{'route':<12}{'calls':>7}{'in tok':>12}{'out tok':>12}{'seconds':>10}{'cost $':>10}"
+    lines += [header, "-" * len(header)]
+    for route, entry in estimate["routes"].items():
+        lines.append(f"{route:<12}{entry['calls']:>7}{entry['input_tokens']:>12}{entry['output_tokens']:>12}"
+                     f"{entry['seconds']:>10.1f}{entry['cost']:>10.2f}")
+    lines += [
+        "",
+        f"Context7 requests: {estimate['context7_requests']}",
+        f"LLM calls: {estimate['llm_calls']}, input tokens: {estimate['input_tokens']}, "
+        f"output tokens: {estimate['output_tokens']}, cost: ${estimate['cost']:.2f}",
+        f"wall time: ~{estimate['wall_seconds'] / 60:.1f} min at LLM concurrency "
+        f"{estimate['llm_concurrency'] or 'unlimited'}",
+        f"latencies and output sizes from {estimate['history_runs']} recorded runs"
+        if estimate["history_runs"] else "no recorded runs yet: latencies and output sizes are defaults"
+    ]
+    return "\n".join(lines)
+
+
+def write_estimate(estimate: Dict, run_dir: str) -> str:
+    path = os.path.join(run_dir, "estimate.json")
+    save_json_file(path, estimate)
+    return path
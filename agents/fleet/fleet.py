@@ -0,0 +1,100 @@
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List
+
+from agents.tools.io.json_handlers import load_json_file, save_json_file
+from agents.tools.libraries import describe_libraries, parse_libraries
+from agents.tools.token_usage import TokenUsageTracker, use_tracker
+
+logger = logging.getLogger(__name__)
+
+
+def load_manifest(manifest_path: str) -> List[Dict]:
+    """
+    Reads a fleet manifest. Two shapes are accepted:
+    - a list of jobs: [{"project_path": ..., "library": ..., "from": ..., "to": ..., "message": ...}, ...]
+    - shared defaults plus repos: {"library": ..., "from": ..., "to": ..., "repos": ["path", {...}, ...]}
+    Every job must end up with project_path, library, from and to. To migrate several libraries together,
+    library, from and to are lists of the same length.
+    """
+    manifest = load_json_file(manifest_path)
+
+    if isinstance(manifest, dict):
+        defaults = {key: value for key, value in manifest.items() if key != "repos"}
+        entries = manifest.get("repos", [])
+    else:
+        defaults = {}
+        entries = manifest
+
+    jobs = []
+    for entry in entries:
+        job = dict(defaults)
+        job.update({"project_path": entry} if isinstance(entry, str) else entry)
+
+        missing = [key for key in ("project_path", "library", "from", "to") if not job.get(key)]
+        if missing:
+            raise ValueError(f"Manifest entry {entry} is missing: {', '.join(missing)}")
+        try:
+            parse_libraries(job["library"], job["from"], job["to"])
+        except ValueError as e:
+            raise ValueError(f"Manifest entry {entry}: {e}")
+        jobs.append(job)
+
+    return jobs
+
+
+async def run_fleet(jobs: List[Dict], run_job: Callable[[Dict], Awaitable[Dict]],
+                    report_path: str, max_parallel: int = 0, pilot: int = 0) -> List[Dict]:
+    """
+    Runs the migration of every job concurrently and writes a per-repo status report.
+    Each job gets its own token tracker; LLM and Context7 limits and caches are shared process-wide.
+    With pilot, the first pilot jobs run before the others, which then replay the recipes learned from them.
+    """
+    semaphore = asyncio.Semaphore(max_parallel) if max_parallel else None
+    report: List[Dict] = []
+
+    async def run_one(job: Dict) -> Dict:
+        tracker = TokenUsageTracker()
+        use_tracker(tracker)
+
+        entry = {
+            "project_path": job["project_path"],
+            "library": job["library"],
+            "old_version": job["from"],
+            "new_version": job["to"]
+        }
+
+        if semaphore:
+            await semaphore.acquire()
+        started = time.time()
+        libraries = describe_libraries(parse_libraries(job["library"], job["from"], job["to"]))
+        logger.info(f"Fleet: Starting {job['project_path']} ({libraries})")
+        try:
+            final_state = await run_job(job)
+            entry["final_status"] = final_state.get("final_status", final_state.get("status"))
+            entry["fix_iterations"] = final_state.get("fix_iteration", 0)
+        except Exception as e:
+            logger.error(f"Fleet: {job['project_path']} failed: {e}")
+            entry["final_status"] = "error"
+            entry["error"] = str(e)
+        finally:
+            if semaphore:
+                semaphore.release()
+
+        entry["tokens"] = tracker.total_tokens
+        entry["duration_seconds"] = round(time.time() - started, 1)
+        logger.info(f"Fleet: Finished {job['project_path']} with status {entry['final_status']}")
+
+        report.append(entry)
+        save_json_file(report_path, report)
+        return entry
+
+    results = []
+    if pilot:
+        logger.info(f"Fleet: Migrating {len(jobs[:pilot])} pilot repositories first.")
+        results += await asyncio.gather(*(asyncio.create_task(run_one(job)) for job in jobs[:pilot]))
+        jobs = jobs[pilot:]
+    results += await asyncio.gather(*(asyncio.create_task(run_one(job)) for job in jobs))
+    save_json_file(report_path, results)
+    return results
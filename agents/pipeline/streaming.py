@@ -0,0 +1,286 @@
+import os
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from agents.searcher.searcher import RepoSearcher
+from agents.searcher.usage_store import call_sites_path
+from agents.analyzer.analyzer import (
+    MigrationBatch, build_planner_llm, build_system_message, build_batch_message, order_by_shared_files
+)
+from agents.analyzer.sharding import complete_parent, number_tasks
+from agents.coder.coder import apply_tasks
+from agents.coder.file_tools import current_file_cache
+from agents.prompts.analyzer_prompts import ANALYZER_SYSTEM_TEMPLATE
+from agents.tools.io.json_handlers import JsonlWriter, iter_jsonl, save_json_file
+from agents.tools.api_diff import UNCHANGED_STATUS
+from agents.tools.budget import BUDGET_EXHAUSTED, DEFERRED_STATUS, current_budget
+from agents.tools.token_usage import current_usage
+from agents.tools import llm_gateway
+from agents.tools.model_router import acall_routed
+from agents.tools.telemetry import current_metrics
+from agents.tools.libraries import library_spec, prompt_fields, state_libraries
+from agents.tools.recipes import recipe_task
+
+logger = logging.getLogger(__name__)
+
+STREAM_BATCH_SIZE = 3
+PATTERN_QUEUE_SIZE = 20
+TASK_QUEUE_SIZE = 10
+
+_DONE = object()
+_SETTLED = object()
+
+
+async def _search_stage(state, pattern_queue: asyncio.Queue) -> int:
+    searcher = RepoSearcher(state.get("project_path", "."))
+    usage_path = state.get("usage_path", "usage.jsonl")
+    written = set()
+    extended = {}
+    # Each pattern is written as soon as it is found, so the coder stage can read it back when deferring.
+    with JsonlWriter(usage_path) as writer:
+        async for pattern in searcher.iter_patterns(state_libraries(state), call_sites_path(usage_path),
+                                                    incremental=True):
+            # A pattern_id seen before is the same pattern with the call sites found later in the scan.
+            if pattern["pattern_id"] in written:
+                extended[pattern["pattern_id"]] = pattern
+            else:
+                written.add(pattern["pattern_id"])
+                writer.write(pattern)
+            if pattern["status"] not in (UNCHANGED_STATUS, DEFERRED_STATUS):
+                await pattern_queue.put(pattern)
+
+    if extended:
+        _rewrite_patterns(usage_path, extended)
+    await pattern_queue.put(_DONE)
+    return writer.count
+
+
+def _rewrite_patterns(usage_path: str, extended: Dict[int, Dict]):
+    """
+    Replaces the extended patterns in usage.jsonl, streaming it through a temporary file.
+    """
+    with JsonlWriter(usage_path + ".tmp") as writer:
+        for pattern in iter_jsonl(usage_path):
+            writer.write(extended.get(pattern.get("pattern_id"), pattern))
+    os.replace(usage_path + ".tmp", usage_path)
+
+
+async def _plan_stage(state, pattern_queue: asyncio.Queue, task_queue: asyncio.Queue, plan: List[Dict]):
+    user_message = state.get("message")
+    additional_instructions = user_message if user_message else "No additional instructions provided."
+    plan_path = state.get("plan_path", "migration_plan.json")
+    project_path = state.get("project_path", ".")
+
+    libraries = state_libraries(state)
+    system_messages = {}
+
+    budget = current_budget()
+
+    async def plan_batch(batch: List[Dict], batch_num: int):
+        if budget is not None and budget.exhausted():
+            budget.defer(patterns=batch, stage="planning")
+            return
+        library = batch[0].get("library")
+        if library not in system_messages:
+            system_messages[library] = build_system_message(
+                ANALYZER_SYSTEM_TEMPLATE, **prompt_fields(libraries, library),
+                additional_instructions=additional_instructions
+            )
+        system_message = system_messages[library]
+        try:
+            human_message = build_batch_message(batch, "planning")
+            async with current_metrics().aspan(f"planning_batch_{batch_num}", "analyzer_batch"):
+                result: MigrationBatch = await acall_routed(
+                    "planning", {"chars": len(human_message.content)}, lambda model: llm_gateway.ainvoke(
+                        build_planner_llm(model), [system_message, human_message], model=model
+                    )
+                )
+        except Exception as e:
+            logger.error(f"Stream: Error processing batch {batch_num}: {e}", exc_info=True)
+            return
+
+        await enqueue(order_by_shared_files([{**task.model_dump(), "library": library} if library
+                                             else task.model_dump() for task in result.tasks]))
+        logger.info(f"Stream: Batch {batch_num} planned {len(result.tasks)} tasks.")
+
+    async def extend(pattern: Dict, update: Dict):
+        """
+        Late call sites of a pattern already received: its new files join the task that covers it while the
+        coder has not picked that task up, otherwise one follow-up task with the same instructions.
+        The pattern is never planned twice.
+        """
+        new_files = [file for file in update["affected_files"] if file not in pattern["affected_files"]]
+        # The same dict sits in the unplanned batch or among the patterns deferred by the budget.
+        pattern.update(occurrence_count=update["occurrence_count"], affected_files=update["affected_files"])
+        covering = [task for task in plan if pattern["pattern_id"] in task.get("pattern_ids", [])]
+        if not new_files or not covering:
+            return
+
+        late = {**pattern, "affected_files": new_files}
+        spec = library_spec(libraries, pattern.get("library")) or libraries[0]
+        recipe = recipe_task(late, spec, project_path, current_file_cache().read)
+        for task in covering:
+            # Shards are split by file, and a recipe task takes only files its recipe covers.
+            if task.get("status") == "pending" and task.get("parent_task_id") is None \
+                    and (not task.get("recipe") or recipe is not None):
+                task["files"].extend(file for file in new_files if file not in task["files"])
+                save_json_file(plan_path, plan)
+                current_metrics().count("stream.files_attached", len(new_files))
+                logger.info(f"Stream: Added {len(new_files)} files to task {task['task_id']} ({task['title']}).")
+                return
+
+        first = next((task for task in covering if task.get("parent_task_id") is None), covering[0])
+        current_metrics().count("stream.follow_up_tasks")
+        await enqueue([recipe or {
+            "title": first["title"],
+            "description": first["description"],
+            "files": new_files,
+            "pattern_ids": [pattern["pattern_id"]],
+            "status": "pending",
+            "library": first.get("library") or pattern.get("library")
+        }])
+
+    async def enqueue(new_tasks: List[Dict]):
+        tasks = number_tasks(new_tasks, project_path, len(plan))
+        plan.extend(tasks)
+        save_json_file(plan_path, plan)
+        for task_dict in tasks:
+            if task_dict.get("status") != "pending":
+                continue
+            if task_dict.get("parent_task_id") is None:
+                await task_queue.put([task_dict])
+            elif task_dict["shard"].startswith("1/"):
+                # The shards of one task go to the coder together and run in parallel.
+                await task_queue.put([shard for shard in tasks
+                                      if shard.get("parent_task_id") == task_dict["parent_task_id"]])
+
+    batch = []
+    batch_num = 0
+    received: Dict[int, Dict] = {}
+    try:
+        while True:
+            pattern = await pattern_queue.get()
+            if pattern is _DONE:
+                # Every pattern and its late call sites are in: the coder can start.
+                await task_queue.put(_SETTLED)
+                break
+            if pattern["pattern_id"] in received:
+                await extend(received[pattern["pattern_id"]], pattern)
+                continue
+            received[pattern["pattern_id"]] = pattern
+            # Patterns a learned recipe covers skip planning and go straight to the coder.
+            spec = library_spec(libraries, pattern.get("library")) or libraries[0]
+            task = recipe_task(pattern, spec, project_path, current_file_cache().read)
+            if task is not None:
+                await enqueue([task])
+                continue
+            # A batch is planned for one library, so it ends where the search moves on to the next one.
+            if batch and batch[0].get("library") != pattern.get("library"):
+                batch_num += 1
+                await plan_batch(batch, batch_num)
+                batch = []
+            batch.append(pattern)
+            if len(batch) >= STREAM_BATCH_SIZE:
+                batch_num += 1
+                await plan_batch(batch, batch_num)
+                batch = []
+
+        if batch:
+            batch_num += 1
+            await plan_batch(batch, batch_num)
+    finally:
+        save_json_file(plan_path, plan)
+
+    await task_queue.put(_DONE)
+
+
+async def _code_stage(state, task_queue: asyncio.Queue, plan: List[Dict]):
+    plan_path = state.get("plan_path", "migration_plan.json")
+    budget = current_budget()
+
+    async def code(tasks: List[Dict]):
+        if budget is not None and budget.exhausted():
+            # Keep draining the queue so the planner can finish; the tasks stay pending.
+            budget.defer_tasks(tasks, iter_jsonl(state.get("usage_path", "usage.jsonl")), "coding")
+            return
+
+        for task in tasks:
+            logger.info(f"Stream: Coder picked up task {task['task_id']}: {task['title']}")
+            task["status"] = "in_progress"
+        save_json_file(plan_path, plan)
+
+        results = await asyncio.to_thread(apply_tasks, tasks, state)
+
+        for task, result in zip(tasks, results):
+            if isinstance(result, Exception):
+                logger.error(f"Stream: Coder failed on task {task['task_id']}: {result}")
+                task["status"] = "pending"
+                continue
+            task["status"] = "done"
+            if result:
+                task["commit"] = result
+            complete_parent(plan, task)
+        save_json_file(plan_path, plan)
+
+    # Until the search has settled, late call sites can still add files to a task, so tasks are held
+    # (pending, not in progress) rather than coded twice.
+    held: Optional[List[List[Dict]]] = []
+    while True:
+        tasks = await task_queue.get()
+        if tasks is _DONE:
+            return
+        if tasks is _SETTLED:
+            for held_tasks in held:
+                await code(held_tasks)
+            held = None
+        elif held is not None:
+            held.append(tasks)
+        else:
+            await code(tasks)
+
+
+async def streaming_node(state):
+    """
+    Runs searcher, analyzer and coder as concurrent stages connected by bounded queues.
+    Patterns reach the analyzer as soon as their advice is ready, while the repository is still scanned.
+    The coder starts once the search has settled, so call sites found late join their symbol's task instead
+    of costing a second plan and commit. The only other barrier is before the tester.
+    """
+    logger.info("Stream: Starting pipelined search, planning and coding...")
+
+    if not all(spec["library"] and spec["old_version"] and spec["new_version"] for spec in state_libraries(state)):
+        logger.error("Stream: Missing required parameters in state.")
+        return {"status": "error", "has_pending_tasks": False}
+
+    pattern_queue: asyncio.Queue = asyncio.Queue(maxsize=PATTERN_QUEUE_SIZE)
+    task_queue: asyncio.Queue = asyncio.Queue(maxsize=TASK_QUEUE_SIZE)
+    plan: List[Dict] = []
+
+    async with asyncio.TaskGroup() as group:
+        search = group.create_task(_search_stage(state, pattern_queue))
+        group.create_task(_plan_stage(state, pattern_queue, task_queue, plan))
+        group.create_task(_code_stage(state, task_queue, plan))
+
+    has_pending_tasks = any(task.get("status") == "pending" for task in plan)
+    logger.info(f"Stream: {search.result()} patterns, {len(plan)} tasks, pending left: {has_pending_tasks}.")
+
+    budget = current_budget()
+    if budget is not None and (has_pending_tasks or budget.deferred_patterns) and budget.exhausted():
+        logger.warning(f"Stream: Budget exhausted ({budget.describe()}). Checking the committed work and stopping.")
+        return {
+            "status": BUDGET_EXHAUSTED,
+            "final_status": f"{BUDGET_EXHAUSTED}_{budget.kind}",
+            "usage_path": state.get("usage_path", "usage.jsonl"),
+            "plan_path": state.get("plan_path", "migration_plan.json"),
+            "has_pending_tasks": False,
+            "tokens_used": current_usage().total_tokens
+        }
+
+    return {
+        "status": "coding" if has_pending_tasks else "all_done",
+        "usage_path": state.get("usage_path", "usage.jsonl"),
+        "plan_path": state.get("plan_path", "migration_plan.json"),
+        "has_pending_tasks": has_pending_tasks,
+        "tokens_used": current_usage().total_tokens
+    }
@@ -23,7 +23,8 @@ INSTRUCTIONS:
    - The `description` MUST be detailed. It should explicitly state what to replace with what.
    - Use the code from `migration_example["after"]` in your description to give the Coder a clear template.
    - If the guide says "rename X to Y", the description should be "Find X and rename to Y".
-3. Map the `affected_files` list from the input to the `files` list in your output task.
+3. Map the `affected_files` list from the input to the `files` list in your output task,
+   and the `pattern_id` of every pattern the task covers to its `pattern_ids` list.
 4. Set `status` to "pending".
 
 === EXAMPLES OF GOOD MIGRATION TASKS ===
@@ -25,6 +25,17 @@ IMPORTANT: If the text describes a generic function (not library-specific), main
 Text: {raw_text}
 """
 
+REFINE_MIGRATION_BATCH_PROMPT = """
+You convert library documentation into migration advice.
+The input contains several sections, each starting with a header "=== ELEMENT: <name> ===" followed by
+the documentation for that element.
+Return exactly one advice per element, with the element name copied from its header:
+- status: Active, Deprecated, Removed or Changed
+- instruction: how to migrate usages of the element
+- example: "before" and "after" code
+IMPORTANT: If the text describes a generic function (not library-specific), maintain its Active status.
+"""
+
 SEARCH_USAGES_SYSTEM_PROMPT = """You are an expert static code analysis tool.
 Your task is to analyze the provided source code and find ALL usages of the library '{library_name}'.
 
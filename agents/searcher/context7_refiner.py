@@ -1,34 +1,141 @@
-import os
 import json
+import hashlib
 import logging
-from typing import Dict, Any
-from langchain_anthropic import ChatAnthropic
+from typing import Dict, Any, List, Tuple
+from pydantic import BaseModel, Field
+from langchain_core.messages import HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import CommaSeparatedListOutputParser, JsonOutputParser
-from ..prompts.searcher_prompts import REFINE_MIGRATION_JSON_PROMPT
+from ..prompts.searcher_prompts import REFINE_MIGRATION_JSON_PROMPT, REFINE_MIGRATION_BATCH_PROMPT
+from ..tools import llm_gateway
+from ..tools.doc_ranker import rank_sections
+from ..tools.model_router import acall_routed
+from ..tools.shared_cache import AsyncMemo
+from ..tools.telemetry import current_metrics, traced
 
 logger = logging.getLogger(__name__)
 
+REFINED_ADVICE_CACHE = AsyncMemo("refined_advice")
+
+
+class MigrationExample(BaseModel):
+    before: str = Field(description="Code using the old API")
+    after: str = Field(description="The same code for the new version")
+
+
+class RefinedAdvice(BaseModel):
+    element: str = Field(description="The element name exactly as given in its ELEMENT header")
+    status: str = Field(description="Active, Deprecated, Removed or Changed")
+    instruction: str = Field(description="How to migrate usages of the element")
+    example: MigrationExample
+
+
+class RefinedAdviceBatch(BaseModel):
+    advices: List[RefinedAdvice]
+
 
 class Context7Refiner:
     def __init__(self):
-        self.llm = ChatAnthropic(
-            model="claude-sonnet-4-5-20250929",
-            anthropic_api_key=os.environ.get("ANTHROPIC_API_KEY"),
-            temperature=0
-        )
         self.list_parser = CommaSeparatedListOutputParser()
         self.json_parser = JsonOutputParser()
 
     async def refine_migration_advice(self, raw_text: str, element: str) -> Dict[str, Any]:
+        return await self._refine_shrunk(self._shrink(raw_text, element), element)
+
+    async def _refine_shrunk(self, shrunk_text: str, element: str) -> Dict[str, Any]:
+        return await REFINED_ADVICE_CACHE.get_or_create(
+            self._cache_key(shrunk_text, element),
+            lambda: self._refine(shrunk_text, element),
+            should_cache=lambda advice: advice.get("status") != "Unknown"
+        )
+
+    async def refine_many(self, items: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Refines several (element, raw_text) pairs with one structured call.
+        Cached elements are skipped; elements the batch answer misses are refined one by one,
+        from the documentation already shrunk for the batch, so each element is ranked and counted once.
+        """
+        shrunk = [(element, self._shrink(raw_text, element)) for element, raw_text in items]
+
+        results = {}
+        pending = []
+        for element, raw_text in shrunk:
+            cached = REFINED_ADVICE_CACHE.get(self._cache_key(raw_text, element))
+            if cached is not None:
+                results[element] = cached
+            else:
+                pending.append((element, raw_text))
+
+        if len(pending) > 1:
+            texts = dict(pending)
+            for element, advice in (await self._refine_batch(pending)).items():
+                results[element] = advice
+                if advice.get("status") != "Unknown":
+                    REFINED_ADVICE_CACHE.put(self._cache_key(texts[element], element), advice)
+
+        for element, shrunk_text in pending:
+            if element not in results:
+                results[element] = await self._refine_shrunk(shrunk_text, element)
+
+        return results
+
+    @staticmethod
+    def _cache_key(raw_text: str, element: str) -> Tuple[str, str]:
+        return element, hashlib.sha256(str(raw_text).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _shrink(raw_text: str, element: str) -> str:
+        """
+        Keeps only the documentation sections relevant to element, ranked locally (BM25).
+        """
+        shrunk = rank_sections(raw_text, element)
+        if isinstance(raw_text, str):
+            metrics = current_metrics()
+            metrics.count("refine.doc_chars_in", len(raw_text))
+            metrics.count("refine.doc_chars_kept", len(shrunk))
+        return shrunk
+
+    @traced("refiner")
+    async def _refine_batch(self, items: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+        logger.info(f"Generating JSON advice for {len(items)} elements in one call...")
+
+        sections = "\n\n".join(f"=== ELEMENT: {element} ===\n{raw_text}" for element, raw_text in items)
+        messages = [
+            llm_gateway.cached_system_message(REFINE_MIGRATION_BATCH_PROMPT),
+            HumanMessage(content=sections)
+        ]
+        signals = {"chars": len(sections), "files": len(items)}
+
+        try:
+            batch: RefinedAdviceBatch = await acall_routed("refine", signals, lambda model: llm_gateway.ainvoke(
+                llm_gateway.chat_model(model).with_structured_output(RefinedAdviceBatch), messages, model=model
+            ))
+        except Exception as e:
+            logger.error(f"FAIL batch JSON for {len(items)} elements: {e}. Falling back to one call per element.")
+            return {}
+
+        requested = {element for element, _ in items}
+        return {
+            advice.element: {
+                "status": advice.status,
+                "instruction": advice.instruction,
+                "example": {"before": advice.example.before, "after": advice.example.after}
+            }
+            for advice in batch.advices if advice.element in requested
+        }
+
+    @traced("refiner")
+    async def _refine(self, raw_text: str, element: str) -> Dict[str, Any]:
         logger.info(f"Generating JSON advice for {element}...")
 
         prompt = ChatPromptTemplate.from_template(REFINE_MIGRATION_JSON_PROMPT)
 
-        chain = prompt | self.llm
+        content = ""
 
-        try:
-            response = await chain.ainvoke({"element": element, "raw_text": raw_text})
+        async def refine_with(model: str) -> Dict[str, Any]:
+            nonlocal content
+            response = await llm_gateway.ainvoke(prompt | llm_gateway.chat_model(model),
+                                                 {"element": element, "raw_text": raw_text}, model=model)
             content = response.content if hasattr(response, 'content') else str(response)
 
             result = self._robust_json_extractor(content)
@@ -38,9 +145,14 @@ class Context7Refiner:
                     result = result[0]
                 else:
                     raise ValueError("Parsed output is not a dict")
+            if not result:
+                raise ValueError("Parsed output is empty")
 
             return result
 
+        try:
+            return await acall_routed("refine", {"chars": len(str(raw_text))}, refine_with)
+
         except Exception as e:
             logger.error(f"FAIL JSON for {element}: {e}. Content snippet: {str(content)[:100]}...")
             return {
@@ -1,22 +1,39 @@
-import os
+import sys
+import asyncio
+import hashlib
 import logging
-from typing import List, Optional, Dict
+from typing import AsyncIterator, Callable, List, Optional, Dict, Set
 from pydantic import BaseModel, Field
 
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import HumanMessage
 from langchain_core.output_parsers import PydanticOutputParser
 
 from ..tools.serena_tool import SerenaTool
 from ..tools.context7_tool import Context7Tool
-from ..tools.io.json_handlers import save_json_file
+from ..tools.io.json_handlers import JsonlWriter
+from ..tools import llm_gateway
+from ..tools.model_router import acall_routed
+from ..tools.shared_cache import AsyncMemo
+from ..tools.advice_pack import lookup_advice
+from ..tools.api_diff import UNCHANGED_STATUS, get_api_diff
+from ..tools.budget import DEFERRED_STATUS, current_budget, priority
+from ..tools.telemetry import current_metrics
+from ..tools.libraries import describe_libraries, state_libraries
 from .context7_refiner import Context7Refiner
+from .symbol_resolver import find_lines, is_foreign, qualify_usage, resolve_symbols
+from .usage_store import UsageGroup, UsageStore, call_sites_path
 
 from agents.prompts.searcher_prompts import SEARCH_USAGES_SYSTEM_PROMPT
 from ..prompts.searcher_prompts import DISCOVERY_SYSTEM_PROMPT
 
 logger = logging.getLogger(__name__)
 
+IMPORT_NAMES_CACHE = AsyncMemo("import_names")
+# Bounded, so the cached call sites of a very large repository do not pile up in memory.
+EXTRACTION_CACHE = AsyncMemo("usage_extraction", max_entries=2000)
+
+REFINE_BATCH_SIZE = 5
+
 class DiscoveryResult(BaseModel):
     import_names: List[str] = Field(description="List of package names used in import statements")
 
@@ -38,23 +55,27 @@ class RepoSearcher:
         self.context_ai = Context7Tool()
         self.context_refiner = Context7Refiner()
 
-        self.llm = ChatAnthropic(
-            model_name="claude-opus-4-6",
-            temperature=0,
-            api_key=os.getenv("ANTHROPIC_API_KEY")
-        )
         self.parser = PydanticOutputParser(pydantic_object=FileAnalysisResult)
 
     async def _discover_import_names(self, library: str) -> List[str]:
+        return await IMPORT_NAMES_CACHE.get_or_create(
+            library,
+            lambda: self._ask_import_names(library),
+            should_cache=lambda names: names != [library]
+        )
+
+    async def _ask_import_names(self, library: str) -> List[str]:
         logger.info(f"Discovery: Asking LLM for import names of '{library}'...")
 
-        structured_llm = self.llm.with_structured_output(DiscoveryResult)
+        messages = [
+            llm_gateway.cached_system_message(DISCOVERY_SYSTEM_PROMPT),
+            HumanMessage(content=f"Identify code-level import names for the library: {library}")
+        ]
 
         try:
-            result: DiscoveryResult = await structured_llm.ainvoke([
-                SystemMessage(content=DISCOVERY_SYSTEM_PROMPT),
-                HumanMessage(content=f"Identify code-level import names for the library: {library}")
-            ])
+            result: DiscoveryResult = await acall_routed("discovery", {}, lambda model: llm_gateway.ainvoke(
+                llm_gateway.chat_model(model).with_structured_output(DiscoveryResult), messages, model=model
+            ))
 
             names = result.import_names
             if library not in names:
@@ -65,85 +86,337 @@ class RepoSearcher:
             logger.warning(f"Discovery failed: {e}")
             return [library]
 
-    async def execute_full_search(self, library: str, old_version: str, new_version: str):
-        logger.info(f"Universal search: {library} ({old_version} -> {new_version})")
-
-        import_names = await self._discover_import_names(library)
+    async def collect_usage_groups(self, libraries: List[str], spool_path: Optional[str] = None,
+                                   on_file: Optional[Callable[[str, Dict[str, List[Dict]]], None]] = None
+                                   ) -> Dict[str, UsageStore]:
+        """
+        Scans the repository once for all libraries: one Serena session, one candidate scan per library
+        (the union of their candidate files is kept), and every candidate file is read once. The usages of each library the file imports are added to that library's
+        UsageStore file by file, so only one file's call sites are in memory at a time.
+        With spool_path, every call site is also written there, tagged with its library.
+        on_file(file_path, {library: qualified usages}) is called as each file is done.
+        """
+        import_names = dict(zip(libraries, await asyncio.gather(*(
+            self._discover_import_names(library) for library in libraries
+        ))))
 
         await self.serena.start()
-
-        candidate_files = await self.serena.find_candidate_files(import_names)
-        logger.info(f"Serena found {len(candidate_files)} candidate files containing '{import_names}'.")
-
-        raw_usages = []
-
-        for file_path in candidate_files:
-            content = await self.serena.read_file(file_path)
-            if not content:
+        spool = None
+        try:
+            files_by_library = {}
+            for library in libraries:
+                candidate_files = await self.serena.find_candidate_files(import_names[library])
+                logger.info(f"Serena found {len(candidate_files)} candidate files containing "
+                            f"'{import_names[library]}'.")
+                files_by_library[library] = set(candidate_files)
+            candidate_files = list(dict.fromkeys(path for library in libraries for path in files_by_library[library]))
+
+            spool = JsonlWriter(spool_path).open() if spool_path else None
+            stores = {library: UsageStore(spool, library) for library in libraries}
+            for file_path in candidate_files:
+                content = await self.serena.read_file(file_path)
+                if not content:
+                    continue
+
+                file_libraries = [library for library in libraries if file_path in files_by_library[library]]
+                logger.info(f"Analyzing usages of {', '.join(file_libraries)} in {file_path} via LLM...")
+                extracted = await asyncio.gather(*(
+                    self._extract_usages_with_llm(content, library, file_path) for library in file_libraries
+                ))
+
+                qualified = {}
+                for library, file_usages in zip(file_libraries, extracted):
+                    logger.info(f"LLM found {file_usages} usages of {library} in {file_path}.")
+                    qualified[library] = self._qualify_usages(file_usages, content, import_names[library])
+                    stores[library].add_file(file_path, qualified[library])
+                if on_file is not None:
+                    on_file(file_path, qualified)
+        finally:
+            self.serena.release()
+            if spool is not None:
+                spool.close()
+
+        if len(libraries) > 1:
+            current_metrics().count("searcher.shared_scan_files", len(candidate_files))
+        return stores
+
+    @staticmethod
+    def _qualify_usages(usages: List[Dict], content: str, import_names: List[str]) -> List[Dict]:
+        """
+        Attaches the qualified symbol (pandas.DataFrame.append) to each usage, resolved statically from
+        imports, aliases and variable types. Usages that turn out to be methods of builtin values
+        (list.append) are dropped.
+        """
+        symbols = resolve_symbols(content, import_names)
+        qualified = []
+        for usage in usages:
+            # The same snippet can occur on several lines, e.g. out.append(row) in two functions where only
+            # one out is a DataFrame; take the first occurrence that resolves to the library.
+            found = [(line, qualify_usage(symbols, usage.get("method_name", ""), line))
+                     for line in find_lines(content, usage.get("pattern", "")) or [None]]
+            line, symbol = next(((line, symbol) for line, symbol in found if symbol and not is_foreign(symbol)),
+                                found[0])
+            if is_foreign(symbol):
+                logger.info(f"Dropping {usage.get('method_name')} in {usage.get('file')}: resolved to {symbol}.")
+                current_metrics().count("symbols.dropped_builtin")
                 continue
+            qualified.append({**usage, "symbol": symbol, "line": line})
+        return qualified
+
+    async def build_pattern(self, pattern_id: int, method: str, group: UsageGroup,
+                            library: str, old_version: str, new_version: str) -> Dict:
+        full_query = self._query(library, method, group)
+        advice = lookup_advice(library, old_version, new_version, full_query)
+        if advice is not None:
+            return self._make_pattern(pattern_id, library, method, group, advice)
+
+        raw_advice = await self.context_ai.get_migration_advice(library, full_query, old_version, new_version)
+        advice = await self.context_refiner.refine_migration_advice(raw_advice, full_query)
+
+        return self._make_pattern(pattern_id, library, method, group, advice)
+
+    @staticmethod
+    def _query(library: str, method: str, group: UsageGroup) -> str:
+        return group.symbol or f"{library}.{method}"
+
+    @staticmethod
+    def _make_pattern(pattern_id: int, library: str, method: str, group: UsageGroup, advice: Optional[Dict]) -> Dict:
+        if not advice:
+            advice = {}
+
+        return {
+            "pattern_id": pattern_id,
+            "library": library,
+            "title": method,
+            "symbol": group.symbol,
+            "status": advice.get("status", "Unknown"),
+            "migration_guide": advice.get("instruction", "Manual check required."),
+            "occurrence_count": group.count,
+            "affected_files": group.affected_files(),
+            "code_example": group.example,
+            "migration_example": advice.get("example", {})
+        }
+
+    async def iter_patterns(self, libraries: List[Dict], spool_path: Optional[str] = None,
+                            incremental: bool = False) -> AsyncIterator[Dict]:
+        """
+        Yields the usage patterns of every library ({"library", "old_version", "new_version"}), library by
+        library in the order given, with pattern ids that are unique across libraries. The repository is
+        scanned once for all of them.
+        Call sites are streamed to spool_path (JSON Lines) if given; only per-symbol aggregates stay in memory.
+        With incremental, patterns are yielded while the scan runs (see _patterns_by_file).
+        """
+        logger.info(f"Universal search: {describe_libraries(libraries)}")
+        if incremental:
+            async for pattern in self._patterns_by_file(libraries, spool_path):
+                yield pattern
+            return
+
+        stores = await self.collect_usage_groups([spec["library"] for spec in libraries], spool_path)
+        next_id = 1
+        for spec in libraries:
+            async for pattern in self._library_patterns(stores[spec["library"]], spec["library"],
+                                                        spec["old_version"], spec["new_version"], next_id):
+                next_id = max(next_id, pattern["pattern_id"] + 1)
+                yield pattern
+
+    async def _patterns_by_file(self, libraries: List[Dict], spool_path: Optional[str]) -> AsyncIterator[Dict]:
+        """
+        Yields patterns while the repository is scanned instead of after it. The symbols first seen in a file
+        are yielded once that file is grouped; only while the scan is ahead of the consumer are they held back
+        until REFINE_BATCH_SIZE of them can share one refine call. A symbol is never yielded as a second pattern:
+        its call sites in later files are collected, and when the scan ends its pattern is yielded once more
+        with the same pattern_id and every file and call site, for the consumer to extend what it already has.
+        """
+        files: asyncio.Queue = asyncio.Queue()
+        scan = asyncio.create_task(self.collect_usage_groups(
+            [spec["library"] for spec in libraries], spool_path,
+            on_file=lambda file_path, usages: files.put_nowait((file_path, usages))
+        ))
+        scan.add_done_callback(lambda _: files.put_nowait(None))
+
+        canonical = {}
+        for spec in libraries:
+            import_names = await self._discover_import_names(spec["library"])
+            api_diff = await get_api_diff(spec["library"], spec["old_version"], spec["new_version"], import_names)
+            canonical[spec["library"]] = api_diff.canonical if api_diff is not None else None
+
+        names = [spec["library"] for spec in libraries]
+        sent: Dict[str, Dict[str, Dict]] = {library: {} for library in names}
+        pending_keys: Dict[str, Set[str]] = {library: set() for library in names}
+        pending = {library: UsageStore(library=library) for library in names}
+        later = {library: UsageStore(library=library) for library in names}
+        next_id = 1
+        try:
+            while (item := await files.get()) is not None:
+                file_path, usages_by_library = item
+                for library, usages in usages_by_library.items():
+                    keys = [self._group_key(usage, canonical[library]) for usage in usages]
+                    fresh = [usage for usage, key in zip(usages, keys) if key not in sent[library]]
+                    known = [usage for usage, key in zip(usages, keys) if key in sent[library]]
+                    if fresh:
+                        pending[library].add_file(file_path, fresh)
+                        pending_keys[library].update(key for key in keys if key not in sent[library])
+                    if known:
+                        later[library].add_file(file_path, known)
+
+                for spec in libraries:
+                    library = spec["library"]
+                    if not pending_keys[library] or (not files.empty()
+                                                     and len(pending_keys[library]) < REFINE_BATCH_SIZE):
+                        continue
+                    async for pattern in self._library_patterns(pending[library], library, spec["old_version"],
+                                                                spec["new_version"], next_id):
+                        next_id = max(next_id, pattern["pattern_id"] + 1)
+                        sent[library][pattern["title"]] = dict(pattern)
+                        yield pattern
+                    pending_keys[library] = set()
+                    pending[library] = UsageStore(library=library)
+            await scan
+        finally:
+            scan.cancel()
+
+        for spec in libraries:
+            library = spec["library"]
+            if pending[library].usages:
+                async for pattern in self._library_patterns(pending[library], library, spec["old_version"],
+                                                            spec["new_version"], next_id):
+                    next_id = max(next_id, pattern["pattern_id"] + 1)
+                    yield pattern
+            for key, group in later[library].groups(canonical[library]).items():
+                pattern = sent[library][key]
+                current_metrics().count("stream.extended_patterns")
+                yield {**pattern, "occurrence_count": pattern["occurrence_count"] + group.count,
+                       "affected_files": list(dict.fromkeys(pattern["affected_files"] + group.affected_files()))}
+
+    @staticmethod
+    def _group_key(usage: Dict, canonical: Optional[Callable[[str], str]]) -> str:
+        """
+        The key UsageStore.groups() files a usage under.
+        """
+        symbol = usage.get("symbol")
+        if not symbol:
+            return usage.get("method_name", "")
+        return canonical(symbol) if canonical is not None else symbol
+
+    async def _library_patterns(self, store: UsageStore, library: str, old_version: str, new_version: str,
+                                first_id: int) -> AsyncIterator[Dict]:
+        """
+        Yields the patterns of one library. Methods the local API diff shows as unchanged, or that a loaded
+        advice pack answers, are yielded right away, without Context7. The rest are handled in chunks of
+        REFINE_BATCH_SIZE: their Context7 advice is fetched concurrently and refined with one LLM call.
+        With a budget, methods with the most call sites and files go first, and once the budget is
+        exhausted the remaining ones are yielded as deferred, without advice.
+        """
+        import_names = await self._discover_import_names(library)
+        api_diff = await get_api_diff(library, old_version, new_version, import_names)
+        grouped_methods = store.groups(api_diff.canonical if api_diff is not None else None)
+
+        budget = current_budget()
+        if budget is not None:
+            grouped_methods = dict(sorted(
+                grouped_methods.items(), reverse=True,
+                key=lambda entry: priority({"occurrence_count": entry[1].count, "affected_files": entry[1].files})
+            ))
+
+        pending = []
+        api_changes = {}
+        for pattern_id, method in enumerate(grouped_methods, first_id):
+            changes = api_diff.changes_for(method) if api_diff is not None else None
+            if changes == []:
+                current_metrics().count("api_diff.unchanged_groups")
+                yield self._unchanged_pattern(pattern_id, method, grouped_methods[method], library,
+                                              old_version, new_version)
+                continue
+            if changes:
+                api_changes[method] = changes
+            query = self._query(library, method, grouped_methods[method])
+            advice = lookup_advice(library, old_version, new_version, query)
+            if advice is not None:
+                current_metrics().count("advice_pack.hits")
+                pattern = self._make_pattern(pattern_id, library, method, grouped_methods[method], advice)
+                if changes:
+                    pattern["api_changes"] = changes
+                yield pattern
+                continue
+            pending.append((pattern_id, method))
+
+        for start in range(0, len(pending), REFINE_BATCH_SIZE):
+            chunk = pending[start:start + REFINE_BATCH_SIZE]
+            if budget is not None and budget.exhausted():
+                deferred = [self._deferred_pattern(pattern_id, library, method, grouped_methods[method])
+                            for pattern_id, method in pending[start:]]
+                budget.defer(patterns=deferred, stage="search")
+                for pattern in deferred:
+                    yield pattern
+                return
+            queries = [self._query(library, method, grouped_methods[method]) for _, method in chunk]
+            logger.info(f"[{start + 1}-{start + len(chunk)}/{len(pending)}] Migration analysis for "
+                        f"{', '.join(queries)}...")
+
+            raw_advices = await asyncio.gather(*(
+                self.context_ai.get_migration_advice(library, query, old_version, new_version) for query in queries
+            ))
+            advices = await self.context_refiner.refine_many(list(zip(queries, raw_advices)))
+
+            for (pattern_id, method), query in zip(chunk, queries):
+                pattern = self._make_pattern(pattern_id, library, method, grouped_methods[method], advices.get(query))
+                if method in api_changes:
+                    pattern["api_changes"] = api_changes[method]
+                yield pattern
+
+    def _unchanged_pattern(self, pattern_id: int, method: str, group: UsageGroup,
+                           library: str, old_version: str, new_version: str) -> Dict:
+        return self._make_pattern(pattern_id, library, method, group, {
+            "status": UNCHANGED_STATUS,
+            "instruction": f"No public API change for {self._query(library, method, group)} "
+                           f"between {old_version} and {new_version}.",
+            "example": {}
+        })
+
+    def _deferred_pattern(self, pattern_id: int, library: str, method: str, group: UsageGroup) -> Dict:
+        return self._make_pattern(pattern_id, library, method, group, {
+            "status": DEFERRED_STATUS,
+            "instruction": "Not analyzed: the run budget was exhausted.",
+            "example": {}
+        })
 
-            logger.info(f"Analyzing usages in {file_path} via LLM...")
-            file_usages = await self._extract_usages_with_llm(content, library, file_path)
-
-            logger.info(f"LLM found {file_usages} usages in {file_path}.")
-            raw_usages.extend(file_usages)
-
-        grouped_methods = {}
-        for item in raw_usages:
-            name = item.get('method_name', '')
-
-            if name not in grouped_methods:
-                grouped_methods[name] = []
-            grouped_methods[name].append(item)
-
-        report = []
-        method_names = list(grouped_methods.keys())
-
-        for i, method in enumerate(method_names):
-            items = grouped_methods[method]
-            full_query = f"{library}.{method}"
-
-            logger.info(f"[{i + 1}/{len(method_names)}] Migration analysis for {full_query}...")
-
-            raw_advice = await self.context_ai.get_migration_advice(library, full_query, old_version, new_version)
-            advice = await self.context_refiner.refine_migration_advice(raw_advice, full_query)
-
-            if not advice:
-                advice = {}
-
-            report.append({
-                "pattern_id": i + 1,
-                "title": method,
-                "status": advice.get("status", "Unknown"),
-                "migration_guide": advice.get("instruction", "Manual check required."),
-                "occurrence_count": len(items),
-                "affected_files": sorted(list(set(x['file'] for x in items))),
-                "code_example": items[0]['pattern'] if items else "",
-                "migration_example": advice.get("example", {})
-            })
-
-        return report
+    async def execute_full_search(self, library: str, old_version: str, new_version: str):
+        libraries = [{"library": library, "old_version": old_version, "new_version": new_version}]
+        return [pattern async for pattern in self.iter_patterns(libraries)]
 
     async def _extract_usages_with_llm(self, file_content: str, library_name: str, file_path: str) -> List[Dict]:
+        """
+        Extraction results are keyed by file content, so identical files in different repositories
+        (vendored helpers, shared templates) are analyzed once per process.
+        """
+        key = (library_name, hashlib.sha256(file_content.encode("utf-8")).hexdigest())
+        usages = await EXTRACTION_CACHE.get_or_create(
+            key, lambda: self._extract_usages_uncached(file_content, library_name, file_path)
+        )
+        return [{**usage, "file": file_path} for usage in usages]
 
+    async def _extract_usages_uncached(self, file_content: str, library_name: str, file_path: str) -> List[Dict]:
         system_content = SEARCH_USAGES_SYSTEM_PROMPT.format(library_name=library_name)
 
         user_prompt = f"File: {file_path}\n\nCode Content:\n```\n{file_content}\n```"
 
-        structured_llm = self.llm.with_structured_output(FileAnalysisResult)
+        messages = [
+            llm_gateway.cached_system_message(system_content),
+            HumanMessage(content=user_prompt)
+        ]
 
         try:
-            result = await structured_llm.ainvoke([
-                SystemMessage(content=system_content),
-                HumanMessage(content=user_prompt)
-            ])
+            result = await acall_routed("extraction", {"chars": len(file_content)}, lambda model: llm_gateway.ainvoke(
+                llm_gateway.chat_model(model).with_structured_output(FileAnalysisResult), messages, model=model
+            ))
 
             clean_usages = []
             for usage in result.usages:
                 clean_usages.append({
                     "file": file_path,
                     "pattern": usage.code_snippet,
-                    "method_name": usage.method_name
+                    "method_name": sys.intern(usage.method_name)
                 })
             return clean_usages
 
@@ -156,24 +429,19 @@ async def searcher_node(state):
     logger.info("Searcher: Starting process...")
 
     project_path = state.get("project_path", ".")
-    usage_path = state.get("usage_path", "usage.json")
-
-    library = state.get("library")
-    old_version = state.get("old_version")
-    new_version = state.get("new_version")
+    usage_path = state.get("usage_path", "usage.jsonl")
 
-    if not library or not old_version or not new_version:
+    libraries = state_libraries(state)
+    if not all(spec["library"] and spec["old_version"] and spec["new_version"] for spec in libraries):
         logger.error("Searcher: Missing required parameters in state.")
         return {"status": "error", "usage_path": usage_path}
 
     searcher = RepoSearcher(project_path)
-    usage_data = await searcher.execute_full_search(library, old_version, new_version)
-
-    if usage_data is None:
-        usage_data = []
+    with JsonlWriter(usage_path) as writer:
+        async for pattern in searcher.iter_patterns(libraries, call_sites_path(usage_path)):
+            writer.write(pattern)
 
-    save_json_file(usage_path, usage_data)
-    logger.info(f"Searcher: Saved {len(usage_data)} usage patterns to {usage_path}.")
+    logger.info(f"Searcher: Saved {writer.count} usage patterns to {usage_path}.")
 
     return {
         "status": "search_done",
@@ -0,0 +1,191 @@
+import ast
+import logging
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+BUILTIN_TYPES = {"list", "dict", "set", "tuple", "str", "bytes", "int", "float", "frozenset", "bytearray"}
+LITERAL_TYPES = {
+    ast.List: "list", ast.ListComp: "list", ast.Dict: "dict", ast.DictComp: "dict",
+    ast.Set: "set", ast.SetComp: "set", ast.Tuple: "tuple", ast.JoinedStr: "str"
+}
+FOREIGN = "builtins"
+LINE_TOLERANCE = 2
+
+
+class SymbolResolver(ast.NodeVisitor):
+    """
+    Static, scope-insensitive resolution of library symbols in one file.
+    Tracks import aliases (import pandas as pd, from pandas import DataFrame as DF) and the types of
+    variables assigned from constructors, annotations or builtin literals, so `df.append(...)` after
+    `df = pd.DataFrame()` resolves to pandas.DataFrame.append and `rows.append(...)` after `rows = []`
+    is recognised as a list method.
+    """
+
+    def __init__(self, import_names: List[str]):
+        self.roots: Set[str] = set(import_names)
+        self.aliases: Dict[str, str] = {}
+        self.types: Dict[str, str] = {}
+        self.symbols: Dict[int, Set[str]] = {}
+
+    def resolve(self, source: str) -> Dict[int, Set[str]]:
+        """
+        Returns line number -> qualified names referenced on that line.
+        Attributes of builtin values are reported as builtins.<type>.<attr>.
+        """
+        try:
+            self.visit(ast.parse(source))
+        except (SyntaxError, ValueError, RecursionError) as e:
+            logger.debug(f"Symbol resolver: Cannot parse source: {e}")
+        return self.symbols
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            if alias.name.split(".")[0] not in self.roots:
+                continue
+            if alias.asname:
+                self.aliases[alias.asname] = alias.name
+            else:
+                root = alias.name.split(".")[0]
+                self.aliases[root] = root
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        if node.level or not node.module or node.module.split(".")[0] not in self.roots:
+            return
+        for alias in node.names:
+            if alias.name != "*":
+                self.aliases[alias.asname or alias.name] = f"{node.module}.{alias.name}"
+
+    def visit_Assign(self, node: ast.Assign):
+        self.visit(node.value)
+        value_type = self._value_type(node.value)
+        for target in node.targets:
+            self._assign(target, value_type)
+            self.visit(target)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign):
+        if node.value is not None:
+            self.visit(node.value)
+        self._assign(node.target, self._annotation_type(node.annotation) or self._value_type(node.value))
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        arguments = node.args.posonlyargs + node.args.args + node.args.kwonlyargs
+        for argument in arguments:
+            if argument.annotation is not None:
+                self._assign(ast.Name(id=argument.arg), self._annotation_type(argument.annotation))
+        self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Attribute(self, node: ast.Attribute):
+        self._record(node.lineno, self._qualify(node))
+        self.generic_visit(node)
+
+    def visit_Name(self, node: ast.Name):
+        if node.id in self.aliases:
+            self._record(node.lineno, self.aliases[node.id])
+
+    def _record(self, line: int, symbol: Optional[str]):
+        if symbol:
+            self.symbols.setdefault(line, set()).add(symbol)
+
+    def _assign(self, target: ast.AST, value_type: Optional[str]):
+        if not isinstance(target, ast.Name):
+            return
+        if value_type:
+            self.types[target.id] = value_type
+        else:
+            self.types.pop(target.id, None)
+
+    def _qualify(self, node: ast.AST) -> Optional[str]:
+        if isinstance(node, ast.Name):
+            return self.aliases.get(node.id) or self.types.get(node.id)
+        if isinstance(node, ast.Attribute):
+            base = self._qualify(node.value)
+            if base is None and type(node.value) in LITERAL_TYPES:
+                base = f"{FOREIGN}.{LITERAL_TYPES[type(node.value)]}"
+            if base is None and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+                base = f"{FOREIGN}.str"
+            return f"{base}.{node.attr}" if base else None
+        if isinstance(node, ast.Call):
+            return self._value_type(node)
+        return None
+
+    def _value_type(self, node: Optional[ast.AST]) -> Optional[str]:
+        """
+        Type of an assigned value: an instance of a library class (capitalised constructor),
+        a builtin container, or another variable's type. Return types of functions are unknown.
+        """
+        if node is None:
+            return None
+        if type(node) in LITERAL_TYPES:
+            return f"{FOREIGN}.{LITERAL_TYPES[type(node)]}"
+        if isinstance(node, ast.Constant) and isinstance(node.value, (str, bytes)):
+            return f"{FOREIGN}.{type(node.value).__name__}"
+        if isinstance(node, ast.Name):
+            return self.types.get(node.id)
+        if isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Name) and node.func.id in BUILTIN_TYPES and node.func.id not in self.aliases:
+                return f"{FOREIGN}.{node.func.id}"
+            constructor = self._qualify(node.func)
+            if constructor and not constructor.startswith(f"{FOREIGN}.") \
+                    and constructor.rsplit(".", 1)[-1][:1].isupper():
+                return constructor
+        return None
+
+    def _annotation_type(self, node: ast.AST) -> Optional[str]:
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            try:
+                node = ast.parse(node.value, mode="eval").body
+            except SyntaxError:
+                return None
+        if isinstance(node, ast.Name) and node.id in BUILTIN_TYPES:
+            return f"{FOREIGN}.{node.id}"
+        qualified = self._qualify(node) if isinstance(node, (ast.Name, ast.Attribute)) else None
+        if qualified and qualified.split(".")[0] in self.roots:
+            return qualified
+        return None
+
+
+def resolve_symbols(source: str, import_names: List[str]) -> Dict[int, Set[str]]:
+    return SymbolResolver(import_names).resolve(source)
+
+
+def find_lines(source: str, snippet: str) -> List[int]:
+    """
+    1-based lines where the first line of snippet occurs in source, ignoring indentation.
+    """
+    first = next((line.strip() for line in snippet.splitlines() if line.strip()), "")
+    if not first:
+        return []
+    return [number for number, line in enumerate(source.splitlines(), 1) if first in line]
+
+
+def qualify_usage(symbols: Dict[int, Set[str]], method_name: str, line: Optional[int]) -> Optional[str]:
+    """
+    Qualified name for a usage reported as method_name on line.
+    A symbol resolved on the line itself wins, even a FOREIGN-prefixed one (a method of a builtin value);
+    only if the line has none is the nearest one within LINE_TOLERANCE lines taken.
+    None if nothing matches, so the usage stays in its own group by method name.
+    """
+    if not line:
+        return None
+    name = method_name.rsplit(".", 1)[-1]
+
+    def matching(number: int) -> Set[str]:
+        return {symbol for symbol in symbols.get(number, ())
+                if symbol.rsplit(".", 1)[-1] == name
+                and (symbol.endswith(f".{method_name}") or symbol == method_name or "." not in method_name)}
+
+    # Library symbols first among equally near ones.
+    on_line = matching(line)
+    if on_line:
+        return min(on_line, key=lambda symbol: (is_foreign(symbol), symbol))
+    nearest = [(abs(number - line), is_foreign(symbol), symbol)
+               for number in range(line - LINE_TOLERANCE, line + LINE_TOLERANCE + 1) if number != line
+               for symbol in matching(number)]
+    return min(nearest)[2] if nearest else None
+
+
+def is_foreign(symbol: Optional[str]) -> bool:
+    return bool(symbol) and symbol.startswith(f"{FOREIGN}.")
@@ -0,0 +1,142 @@
+import os
+import logging
+from array import array
+from typing import Callable, Dict, List, Optional
+
+from ..tools.io.json_handlers import JsonlWriter
+
+logger = logging.getLogger(__name__)
+
+CALL_SITES_FILE = "call_sites.jsonl"
+
+
+def call_sites_path(usage_path: str) -> str:
+    return os.path.join(os.path.dirname(usage_path), CALL_SITES_FILE)
+
+
+class StringPool:
+    """
+    Interns repeated strings (file paths) as small integer ids.
+    """
+
+    __slots__ = ("ids", "values")
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def add(self, value: str) -> int:
+        index = self.ids.get(value)
+        if index is None:
+            index = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+    def __getitem__(self, index: int) -> str:
+        return self.values[index]
+
+
+class UsageGroup:
+    """
+    Running aggregate of the usages of one symbol: how many call sites, in which files (pool ids)
+    and the first snippet, which becomes the pattern's code_example. The call sites themselves are not kept.
+    """
+
+    __slots__ = ("key", "symbol", "count", "files", "example", "first_seen", "pool")
+
+    def __init__(self, key: str, symbol: Optional[str], first_seen: int, example: str, pool: StringPool):
+        self.key = key
+        self.symbol = symbol
+        self.count = 0
+        self.files = array("I")
+        self.example = example
+        self.first_seen = first_seen
+        self.pool = pool
+
+    def add(self, file_id: int):
+        self.count += 1
+        # The usages of one file are added together, so a file id only repeats right after itself.
+        if not self.files or self.files[-1] != file_id:
+            self.files.append(file_id)
+
+    def merge(self, other: "UsageGroup"):
+        if other.first_seen < self.first_seen:
+            self.example, self.first_seen = other.example, other.first_seen
+        self.count += other.count
+        self.files = array("I", sorted(set(self.files).union(other.files)))
+        self.symbol = self.symbol or other.symbol
+
+    def affected_files(self) -> List[str]:
+        return sorted(self.pool[file_id] for file_id in self.files)
+
+
+class UsageStore:
+    """
+    Incremental grouping of one library's extracted usages by qualified symbol, with memory that grows with
+    the number of symbols and (symbol, file) pairs, not with the number of call sites.
+    Every call site is streamed to a JSON Lines spool (call_sites.jsonl) as it is added. The spool is owned by
+    the caller, so the stores of several libraries can share it.
+    """
+
+    def __init__(self, spool: Optional[JsonlWriter] = None, library: Optional[str] = None):
+        self.pool = StringPool()
+        self.usages = 0
+        self.library = library
+        self._groups: Dict[str, UsageGroup] = {}
+        self._spool = spool
+
+    def add_file(self, file_path: str, usages: List[Dict]):
+        """
+        Adds the usages of one file. Each usage has method_name and, if resolved, symbol;
+        pattern (the snippet) and line are optional.
+        """
+        file_id = self.pool.add(file_path)
+        for usage in usages:
+            symbol = usage.get("symbol")
+            key = symbol or usage.get("method_name", "")
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = UsageGroup(key, symbol, self.usages, usage.get("pattern", ""), self.pool)
+            elif symbol and not group.symbol:
+                group.symbol = symbol
+            group.add(file_id)
+            self.usages += 1
+
+            if self._spool is not None:
+                self._spool.write({
+                    "library": self.library,
+                    "file": file_path,
+                    "line": usage.get("line"),
+                    "method_name": usage.get("method_name"),
+                    "symbol": symbol,
+                    "pattern": usage.get("pattern", "")
+                })
+
+    def groups(self, canonical: Optional[Callable[[str], str]] = None) -> Dict[str, UsageGroup]:
+        """
+        Final groups in order of their first usage. Resolved symbols are first mapped with canonical
+        (internal path -> public name). Unresolved usages stay grouped by their bare method name: sharing a
+        name with a library symbol does not make `rows.append` a DataFrame method.
+        """
+        merged: Dict[str, UsageGroup] = {}
+        unresolved: List[UsageGroup] = []
+        for group in sorted(self._groups.values(), key=lambda group: group.first_seen):
+            if not group.symbol:
+                unresolved.append(group)
+                continue
+            if canonical is not None:
+                group.key = group.symbol = canonical(group.symbol)
+            if group.key in merged:
+                merged[group.key].merge(group)
+            else:
+                merged[group.key] = group
+
+        for group in unresolved:
+            if group.key in merged:
+                merged[group.key].merge(group)
+            else:
+                merged[group.key] = group
+
+        self._groups = merged
+        logger.info(f"Usage store: {self.library or 'library'}: {self.usages} usages in {len(merged)} groups across {len(self.pool.values)} files.")
+        return dict(sorted(merged.items(), key=lambda entry: entry[1].first_seen))
@@ -0,0 +1,272 @@
+import os
+import hmac
+import json
+import time
+import uuid
+import asyncio
+import logging
+import ipaddress
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from agents.tools.serena_tool import WARM_AGENTS, evict_idle, keep_warm
+from agents.tools.shared_cache import ALL_CACHES
+from agents.tools.token_usage import TokenUsageTracker, use_tracker
+from agents.tools.libraries import parse_libraries
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+EVICTION_INTERVAL_SECONDS = 60
+MAX_WAIT_SECONDS = 600
+REQUIRED_FIELDS = ("project_path", "library", "from", "to")
+TOKEN_ENV = "MIGRATOR_SERVER_TOKEN"
+TOKEN_HEADER = "X-Migrator-Token"
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def check_listen_address(host: str, token: Optional[str]):
+    """
+    Jobs run arbitrary checkers in any path they name, so the server only listens beyond localhost
+    when every request has to carry a shared token.
+    """
+    if not token and not is_loopback(host):
+        raise ValueError(f"Refusing to listen on {host} without a token. Set {TOKEN_ENV} (or --token), "
+                         f"or listen on 127.0.0.1.")
+
+
+class MigrationServer:
+    """
+    Long-running process that accepts migration jobs over localhost HTTP and runs them from a queue.
+    Everything that is process-wide stays warm between jobs: imports, pooled LLM and Context7 clients,
+    limiters, the in-memory caches and the Serena agents of recently migrated projects.
+    Jobs on the same project never overlap.
+    """
+
+    def __init__(self, run_job: Callable[[Dict], Awaitable[Dict]], workers: int = 2,
+                 serena_idle_seconds: float = 1800, token: Optional[str] = None):
+        self.run_job = run_job
+        self.token = token
+        self.workers = max(1, workers)
+        self.serena_idle_seconds = serena_idle_seconds
+        self.jobs: Dict[str, Dict] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._done: Dict[str, asyncio.Event] = {}
+        self._project_locks: Dict[str, asyncio.Lock] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopped: Optional[asyncio.Event] = None
+
+    def submit(self, job: Dict) -> Dict:
+        missing = [key for key in REQUIRED_FIELDS if not job.get(key)]
+        if missing and not job.get("resume"):
+            raise ValueError(f"Job is missing: {', '.join(missing)}")
+        if not job.get("resume"):
+            parse_libraries(job["library"], job["from"], job["to"])
+
+        job_id = uuid.uuid4().hex[:12]
+        entry = {
+            "job_id": job_id,
+            "project_path": job["project_path"],
+            "library": job.get("library"),
+            "old_version": job.get("from"),
+            "new_version": job.get("to"),
+            "status": "queued",
+            "submitted_at": time.time()
+        }
+        self.jobs[job_id] = entry
+        self._done[job_id] = asyncio.Event()
+        self._queue.put_nowait((job_id, job))
+        logger.info(f"Server: Queued job {job_id} for {job['project_path']} ({self._queue.qsize()} waiting)")
+        return {**entry, "position": self._queue.qsize()}
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict]:
+        if job_id not in self.jobs:
+            return None
+        try:
+            await asyncio.wait_for(self._done[job_id].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.jobs[job_id]
+
+    def health(self) -> Dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": sum(1 for job in self.jobs.values() if job["status"] == "running"),
+            "finished": sum(1 for job in self.jobs.values() if job["status"] == "finished"),
+            "warm_projects": sorted(WARM_AGENTS),
+            "caches": {cache.name: {"hits": cache.hits, "misses": cache.misses} for cache in ALL_CACHES}
+        }
+
+    async def _worker(self, number: int):
+        while True:
+            job_id, job = await self._queue.get()
+            entry = self.jobs[job_id]
+            lock = self._project_locks.setdefault(job["project_path"], asyncio.Lock())
+
+            async with lock:
+                tracker = TokenUsageTracker()
+                use_tracker(tracker)
+                entry["status"] = "running"
+                entry["worker"] = number
+                started = time.time()
+                logger.info(f"Server: Worker {number} starts job {job_id} ({job['project_path']})")
+                try:
+                    final_state = await self.run_job(job)
+                    entry["final_status"] = final_state.get("final_status", final_state.get("status"))
+                    entry["fix_iterations"] = final_state.get("fix_iteration", 0)
+                except Exception as e:
+                    logger.error(f"Server: Job {job_id} failed: {e}", exc_info=True)
+                    entry["final_status"] = "error"
+                    entry["error"] = str(e)
+
+                entry["status"] = "finished"
+                entry["tokens"] = tracker.total_tokens
+                entry["duration_seconds"] = round(time.time() - started, 1)
+                logger.info(f"Server: Job {job_id} finished with status {entry['final_status']}")
+
+            self._done[job_id].set()
+            self._queue.task_done()
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(EVICTION_INTERVAL_SECONDS)
+            evict_idle()
+
+    def authorized(self, token: Optional[str]) -> bool:
+        return not self.token or (token is not None and hmac.compare_digest(token, self.token))
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        check_listen_address(host, self.token)
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._stopped = asyncio.Event()
+        keep_warm(self.serena_idle_seconds)
+
+        tasks = [asyncio.create_task(self._worker(number)) for number in range(1, self.workers + 1)]
+        tasks.append(asyncio.create_task(self._evict_loop()))
+
+        http_server = ThreadingHTTPServer((host, port), _handler(self))
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        logger.info(f"Server: Listening on http://{host}:{port} with {self.workers} workers.")
+
+        try:
+            await self._stopped.wait()
+        finally:
+            http_server.shutdown()
+            for task in tasks:
+                task.cancel()
+            # Let running jobs unwind (and release their Serena agents) before the agents are shut down.
+            await asyncio.gather(*tasks, return_exceptions=True)
+            keep_warm(0)
+            evict_idle(now=float("inf"))
+            logger.info("Server: Stopped.")
+
+    def call(self, coroutine_or_function, *args, timeout: Optional[float] = None):
+        """
+        Runs a server method on the event loop from an HTTP handler thread.
+        """
+        async def run():
+            result = coroutine_or_function(*args)
+            if asyncio.iscoroutine(result):
+                result = await result
+            return result
+
+        return asyncio.run_coroutine_threadsafe(run(), self._loop).result(timeout)
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._stopped.set)
+
+
+def _handler(server: MigrationServer):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _authorized(self) -> bool:
+            if server.authorized(self.headers.get(TOKEN_HEADER)):
+                return True
+            self._send(401, {"error": f"Missing or wrong {TOKEN_HEADER} header"})
+            return False
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split("/") if part]
+
+            if parts == ["health"]:
+                return self._send(200, server.call(server.health))
+            if parts == ["jobs"]:
+                return self._send(200, server.call(lambda: list(server.jobs.values())))
+            if len(parts) == 2 and parts[0] == "jobs":
+                wait = float(parse_qs(url.query).get("wait", ["0"])[0])
+                entry = server.call(server.wait, parts[1], min(wait, MAX_WAIT_SECONDS))
+                if entry is None:
+                    return self._send(404, {"error": f"Unknown job {parts[1]}"})
+                return self._send(200, entry)
+            self._send(404, {"error": "Not found"})
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            parts = [part for part in urlparse(self.path).path.split("/") if part]
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError as e:
+                return self._send(400, {"error": f"Invalid JSON: {e}"})
+
+            if parts == ["jobs"]:
+                try:
+                    return self._send(202, server.call(server.submit, body))
+                except (ValueError, KeyError) as e:
+                    return self._send(400, {"error": str(e)})
+            if parts == ["shutdown"]:
+                server.stop()
+                return self._send(200, {"status": "stopping"})
+            self._send(404, {"error": "Not found"})
+
+        def log_message(self, format, *args):
+            logger.debug(f"Server: {self.address_string()} {format % args}")
+
+    return Handler
+
+
+def submit_job(server_url: str, job: Dict, poll_seconds: float = 60) -> Dict:
+    """
+    Client side: submits a job to a running server and blocks until it has finished.
+    The server's token, if it has one, is read from MIGRATOR_SERVER_TOKEN.
+    """
+    import httpx
+
+    token = os.environ.get(TOKEN_ENV)
+    headers = {TOKEN_HEADER: token} if token else {}
+    with httpx.Client(base_url=server_url.rstrip("/"), timeout=poll_seconds + 30, headers=headers) as client:
+        response = client.post("/jobs", json=job)
+        if response.status_code != 202:
+            raise ValueError(response.json().get("error", response.text))
+        entry = response.json()
+        logger.info(f"Submitted job {entry['job_id']} to {server_url} (position {entry['position']}).")
+
+        while entry["status"] != "finished":
+            response = client.get(f"/jobs/{entry['job_id']}", params={"wait": poll_seconds})
+            response.raise_for_status()
+            entry = response.json()
+        return entry
+
@@ -0,0 +1,62 @@
+import time
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+FIRST = "first"
+IMPROVING = "improving"
+STALLED = "stalled"
+OSCILLATING = "oscillating"
+REGRESSED = "regressed"
+
+DEFAULT_MAX_ITERATIONS = 5
+
+
+def assess_progress(history: List[List[str]], current: List[str]) -> str:
+    """
+    Compares the current error fingerprint set with the sets seen in previous tester runs.
+    """
+    if not history:
+        return FIRST
+
+    previous = set(history[-1])
+    current_set = set(current)
+
+    if current_set == previous:
+        return STALLED
+    if any(current_set == set(seen) for seen in history[:-1]):
+        return OSCILLATING
+    if len(current_set) < len(previous):
+        return IMPROVING
+    if current_set - previous and len(current_set) >= len(previous):
+        return REGRESSED
+    return STALLED
+
+
+def check_budget(state, tokens_used: int) -> Optional[str]:
+    """
+    Returns the name of the exhausted budget, or None if another fix iteration is allowed.
+    A budget of 0 means unlimited.
+    """
+    max_iterations = state.get("max_iterations", DEFAULT_MAX_ITERATIONS)
+    if max_iterations and state.get("fix_iteration", 0) >= max_iterations:
+        return "iterations"
+
+    max_wall_seconds = state.get("max_wall_seconds", 0)
+    started_at = state.get("started_at")
+    if max_wall_seconds and started_at and time.time() - started_at >= max_wall_seconds:
+        return "wall_clock"
+
+    max_tokens = state.get("max_tokens", 0)
+    if max_tokens and tokens_used >= max_tokens:
+        return "tokens"
+
+    # Imported here: main.py imports this module at startup, before LangChain is needed.
+    from agents.tools.budget import current_budget
+
+    budget = current_budget()
+    if budget is not None and budget.exhausted():
+        return budget.kind
+
+    return None
@@ -1,72 +1,126 @@
-import os
 import logging
-import json
-from agents.tools.io.json_handlers import save_json_file
-from agents.tools.testing.python.run_strategies import RuffRunner
-from agents.tools.testing.common import get_code_context
+from typing import Callable, List, Dict, Optional
+from agents.tools.io.json_handlers import load_json_file, save_json_file
+from agents.tools.testing.composite import configured_runner
+from agents.tools.testing.common import fingerprint_errors
+from agents.tools.git_ops import get_head_commit, revert_commits_since
+from agents.tools.token_usage import current_usage
+from agents.tools.budget import BUDGET_EXHAUSTED
+from agents.tester.convergence import assess_progress, check_budget, REGRESSED, STALLED, OSCILLATING
 
 logger = logging.getLogger(__name__)
 
 
+def collect_errors(project_path: str, on_result: Optional[Callable[[List[Dict]], None]] = None
+                   ) -> Optional[List[Dict]]:
+    """
+    Runs the configured checkers concurrently and returns their merged, structured errors.
+    Returns None if no errors were found but a checker failed in a way that produced no usable diagnostics.
+    """
+    return configured_runner().collect(project_path, on_result)
+
+
+def revert_fix_tasks(project_path: str, plan_path: str, base_commit: str) -> List[str]:
+    """
+    Reverts the commits made since base_commit and marks the matching plan tasks as reverted.
+    Returns the titles of the reverted tasks.
+    """
+    reverted_commits = set(revert_commits_since(project_path, base_commit))
+    if not reverted_commits:
+        return []
+
+    migration_plan = load_json_file(plan_path)
+    if not isinstance(migration_plan, list):
+        return []
+
+    reverted_titles = []
+    for task in migration_plan:
+        if task.get("commit") in reverted_commits:
+            task["status"] = "reverted"
+            reverted_titles.append(task.get("title", ""))
+
+    save_json_file(plan_path, migration_plan)
+    return reverted_titles
+
+
 def tester_node(state):
     logger.info("Tester: Start working...")
 
     project_path = state.get("project_path", ".")
     errors_path = state.get("errors_path", "errors.json")
+    plan_path = state.get("plan_path", "migration_plan.json")
+    history = list(state.get("error_history", []))
+    reverted_tasks = list(state.get("reverted_tasks", []))
+    fix_iteration = state.get("fix_iteration", 0)
 
     # clean previous errors
     save_json_file(errors_path, [])
 
-    runner = RuffRunner()
-    return_code, output_json = runner.run(project_path)
-
-    if return_code == 0:
-        logger.info("Ruff finished successfully. No errors detected.")
-        return {"status": "success", "needs_analysis": False}
+    # errors.json is updated as each checker finishes, then rewritten with the final set below.
+    def save_partial(errors: List[Dict]):
+        save_json_file(errors_path, errors)
 
-    logger.info(f"Ruff found errors (RC={return_code}). Parsing JSON logs...")
+    structured_errors = collect_errors(project_path, save_partial)
 
-    try:
-        if not output_json or not output_json.strip():
-            logger.warning("Ruff returned non-zero code but output is empty.")
-            ruff_errors = []
-        else:
-            ruff_errors = json.loads(output_json)
+    if state.get("status") == BUDGET_EXHAUSTED:
+        # The coder stopped on the budget: report the state of the committed work, but do not start fixing it.
+        if structured_errors is not None:
+            save_json_file(errors_path, structured_errors)
+        found = "unknown" if structured_errors is None else len(structured_errors)
+        logger.warning(f"Tester: Budget exhausted. The committed work has {found} errors; not fixing them.")
+        return {"status": BUDGET_EXHAUSTED, "final_status": state.get("final_status"), "needs_analysis": False,
+                "errors_path": errors_path}
 
-        structured_errors = []
+    if structured_errors is None:
+        return {"status": "failed_unknown", "final_status": "failed_unknown", "needs_analysis": False}
 
-        for idx, err in enumerate(ruff_errors):
-            file_path = err.get("filename", "")
-            rel_path = os.path.relpath(file_path, project_path) if os.path.isabs(file_path) else file_path
-
-            line_no = err["location"]["row"]
-            error_code = err.get("code", "UNKNOWN")
-            message = err.get("message", "Unknown error")
-
-            context_code = get_code_context(os.path.join(project_path, rel_path), line_no)
+    if not structured_errors:
+        return {"status": "success", "final_status": "success", "needs_analysis": False}
+
+    fingerprints = fingerprint_errors(structured_errors)
+    verdict = assess_progress(history, fingerprints)
+    logger.info(f"Tester: {len(fingerprints)} distinct errors, progress verdict: {verdict}.")
+
+    base_commit = state.get("fix_base_commit")
+    if verdict == REGRESSED and base_commit:
+        titles = revert_fix_tasks(project_path, plan_path, base_commit)
+        if titles:
+            logger.warning(f"Tester: Fix iteration made things worse. Reverted tasks: {titles}")
+            reverted_tasks.extend(titles)
+            structured_errors = collect_errors(project_path, save_partial)
+            if structured_errors is None:
+                return {"status": "failed_unknown", "final_status": "failed_unknown", "needs_analysis": False,
+                        "reverted_tasks": reverted_tasks}
+            if not structured_errors:
+                return {"status": "success", "final_status": "success", "needs_analysis": False,
+                        "reverted_tasks": reverted_tasks}
+            fingerprints = fingerprint_errors(structured_errors)
+    else:
+        history.append(fingerprints)
 
-            structured_errors.append({
-                "error_id": idx + 1,
-                "type": error_code,
-                "message": message,
-                "file": rel_path,
-                "line": line_no,
-                "context": context_code
-            })
+    save_json_file(errors_path, structured_errors)
+    result = {
+        "errors_path": errors_path,
+        "error_history": history,
+        "reverted_tasks": reverted_tasks,
+        "tokens_used": current_usage().total_tokens
+    }
 
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse Ruff JSON output: {e}")
-        return {"status": "failed_unknown", "needs_analysis": False}
+    if verdict in (STALLED, OSCILLATING):
+        logger.warning(f"Tester: Error set is {verdict}. Stopping the fix loop.")
+        return {**result, "status": "failed", "final_status": verdict, "needs_analysis": False}
 
-    if not structured_errors:
-        logger.warning("Tester: Ruff failed but returned no structured errors.")
-        return {"status": "failed_unknown", "needs_analysis": False}
+    exhausted = check_budget(state, current_usage().total_tokens)
+    if exhausted:
+        logger.warning(f"Tester: {exhausted} budget exhausted with {len(fingerprints)} errors left.")
+        return {**result, "status": "failed", "final_status": f"budget_exhausted_{exhausted}", "needs_analysis": False}
 
-    logger.info(f"Tester: Found {len(structured_errors)} errors via Ruff. Saving to {errors_path}")
-    save_json_file(errors_path, structured_errors)
+    logger.info(f"Tester: Found {len(structured_errors)} errors. Saved to {errors_path}")
 
     return {
+        **result,
         "status": "failed",
-        "errors_path": errors_path,
-        "needs_analysis": True
-    }
\ No newline at end of file
+        "needs_analysis": True,
+        "fix_iteration": fix_iteration + 1,
+        "fix_base_commit": get_head_commit(project_path)
+    }
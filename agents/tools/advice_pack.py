@@ -0,0 +1,148 @@
+import os
+import time
+import logging
+from contextvars import ContextVar, Token
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from agents.tools.io.json_handlers import iter_jsonl, load_json_file, save_json_file
+
+logger = logging.getLogger(__name__)
+
+PACK_FORMAT = 1
+# Patterns the refiner could not answer ("Unknown") or a budgeted run never looked up ("Deferred")
+# carry no advice worth reusing.
+SKIPPED_STATUSES = {"Unknown", "Deferred"}
+
+# (library, old_version, new_version) -> element -> {"status", "instruction", "example"}
+_packs: Dict[Tuple[str, str, str], Dict[str, Dict]] = {}
+# The process-wide packs plus those of the job running in this context (server mode); None outside a job.
+_JOB_PACKS: ContextVar[Optional[Dict[Tuple[str, str, str], Dict[str, Dict]]]] = ContextVar("job_packs", default=None)
+
+
+def _normalize(library: str) -> str:
+    return library.lower().replace("_", "-")
+
+
+def pack_key(library: str, old_version: str, new_version: str) -> Tuple[str, str, str]:
+    return _normalize(library), old_version, new_version
+
+
+def default_pack_name(library: str, old_version: str, new_version: str) -> str:
+    return f"advice-{_normalize(library)}-{old_version}-{new_version}.json"
+
+
+def advice_from_patterns(library: str, patterns: Iterable[Dict]) -> Dict[str, Dict]:
+    """
+    Refined advice of a run's usage patterns, keyed by the element that was looked up in Context7
+    (the qualified symbol, or library.method for unresolved usages).
+    """
+    advice = {}
+    for pattern in patterns:
+        if pattern.get("status", "Unknown") in SKIPPED_STATUSES:
+            continue
+        # Patterns of a multi-library run carry their library; older runs only have one.
+        if pattern.get("library", library) != library:
+            continue
+        element = pattern.get("symbol") or f"{library}.{pattern.get('title')}"
+        advice[element] = {
+            "status": pattern["status"],
+            "instruction": pattern.get("migration_guide", ""),
+            "example": pattern.get("migration_example") or {}
+        }
+    return advice
+
+
+def _validate(pack: Dict, source: str) -> Dict:
+    if not isinstance(pack, dict) or not isinstance(pack.get("advice"), dict):
+        raise ValueError(f"{source} is not an advice pack.")
+    if pack.get("format") != PACK_FORMAT:
+        raise ValueError(f"{source} has pack format {pack.get('format')}, expected {PACK_FORMAT}.")
+    missing = [field for field in ("library", "old_version", "new_version") if not pack.get(field)]
+    if missing:
+        raise ValueError(f"{source} is missing: {', '.join(missing)}")
+    return pack
+
+
+def export_pack(usage_path: str, library: str, old_version: str, new_version: str, output: str) -> Tuple[int, int]:
+    """
+    Writes the advice of a run to output. If output already holds a pack for the same library and
+    versions, the packs are merged; entries of this run replace older ones for the same element.
+    Returns (exported entries, entries in the pack).
+    """
+    advice = advice_from_patterns(library, iter_jsonl(usage_path))
+
+    entries: Dict[str, Dict] = {}
+    if os.path.exists(output):
+        existing = _validate(load_json_file(output), output)
+        if pack_key(existing["library"], existing["old_version"], existing["new_version"]) \
+                != pack_key(library, old_version, new_version):
+            raise ValueError(f"{output} holds advice for {existing['library']} {existing['old_version']} -> "
+                             f"{existing['new_version']}, not {library} {old_version} -> {new_version}.")
+        entries = existing["advice"]
+    entries.update(advice)
+
+    directory = os.path.dirname(os.path.abspath(output))
+    os.makedirs(directory, exist_ok=True)
+    save_json_file(output, {
+        "format": PACK_FORMAT,
+        "library": library,
+        "old_version": old_version,
+        "new_version": new_version,
+        "updated_at": int(time.time()),
+        "advice": dict(sorted(entries.items()))
+    })
+    return len(advice), len(entries)
+
+
+def _pack_files(path: str) -> List[str]:
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".json"))
+    if not os.path.exists(path):
+        raise ValueError(f"Advice pack {path} does not exist.")
+    return [path]
+
+
+def load_packs(paths: Iterable[str]) -> int:
+    """
+    Loads advice packs (files, or directories of *.json packs) for lookup_advice.
+    Packs for the same library and versions merge; later packs win for the same element.
+    Returns the number of entries loaded.
+    """
+    return _load_into(_packs, paths)
+
+
+def _load_into(packs: Dict[Tuple[str, str, str], Dict[str, Dict]], paths: Iterable[str]) -> int:
+    loaded = 0
+    for path in paths:
+        for file_path in _pack_files(path):
+            pack = _validate(load_json_file(file_path), file_path)
+            key = pack_key(pack["library"], pack["old_version"], pack["new_version"])
+            packs.setdefault(key, {}).update(pack["advice"])
+            loaded += len(pack["advice"])
+            logger.info(f"Advice pack: Loaded {len(pack['advice'])} entries for {pack['library']} "
+                        f"{pack['old_version']} -> {pack['new_version']} from {file_path}")
+    return loaded
+
+
+def use_job_packs(paths: Iterable[str]) -> Token:
+    """
+    Makes packs visible to the current context only (one server job), on top of the process-wide ones.
+    Pass the returned token to reset_job_packs() when the job is done.
+    """
+    packs = {key: dict(advice) for key, advice in _packs.items()}
+    _load_into(packs, paths)
+    return _JOB_PACKS.set(packs)
+
+
+def reset_job_packs(token: Token):
+    _JOB_PACKS.reset(token)
+
+
+def clear_packs():
+    _packs.clear()
+
+
+def lookup_advice(library: str, old_version: str, new_version: str, element: str) -> Optional[Dict]:
+    job_packs = _JOB_PACKS.get()
+    packs = _packs if job_packs is None else job_packs
+    return packs.get(pack_key(library, old_version, new_version), {}).get(element)
@@ -0,0 +1,291 @@
+import os
+import re
+import sys
+import json
+import asyncio
+import logging
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+from agents.tools.io.json_handlers import load_json_file, save_json_file
+from agents.tools.response_cache import CACHE_ROOT
+from agents.tools.shared_cache import AsyncMemo
+from agents.tools.telemetry import traced
+
+logger = logging.getLogger(__name__)
+
+UNCHANGED_STATUS = "Unchanged"
+
+API_DIFF_DIR = os.path.join(CACHE_ROOT, "api_diff")
+DEFAULT_WHEELHOUSE = os.environ.get("MIGRATOR_WHEELHOUSE", os.path.join(CACHE_ROOT, "wheels"))
+PROBE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "api_surface_probe.py")
+INSTALL_TIMEOUT_SECONDS = 600
+PROBE_TIMEOUT_SECONDS = 300
+DISTRIBUTION_SUFFIXES = (".whl", ".tar.gz", ".zip")
+
+API_DIFF_CACHE = AsyncMemo("api_diff")
+
+_enabled = True
+_wheelhouse = DEFAULT_WHEELHOUSE
+
+
+def configure_api_diff(enabled: bool = True, wheelhouse: Optional[str] = None):
+    """
+    The diff only uses wheels or sdists already in the wheelhouse (pip --no-index), never the network.
+    """
+    global _enabled, _wheelhouse
+    _enabled = enabled
+    _wheelhouse = wheelhouse or DEFAULT_WHEELHOUSE
+
+
+class ApiDiff:
+    """
+    Differences between the public API of two versions of a library.
+    Symbols are qualified names (pandas.DataFrame.append); methods are looked up by their last component.
+    """
+
+    def __init__(self, data: Dict):
+        self.removed: List[str] = data.get("removed", [])
+        self.renamed: Dict[str, str] = data.get("renamed", {})
+        self.changed: Dict[str, Dict] = data.get("changed", {})
+        self.deprecated: List[str] = data.get("deprecated", [])
+        self.known: List[str] = data.get("known", [])
+
+        self._known = set(self.known)
+        self._by_name: Dict[str, List[str]] = {}
+        for symbol in self.known:
+            self._by_name.setdefault(symbol.rsplit(".", 1)[-1], []).append(symbol)
+
+    def to_dict(self) -> Dict:
+        return {"removed": self.removed, "renamed": self.renamed, "changed": self.changed,
+                "deprecated": self.deprecated, "known": self.known}
+
+    def canonical(self, symbol: str) -> str:
+        """
+        Maps a symbol imported from an internal module (pandas.core.frame.DataFrame.append)
+        to its public path (pandas.DataFrame.append) if the old API has one.
+        """
+        parts = symbol.split(".")
+        for start in range(1, len(parts)):
+            candidate = ".".join([parts[0]] + parts[start:])
+            if candidate in self._known:
+                return candidate
+        return symbol
+
+    def changes_for(self, method: str) -> Optional[List[str]]:
+        """
+        Returns the changes of a qualified symbol, or of every symbol named method for a bare name:
+        [] if all of them are unchanged, None if the name is not part of the old public API (the diff cannot tell).
+        """
+        if method in self._known:
+            symbols = [method]
+        else:
+            symbols = self._by_name.get(method.rsplit(".", 1)[-1])
+        if not symbols:
+            return None
+
+        removed, deprecated = set(self.removed), set(self.deprecated)
+        changes = []
+        for symbol in symbols:
+            if symbol in self.renamed:
+                changes.append(f"{symbol}: renamed to {self.renamed[symbol]}")
+            elif symbol in removed:
+                changes.append(f"{symbol}: removed")
+            elif symbol in self.changed:
+                change = self.changed[symbol]
+                changes.append(f"{symbol}: signature changed from ({change['old']}) to ({change['new']})")
+            if symbol in deprecated:
+                changes.append(f"{symbol}: deprecated")
+        return changes
+
+
+def diff_surfaces(old: Dict[str, Dict], new: Dict[str, Dict]) -> ApiDiff:
+    """
+    Compares two surfaces from api_surface_probe.py.
+    A signature counts as changed only if existing calls can break: a parameter was removed,
+    renamed or changed kind, or a new parameter is required. New optional parameters are compatible.
+    """
+    removed = sorted(symbol for symbol in old if symbol not in new)
+    added = [symbol for symbol in new if symbol not in old]
+
+    renamed = {}
+    for symbol in removed:
+        parent = symbol.rsplit(".", 1)[0]
+        candidates = [other for other in added
+                      if other.rsplit(".", 1)[0] == parent and other not in renamed.values()
+                      and new[other]["kind"] == old[symbol]["kind"]
+                      and old[symbol]["params"] is not None and new[other]["params"] == old[symbol]["params"]]
+        if len(candidates) == 1:
+            renamed[symbol] = candidates[0]
+
+    changed = {}
+    for symbol, entry in old.items():
+        if symbol in new and _breaks_calls(entry.get("params"), new[symbol].get("params")):
+            changed[symbol] = {"old": _format_params(entry["params"]), "new": _format_params(new[symbol]["params"])}
+
+    deprecated = sorted(symbol for symbol, entry in new.items() if entry.get("deprecated") and symbol in old)
+
+    return ApiDiff({
+        "removed": removed,
+        "renamed": renamed,
+        "changed": changed,
+        "deprecated": deprecated,
+        "known": sorted(old)
+    })
+
+
+def _breaks_calls(old_params: Optional[List], new_params: Optional[List]) -> bool:
+    if old_params is None or new_params is None:
+        return False
+    new_by_name = {name: (kind, has_default) for name, kind, has_default in new_params}
+    accepts_kwargs = any(kind == "VAR_KEYWORD" for _, kind, _ in new_params)
+
+    for position, (name, kind, _) in enumerate(old_params):
+        if name not in new_by_name:
+            if not (accepts_kwargs and kind == "KEYWORD_ONLY"):
+                return True
+        elif new_by_name[name][0] != kind:
+            return True
+        elif kind == "POSITIONAL_OR_KEYWORD" and position < len(new_params) and new_params[position][0] != name:
+            return True
+
+    old_names = {name for name, _, _ in old_params}
+    return any(not has_default and kind not in ("VAR_POSITIONAL", "VAR_KEYWORD") and name not in old_names
+               for name, kind, has_default in new_params)
+
+
+def _format_params(params: Optional[List]) -> str:
+    return ", ".join(name for name, _, _ in params or [])
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[-_.]+", "_", name).lower()
+
+
+def _names_key(import_names: List[str]) -> str:
+    return "+".join(sorted(set(import_names)))
+
+
+def _distribution_of(filename: str) -> Optional[Tuple[str, str]]:
+    """
+    Returns (normalized name, version) of a wheel (name-version-...-platform.whl)
+    or an sdist (name-version.tar.gz), or None for any other file.
+    """
+    for suffix in DISTRIBUTION_SUFFIXES:
+        if filename.lower().endswith(suffix):
+            stem = filename[:-len(suffix)]
+            # Wheel names have their dashes escaped; sdist names may keep them, versions never have any.
+            name, _, version = (stem.partition("-") if suffix == ".whl" else stem.rpartition("-"))
+            if suffix == ".whl":
+                version = version.split("-", 1)[0]
+            return (_normalize(name), version.lower()) if name and version else None
+    return None
+
+
+def _has_distribution(wheelhouse: str, library: str, version: str) -> bool:
+    if not os.path.isdir(wheelhouse):
+        return False
+    wanted = (_normalize(library), version.lower())
+    return any(_distribution_of(filename) == wanted for filename in os.listdir(wheelhouse))
+
+
+def _install(library: str, version: str, wheelhouse: str) -> Optional[str]:
+    """
+    Installs one version of the library (with its dependencies) from the wheelhouse into its own directory.
+    """
+    target = os.path.join(API_DIFF_DIR, "envs", f"{_normalize(library)}-{version}")
+    marker = os.path.join(target, ".complete")
+    if os.path.exists(marker):
+        return target
+
+    logger.info(f"API diff: Installing {library}=={version} from {wheelhouse}...")
+    result = subprocess.run(
+        [sys.executable, "-m", "pip", "install", "--quiet", "--disable-pip-version-check", "--no-index",
+         "--find-links", wheelhouse, "--target", target, "--upgrade", f"{library}=={version}"],
+        capture_output=True, text=True, timeout=INSTALL_TIMEOUT_SECONDS
+    )
+    if result.returncode != 0:
+        logger.warning(f"API diff: Cannot install {library}=={version}: {result.stderr.strip()[-500:]}")
+        return None
+
+    with open(marker, "w", encoding="utf-8") as f:
+        f.write(version)
+    return target
+
+
+def _load_surface(library: str, version: str, import_names: List[str], wheelhouse: str) -> Optional[Dict]:
+    # The probe only walks the given import names, so they are part of the key.
+    path = os.path.join(API_DIFF_DIR, "surfaces", f"{_normalize(library)}-{version}-{_names_key(import_names)}.json")
+    surface = load_json_file(path)
+    if surface:
+        return surface
+
+    target = _install(library, version, wheelhouse)
+    if target is None:
+        return None
+
+    # -S keeps the agent's own site-packages out: the probe sees only this library version.
+    result = subprocess.run(
+        [sys.executable, "-S", PROBE_SCRIPT, target, *import_names],
+        capture_output=True, text=True, timeout=PROBE_TIMEOUT_SECONDS
+    )
+    if result.returncode != 0:
+        logger.warning(f"API diff: Probe failed for {library}=={version}: {result.stderr.strip()[-500:]}")
+        return None
+
+    surface = json.loads(result.stdout or "{}")
+    if not surface:
+        logger.warning(f"API diff: No public API found for {library}=={version} ({result.stderr.strip()[-200:]})")
+        return None
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    save_json_file(path, surface)
+    return surface
+
+
+@traced("api_diff")
+def compute_api_diff(library: str, old_version: str, new_version: str, import_names: List[str],
+                     wheelhouse: str) -> Optional[ApiDiff]:
+    path = os.path.join(API_DIFF_DIR,
+                        f"{_normalize(library)}-{old_version}-{new_version}-{_names_key(import_names)}.json")
+    data = load_json_file(path)
+    if data:
+        return ApiDiff(data)
+
+    missing = [version for version in (old_version, new_version) if not _has_distribution(wheelhouse, library, version)]
+    if missing:
+        logger.info(f"API diff: No local wheel or sdist of {library} {', '.join(missing)} in {wheelhouse}. "
+                    f"Every usage goes to Context7.")
+        return None
+
+    try:
+        old_surface = _load_surface(library, old_version, import_names, wheelhouse)
+        new_surface = _load_surface(library, new_version, import_names, wheelhouse)
+    except (OSError, subprocess.SubprocessError, ValueError) as e:
+        logger.warning(f"API diff: Failed for {library} {old_version} -> {new_version}: {e}")
+        return None
+    if not old_surface or not new_surface:
+        return None
+
+    diff = diff_surfaces(old_surface, new_surface)
+    os.makedirs(API_DIFF_DIR, exist_ok=True)
+    save_json_file(path, diff.to_dict())
+    logger.info(f"API diff: {library} {old_version} -> {new_version}: {len(diff.removed)} removed, "
+                f"{len(diff.renamed)} renamed, {len(diff.changed)} changed, {len(diff.deprecated)} deprecated "
+                f"out of {len(diff.known)} symbols.")
+    return diff
+
+
+async def get_api_diff(library: str, old_version: str, new_version: str,
+                       import_names: List[str]) -> Optional[ApiDiff]:
+    """
+    Returns the cached diff for (library, old, new, import names, wheelhouse),
+    or None if it is disabled or cannot be computed locally.
+    """
+    if not _enabled:
+        return None
+    return await API_DIFF_CACHE.get_or_create(
+        (library, old_version, new_version, _names_key(import_names), _wheelhouse),
+        lambda: asyncio.to_thread(compute_api_diff, library, old_version, new_version, import_names, _wheelhouse),
+        should_cache=lambda diff: diff is not None
+    )
@@ -0,0 +1,115 @@
+"""
+Dumps the public API surface of installed packages as JSON.
+Run by api_diff.py in a separate interpreter (python -S) whose only site directory is one library version:
+
+    python -S api_surface_probe.py <site_dir> <import_name> [<import_name> ...]
+
+Uses the standard library only.
+"""
+import sys
+import json
+import site
+import types
+import inspect
+import warnings
+
+MAX_DEPTH = 3
+DEPRECATION_MARKERS = ("DeprecationWarning", "FutureWarning", "PendingDeprecationWarning", "@deprecated")
+
+
+def _parameters(obj):
+    try:
+        signature = inspect.signature(obj)
+    except (TypeError, ValueError):
+        return None
+    return [[p.name, p.kind.name, p.default is not inspect.Parameter.empty] for p in signature.parameters.values()]
+
+
+def _deprecated(obj):
+    if getattr(obj, "__deprecated__", None):
+        return True
+    doc = inspect.getdoc(obj) or ""
+    if ".. deprecated::" in doc:
+        return True
+    if inspect.isfunction(obj):
+        try:
+            source = inspect.getsource(obj)
+        except (OSError, TypeError):
+            return False
+        return any(marker in source for marker in DEPRECATION_MARKERS)
+    return False
+
+
+def _entry(kind, obj):
+    return {"kind": kind, "params": _parameters(obj) if callable(obj) else None, "deprecated": _deprecated(obj)}
+
+
+def _public_names(obj):
+    names = getattr(obj, "__all__", None) if isinstance(obj, types.ModuleType) else None
+    if not isinstance(names, (list, tuple)):
+        names = dir(obj)
+    return [name for name in names if isinstance(name, str) and not name.startswith("_")]
+
+
+def _walk_class(qualname, cls, surface):
+    surface[qualname] = _entry("class", cls)
+    for name in _public_names(cls):
+        try:
+            member = inspect.getattr_static(cls, name)
+        except AttributeError:
+            continue
+        if isinstance(member, (staticmethod, classmethod)):
+            member = member.__func__
+        if isinstance(member, property):
+            surface[f"{qualname}.{name}"] = _entry("property", member.fget)
+        elif callable(member):
+            surface[f"{qualname}.{name}"] = _entry("method", member)
+        else:
+            surface[f"{qualname}.{name}"] = {"kind": "attribute", "params": None, "deprecated": False}
+
+
+def _walk_module(qualname, module, root, surface, seen, depth):
+    if id(module) in seen or depth > MAX_DEPTH:
+        return
+    seen.add(id(module))
+    surface[qualname] = {"kind": "module", "params": None, "deprecated": False}
+
+    for name in _public_names(module):
+        try:
+            member = getattr(module, name)
+        except Exception:
+            continue
+        member_name = f"{qualname}.{name}"
+
+        if isinstance(member, types.ModuleType):
+            if member.__name__.split(".")[0] == root:
+                _walk_module(member_name, member, root, surface, seen, depth + 1)
+        elif inspect.isclass(member):
+            _walk_class(member_name, member, surface)
+        elif callable(member):
+            surface[member_name] = _entry("function", member)
+        else:
+            surface[member_name] = {"kind": "attribute", "params": None, "deprecated": False}
+
+
+def main():
+    site_dir, import_names = sys.argv[1], sys.argv[2:]
+    # Replace the script's own directory, so the agent's modules cannot shadow the library's.
+    sys.path[0] = site_dir
+    site.addsitedir(site_dir)
+    warnings.simplefilter("ignore")
+
+    surface = {}
+    for import_name in import_names:
+        try:
+            module = __import__(import_name)
+        except Exception as e:
+            print(f"Cannot import {import_name}: {e}", file=sys.stderr)
+            continue
+        _walk_module(import_name, module, import_name, surface, set(), 0)
+
+    json.dump(surface, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import re
+import time
+import logging
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional
+
+from agents.tools.model_router import BALANCED_MODEL, FAST_MODEL, TOP_MODEL
+from agents.tools.telemetry import current_metrics
+from agents.tools.token_usage import current_usage
+
+logger = logging.getLogger(__name__)
+
+DEFERRED_STATUS = "Deferred"
+BUDGET_EXHAUSTED = "budget_exhausted"
+
+TOKENS = "tokens"
+COST = "cost"
+TIME = "time"
+
+# USD per million input / output tokens. Prompt-cache reads cost 10% of the input price, writes 125%.
+PRICES_PER_MTOK = {
+    FAST_MODEL: (1.0, 5.0),
+    BALANCED_MODEL: (3.0, 15.0),
+    TOP_MODEL: (5.0, 25.0)
+}
+CACHE_READ_FACTOR = 0.1
+CACHE_WRITE_FACTOR = 1.25
+
+BUDGET_PATTERN = re.compile(r"^\s*(\$)?\s*(\d+(?:\.\d+)?)\s*([a-zA-Z$]*)\s*$")
+# A bare "m" could be minutes or millions; millions are written "M" or "mtok", minutes "min".
+TOKEN_SUFFIXES = {"": 1, "tok": 1, "tokens": 1, "k": 1_000, "ktok": 1_000, "mtok": 1_000_000}
+TIME_SUFFIXES = {"s": 1, "sec": 1, "min": 60, "h": 3600}
+COST_SUFFIXES = {"usd", "$"}
+
+
+def cost_of(model: str, usage: Dict[str, int]) -> float:
+    """
+    USD cost of one model's token usage. Unknown models are priced as the top model.
+    """
+    input_price, output_price = PRICES_PER_MTOK.get(model, PRICES_PER_MTOK[TOP_MODEL])
+    cache_read = usage.get("cache_read_tokens", 0)
+    cache_write = usage.get("cache_creation_tokens", 0)
+    uncached = max(0, usage.get("input_tokens", 0) - cache_read - cache_write)
+    return (uncached * input_price + cache_read * input_price * CACHE_READ_FACTOR
+            + cache_write * input_price * CACHE_WRITE_FACTOR + usage.get("output_tokens", 0) * output_price) / 1e6
+
+
+class Budget:
+    """
+    Spending limit of one run in tokens, USD or wall-clock seconds.
+    Nodes check exhausted() before starting the next unit of work (a Context7 chunk, a planning batch,
+    a coder task) and record what they leave undone with defer(), so the run stops cleanly.
+    """
+
+    def __init__(self, kind: str, limit: float):
+        self.kind = kind
+        self.limit = limit
+        self.started = time.time()
+        self.deferred_patterns: List[Dict] = []
+        self.deferred_tasks: List[Dict] = []
+        self._reported = False
+
+    @classmethod
+    def parse(cls, text: str) -> "Budget":
+        """
+        "$25" or "25usd" is a cost budget, "90min", "2h" or "600s" a time budget,
+        "500k", "2M", "2mtok" or "200000" a token budget. "30m" is rejected as ambiguous.
+        """
+        match = BUDGET_PATTERN.match(text or "")
+        if not match:
+            raise ValueError(f"Cannot parse budget {text!r}. Use e.g. 500k (tokens), $25 (cost) or 90min (time).")
+        dollar, amount, suffix = match.group(1), float(match.group(2)), match.group(3)
+        if suffix == "m":
+            raise ValueError(f"Ambiguous budget {text!r}: use {match.group(2)}min for minutes "
+                             f"or {match.group(2)}M for million tokens.")
+        suffix = "mtok" if suffix == "M" else suffix.lower()
+
+        if dollar or suffix in COST_SUFFIXES:
+            if dollar and suffix:
+                raise ValueError(f"Cannot parse budget {text!r}.")
+            return cls(COST, amount)
+        if suffix in TIME_SUFFIXES:
+            return cls(TIME, amount * TIME_SUFFIXES[suffix])
+        if suffix in TOKEN_SUFFIXES:
+            return cls(TOKENS, amount * TOKEN_SUFFIXES[suffix])
+        raise ValueError(f"Unknown budget unit {suffix!r} in {text!r}.")
+
+    def spent(self) -> float:
+        if self.kind == TOKENS:
+            return current_usage().total_tokens
+        if self.kind == COST:
+            return sum(cost_of(model, usage) for model, usage in current_metrics().usage_by_model().items())
+        return time.time() - self.started
+
+    def exhausted(self) -> bool:
+        if self.spent() < self.limit:
+            return False
+        if not self._reported:
+            self._reported = True
+            logger.warning(f"Budget: {self.describe()} exhausted. Remaining work is deferred.")
+        return True
+
+    def describe(self) -> str:
+        if self.kind == COST:
+            return f"${self.spent():.2f} of ${self.limit:.2f}"
+        if self.kind == TIME:
+            return f"{self.spent():.0f}s of {self.limit:.0f}s"
+        return f"{self.spent():.0f} of {self.limit:.0f} tokens"
+
+    def defer(self, patterns: Iterable[Dict] = (), tasks: Iterable[Dict] = (), stage: str = ""):
+        known = {pattern.get("pattern_id") for pattern in self.deferred_patterns}
+        for pattern in patterns:
+            if pattern.get("pattern_id") not in known:
+                self.deferred_patterns.append({
+                    "pattern_id": pattern.get("pattern_id"),
+                    "title": pattern.get("title"),
+                    "symbol": pattern.get("symbol"),
+                    "occurrence_count": pattern.get("occurrence_count", 0),
+                    "affected_files": pattern.get("affected_files", []),
+                    "stage": stage
+                })
+                known.add(pattern.get("pattern_id"))
+        known_tasks = {task.get("task_id") for task in self.deferred_tasks}
+        self.deferred_tasks.extend(
+            {key: task.get(key) for key in ("task_id", "title", "files", "pattern_ids")}
+            for task in tasks if task.get("task_id") not in known_tasks
+        )
+
+    def defer_tasks(self, tasks: List[Dict], patterns: Iterable[Dict], stage: str):
+        """
+        Defers pending tasks together with the usage patterns they cover.
+        """
+        pattern_ids = {pattern_id for task in tasks for pattern_id in task.get("pattern_ids") or []}
+        self.defer(patterns=[pattern for pattern in patterns if pattern.get("pattern_id") in pattern_ids],
+                   tasks=tasks, stage=stage)
+
+    def report(self) -> Dict:
+        return {
+            "kind": self.kind,
+            "limit": self.limit,
+            "spent": round(self.spent(), 4),
+            "exhausted": self.spent() >= self.limit,
+            "remaining_patterns": sorted(self.deferred_patterns, key=priority, reverse=True),
+            "remaining_tasks": self.deferred_tasks
+        }
+
+
+def priority(pattern: Dict):
+    """
+    Sort key for budgeted runs: patterns with more call sites and more affected files go first.
+    """
+    return pattern.get("occurrence_count", 0), len(pattern.get("affected_files", []))
+
+
+_CURRENT_BUDGET: ContextVar[Optional[Budget]] = ContextVar("current_budget", default=None)
+
+
+def current_budget() -> Optional[Budget]:
+    return _CURRENT_BUDGET.get()
+
+
+def use_budget(budget: Optional[Budget]):
+    _CURRENT_BUDGET.set(budget)
+
+
+def budget_exhausted() -> bool:
+    budget = current_budget()
+    return budget is not None and budget.exhausted()
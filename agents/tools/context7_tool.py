@@ -1,30 +1,53 @@
 import httpx
 import os
+import asyncio
 import logging
+import weakref
 from typing import Dict, Any, Optional
 from agents.prompts.searcher_prompts import MIGRATION_ADVICE_PROMPT
+from agents.tools.limits import CONTEXT7_LIMITER
+from agents.tools.shared_cache import AsyncMemo
+from agents.tools.telemetry import traced
 
 logger = logging.getLogger(__name__)
 
+# Shared by every Context7Tool in the process, so fleet runs resolve and fetch each item once.
+LIBRARY_ID_CACHE = AsyncMemo("context7_library_ids")
+ADVICE_CACHE = AsyncMemo("context7_advice")
+
+# One pooled client per event loop: keep-alive connections survive across requests, runs and server jobs.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def _client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(timeout=45.0)
+        _clients[loop] = client
+    return client
+
 
 class Context7Tool:
     def __init__(self):
-        self.base_url = "https://context7.com/api/v2"
+        self.base_url = os.environ.get("CONTEXT7_BASE_URL", "https://context7.com/api/v2")
         self.api_key = os.environ.get("CONTEXT7_API_KEY")
-        self.library_ids = {}
 
     async def get_migration_advice(self, library: str, element: str, old_v: str, new_v: str) -> str:
-        real_id = await self._resolve_library_id(library)
+        real_id = await LIBRARY_ID_CACHE.get_or_create(library, lambda: self._resolve_library_id(library))
         if not real_id:
             return "Library not found."
 
         query = MIGRATION_ADVICE_PROMPT.format(
             library=library, element=element, old_v=old_v, new_v=new_v
         )
-        data = await self._make_txt_request(real_id, query)
+        data = await ADVICE_CACHE.get_or_create(
+            (real_id, element, old_v, new_v), lambda: self._make_txt_request(real_id, query)
+        )
 
         return data
 
+    @traced("context7")
     async def _make_txt_request(self, library_id: str, query: str) -> Dict[str, Any]:
         if not self.api_key:
             return {}
@@ -36,19 +59,17 @@ class Context7Tool:
         }
         headers = {"Authorization": f"Bearer {self.api_key}"}
 
-        async with httpx.AsyncClient(timeout=45.0) as client:
+        async with CONTEXT7_LIMITER.aslot():
             try:
-                response = await client.get(f"{self.base_url}/context", params=params, headers=headers)
+                response = await _client().get(f"{self.base_url}/context", params=params, headers=headers)
                 response.raise_for_status()
                 return response.text
             except Exception as e:
                 logger.error(f"Error Context7: {e}")
                 return {}
 
+    @traced("context7")
     async def _resolve_library_id(self, library_name: str) -> Optional[str]:
-        if library_name in self.library_ids:
-            return self.library_ids[library_name]
-
         logger.info(f"Search for technical ID for '{library_name}'...")
 
         params = {
@@ -57,16 +78,16 @@ class Context7Tool:
         }
         headers = {"Authorization": f"Bearer {self.api_key}"}
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        async with CONTEXT7_LIMITER.aslot():
             try:
-                resp = await client.get(f"{self.base_url}/libs/search", params=params, headers=headers)
+                resp = await _client().get(f"{self.base_url}/libs/search", params=params, headers=headers,
+                                           timeout=30.0)
                 resp.raise_for_status()
                 data = resp.json()
 
                 results = data.get("results", [])
                 if results:
                     found_id = results[0]["id"]
-                    self.library_ids[library_name] = found_id
                     logger.info(f"Founded ID: {found_id}")
                     return found_id
 
@@ -0,0 +1,136 @@
+import re
+import math
+from collections import Counter
+from typing import Dict, List
+
+CHARS_PER_TOKEN = 4
+DOC_TOKEN_BUDGET = 1500
+TOP_K_SECTIONS = 6
+MAX_SECTION_CHARS = 4000
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+ELEMENT_WEIGHT = 3.0
+MIGRATION_WEIGHT = 1.0
+MIGRATION_TERMS = ["deprecated", "deprecation", "removed", "removal", "renamed", "changed", "replace",
+                   "replaced", "instead", "migration", "migrate", "breaking"]
+
+SEPARATOR = re.compile(r"^\s*-{5,}\s*$", re.M)
+HEADING = re.compile(r"^(?=#{1,6} )", re.M)
+WORD = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased identifiers; snake_case names also yield their parts (read_csv -> read_csv, read, csv).
+    """
+    tokens = []
+    for word in WORD.findall(text.lower()):
+        tokens.append(word)
+        if "_" in word:
+            tokens.extend(part for part in word.split("_") if part)
+    return tokens
+
+
+def split_sections(text: str, max_chars: int = MAX_SECTION_CHARS) -> List[str]:
+    """
+    Splits Context7 text on snippet separators (-----) and markdown headings.
+    Sections that are still too long are cut at blank lines outside code fences.
+    """
+    sections = []
+    for block in SEPARATOR.split(text):
+        for part in HEADING.split(block):
+            part = part.strip()
+            if not part:
+                continue
+            if len(part) <= max_chars:
+                sections.append(part)
+            else:
+                sections.extend(_split_paragraphs(part, max_chars))
+    return sections
+
+
+def _split_paragraphs(text: str, max_chars: int) -> List[str]:
+    chunks, current, size, in_code = [], [], 0, False
+    for line in text.splitlines():
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        current.append(line)
+        size += len(line) + 1
+
+        at_break = not in_code and not line.strip() and size >= max_chars // 2
+        if at_break or size >= max_chars * 2:
+            chunks.append("\n".join(current).strip())
+            current, size = [], 0
+
+    if current:
+        chunks.append("\n".join(current).strip())
+    return [chunk for chunk in chunks if chunk]
+
+
+def bm25_scores(query: Dict[str, float], documents: List[List[str]]) -> List[float]:
+    """
+    Okapi BM25 with per-term query weights.
+    """
+    if not documents:
+        return []
+
+    avg_length = sum(len(doc) for doc in documents) / len(documents) or 1.0
+    document_frequency = Counter(term for doc in documents for term in set(doc))
+    total = len(documents)
+
+    scores = []
+    for doc in documents:
+        frequencies = Counter(doc)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(doc) / avg_length)
+        score = 0.0
+        for term, weight in query.items():
+            tf = frequencies.get(term, 0)
+            if not tf:
+                continue
+            df = document_frequency[term]
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            score += weight * idf * tf * (BM25_K1 + 1) / (tf + norm)
+        scores.append(score)
+    return scores
+
+
+def element_query(element: str) -> Dict[str, float]:
+    query = {term: MIGRATION_WEIGHT for term in MIGRATION_TERMS}
+    for term in tokenize(element):
+        query[term] = ELEMENT_WEIGHT
+    return query
+
+
+def rank_sections(text: str, element: str, token_budget: int = DOC_TOKEN_BUDGET,
+                  top_k: int = TOP_K_SECTIONS) -> str:
+    """
+    Keeps the top-k sections most relevant to element that fit into token_budget, in their original order.
+    Text already within budget is returned unchanged.
+    """
+    if not isinstance(text, str) or len(text) <= token_budget * CHARS_PER_TOKEN:
+        return text
+
+    sections = split_sections(text)
+    scores = bm25_scores(element_query(element), [tokenize(section) for section in sections])
+    ranked = sorted(range(len(sections)), key=lambda index: scores[index], reverse=True)
+
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    chosen, used = [], 0
+    for index in ranked:
+        if len(chosen) >= top_k:
+            break
+        if scores[index] <= 0 and chosen:
+            break
+        section = sections[index]
+        if used + len(section) > budget_chars:
+            if chosen:
+                continue
+            section = section[:budget_chars]
+        chosen.append(index)
+        used += len(section)
+
+    return "\n\n--------------------------------\n\n".join(
+        sections[index][:budget_chars] for index in sorted(chosen)
+    )
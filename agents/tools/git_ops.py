@@ -3,10 +3,15 @@ import os
 import logging
 import shutil
 
+from agents.tools.telemetry import traced
+
 logger = logging.getLogger(__name__)
 
+MIGRATION_BRANCH = "fix/ai-library-migration"
+
 
-def init_migration_branch(path: str):
+@traced("git")
+def init_migration_branch(path: str, resume: bool = False):
     subprocess.run(["git", "config", "--global", "--add", "safe.directory", path], check=True)
 
     if not os.path.exists(path) or not os.listdir(path):
@@ -25,16 +30,28 @@ def init_migration_branch(path: str):
         status = subprocess.run(["git", "-C", path, "status", "--porcelain"],
                                 capture_output=True, text=True, check=True)
 
-        if status.stdout.strip():
-            logger.info("Found uncommitted changes. Running 'git stash'...")
-            subprocess.run(["git", "-C", path, "stash"], check=True)
-            logger.info("'git stash' successfully executed!")
+        # Untracked files (the run directory among them) stay where they are.
+        tracked = [line for line in status.stdout.splitlines() if line.strip() and not line.startswith("??")]
+        if tracked:
+            # On --resume these are usually the half-applied edits of the interrupted task, which is redone.
+            label = f"ai-migrator: uncommitted changes before {'resuming' if resume else 'migrating'}"
+            subprocess.run(["git", "-C", path, "stash", "push", "-m", label],
+                           check=True, capture_output=True)
+            logger.warning(f"Stashed {len(tracked)} uncommitted changes in {path} as stash@{{0}} ({label}). "
+                           f"Restore them with 'git stash pop' after the run.")
 
         subprocess.run(["git", "-C", path, "config", "user.email", "agent@ai.com"], check=True)
         subprocess.run(["git", "-C", path, "config", "user.name", "AI Migrator Agent"], check=True)
 
-        branch_name = "fix/ai-library-migration"
-        subprocess.run(["git", "-C", path, "checkout", "-B", branch_name], check=True)
+        branch_name = MIGRATION_BRANCH
+        if resume:
+            exists = subprocess.run(["git", "-C", path, "rev-parse", "--verify", "--quiet", branch_name],
+                                    capture_output=True)
+            if exists.returncode != 0:
+                raise Exception(f"Cannot resume: branch {branch_name} does not exist in {path}.")
+            subprocess.run(["git", "-C", path, "checkout", branch_name], check=True)
+        else:
+            subprocess.run(["git", "-C", path, "checkout", "-B", branch_name], check=True)
 
         logger.info(f"Switched to branch: {branch_name}")
 
@@ -43,7 +60,116 @@ def init_migration_branch(path: str):
         raise
 
 
-def create_commit(path: str, title: str, description: str = None):
+@traced("git")
+def get_head_commit(path: str) -> str:
+    try:
+        res = subprocess.run(["git", "-C", path, "rev-parse", "HEAD"],
+                             capture_output=True, text=True, check=True)
+        return res.stdout.strip()
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Failed to resolve HEAD: {e}")
+        return ""
+
+
+@traced("git")
+def list_commits_since(path: str, base_commit: str) -> list:
+    """
+    Returns commits in base_commit..HEAD, oldest first.
+    """
+    try:
+        res = subprocess.run(["git", "-C", path, "rev-list", "--reverse", f"{base_commit}..HEAD"],
+                             capture_output=True, text=True, check=True)
+        return [line for line in res.stdout.splitlines() if line.strip()]
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Failed to list commits since {base_commit}: {e}")
+        return []
+
+
+@traced("git")
+def revert_commits_since(path: str, base_commit: str) -> list:
+    """
+    Reverts every commit in base_commit..HEAD with revert commits, so the history stays auditable.
+    Returns the list of reverted commits.
+    """
+    commits = list_commits_since(path, base_commit)
+    if not commits:
+        return []
+
+    try:
+        subprocess.run(["git", "-C", path, "revert", "--no-edit", f"{base_commit}..HEAD"],
+                       check=True, capture_output=True)
+        logger.info(f"Reverted {len(commits)} commits since {base_commit[:8]}.")
+        return commits
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Failed to revert commits since {base_commit}: {e}")
+        subprocess.run(["git", "-C", path, "revert", "--abort"], capture_output=True)
+        return []
+
+
+@traced("git")
+def revert_commit(path: str, commit: str) -> bool:
+    try:
+        subprocess.run(["git", "-C", path, "revert", "--no-edit", commit],
+                       check=True, capture_output=True)
+        logger.info(f"Reverted commit {commit[:8]}.")
+        return True
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Failed to revert commit {commit}: {e}")
+        subprocess.run(["git", "-C", path, "revert", "--abort"], capture_output=True)
+        return False
+
+
+@traced("git")
+def get_commit_diff(path: str, commit: str) -> str:
+    """
+    Returns the diff a commit introduced, without context lines, or "" if it cannot be read.
+    Bytes that are not UTF-8 are replaced rather than failing the whole diff.
+    """
+    try:
+        res = subprocess.run(["git", "-C", path, "show", "--format=", "--unified=0", "--no-color", "--no-renames",
+                              commit], capture_output=True, text=True, errors="replace", check=True)
+        return res.stdout
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Failed to read the diff of {commit}: {e}")
+        return ""
+
+
+@traced("git")
+def read_file_at(path: str, commit: str, file_path: str):
+    """
+    Returns the content of file_path at commit, or None if it did not exist there.
+    """
+    res = subprocess.run(["git", "-C", path, "show", f"{commit}:{file_path}"],
+                         capture_output=True, text=True, errors="replace")
+    return res.stdout if res.returncode == 0 else None
+
+
+@traced("git")
+def add_worktree(path: str, worktree_path: str, commit: str):
+    subprocess.run(["git", "-C", path, "worktree", "add", "--detach", worktree_path, commit],
+                   check=True, capture_output=True)
+
+
+@traced("git")
+def checkout_worktree(worktree_path: str, commit: str):
+    subprocess.run(["git", "-C", worktree_path, "checkout", "--detach", "--force", commit],
+                   check=True, capture_output=True)
+
+
+@traced("git")
+def remove_worktree(path: str, worktree_path: str):
+    try:
+        subprocess.run(["git", "-C", path, "worktree", "remove", "--force", worktree_path],
+                       check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Failed to remove worktree {worktree_path}: {e}")
+
+
+@traced("git")
+def create_commit(path: str, title: str, description: str = None) -> str:
+    """
+    Commits all changes except Serena artifacts. Returns the new commit hash, or "" if nothing was committed.
+    """
     try:
         status = subprocess.run(
             ["git", "-C", path, "status", "--porcelain", "--", ".", ":!.serena"],
@@ -52,7 +178,7 @@ def create_commit(path: str, title: str, description: str = None):
 
         if not status.stdout.strip():
             logger.warning("There are no changes to the commit.")
-            return
+            return ""
 
         subprocess.run(["git", "-C", path, "add", ".", ":!.serena"], check=True)
 
@@ -62,9 +188,11 @@ def create_commit(path: str, title: str, description: str = None):
 
         subprocess.run(cmd, check=True)
         logger.info(f"Commit created: {title}")
+        return get_head_commit(path)
 
     except subprocess.CalledProcessError as e:
         logger.error(f"Failed to create commit: {e}")
+        return ""
 
 def cleanup_migration_artifacts(path: str):
     serena_path = os.path.join(path, ".serena")
@@ -1,7 +1,7 @@
 import json
 import os
 import logging
-from typing import List, Dict, Union
+from typing import Dict, Iterator, List, Union
 
 logger = logging.getLogger(__name__)
 
@@ -24,4 +24,54 @@ def save_json_file(path: str, data: Union[List, Dict]):
             json.dump(data, f, indent=2, ensure_ascii=False)
         logger.info(f"Saved data to {path}")
     except Exception as e:
-        logger.error(f"Failed to save JSON to {path}: {e}")
\ No newline at end of file
+        logger.error(f"Failed to save JSON to {path}: {e}")
+
+
+def iter_jsonl(path: str) -> Iterator[Dict]:
+    """
+    Streams the records of a JSON Lines file without loading it whole.
+    Files ending in .json (runs started before usage records moved to JSON Lines) are loaded with load_json_file.
+    """
+    if path.endswith(".json"):
+        yield from load_json_file(path) or []
+        return
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"JSONL Load Error ({path}:{number}): {e}")
+
+
+class JsonlWriter:
+    """
+    Writes records to a JSON Lines file one at a time. The file is line-buffered, so a reader
+    iterating it while it is being written sees every complete record.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._file = None
+
+    def open(self) -> "JsonlWriter":
+        self._file = open(self.path, "w", encoding="utf-8", buffering=1)
+        return self
+
+    def write(self, record: Dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+        logger.info(f"Saved {self.count} records to {self.path}")
+
+    def __enter__(self) -> "JsonlWriter":
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
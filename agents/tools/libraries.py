@@ -0,0 +1,58 @@
+from typing import Dict, List, Optional, Union
+
+Names = Union[str, List[str], None]
+
+
+def _as_list(value: Names) -> List[str]:
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def parse_libraries(libraries: Names, old_versions: Names, new_versions: Names) -> List[Dict]:
+    """
+    Pairs repeated --lib/--from/--to (or the list values of a job) by position:
+    [{"library", "old_version", "new_version"}, ...] in the order given, which is the migration order.
+    """
+    libraries, old_versions, new_versions = _as_list(libraries), _as_list(old_versions), _as_list(new_versions)
+    if not (len(libraries) == len(old_versions) == len(new_versions)):
+        raise ValueError(f"Got {len(libraries)} libraries, {len(old_versions)} --from and {len(new_versions)} "
+                         f"--to versions. Give one --from and one --to per --lib.")
+    seen = set()
+    for library in libraries:
+        if library in seen:
+            raise ValueError(f"Library {library} is given twice.")
+        seen.add(library)
+    return [{"library": library, "old_version": old_version, "new_version": new_version}
+            for library, old_version, new_version in zip(libraries, old_versions, new_versions)]
+
+
+def state_libraries(state) -> List[Dict]:
+    """
+    The libraries of a run. Single-library runs only have library, old_version and new_version in their state.
+    """
+    if state.get("libraries"):
+        return state["libraries"]
+    return [{"library": state.get("library"), "old_version": state.get("old_version"),
+             "new_version": state.get("new_version")}]
+
+
+def library_spec(libraries: List[Dict], library: Optional[str]) -> Optional[Dict]:
+    return next((spec for spec in libraries if spec["library"] == library), None)
+
+
+def describe_libraries(libraries: List[Dict]) -> str:
+    return ", ".join(f"{spec['library']} {spec['old_version']} -> {spec['new_version']}" for spec in libraries)
+
+
+def prompt_fields(libraries: List[Dict], library: Optional[str] = None) -> Dict[str, str]:
+    """
+    library, old_version and new_version for a prompt template. Work that belongs to one library
+    (a pattern or its task) gets that library; work that spans all of them (fix tasks) gets every
+    library joined, e.g. "pandas and numpy" from "1.5.3 and 1.26.4" to "2.2.0 and 2.0.0".
+    """
+    spec = library_spec(libraries, library)
+    if spec is not None or len(libraries) == 1:
+        spec = spec or libraries[0]
+        return {"library": spec["library"], "old_version": spec["old_version"], "new_version": spec["new_version"]}
+    return {key: " and ".join(spec[key] for spec in libraries) for key in ("library", "old_version", "new_version")}
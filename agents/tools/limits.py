@@ -0,0 +1,144 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Limiter:
+    """
+    Process-wide concurrency, requests-per-minute and tokens-per-minute limit.
+    Works from sync code (graph nodes run in worker threads) and from async code alike.
+    """
+
+    def __init__(self, name: str, max_concurrency: int = 0, requests_per_minute: int = 0,
+                 tokens_per_minute: int = 0):
+        self.name = name
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._active = 0
+        # (loop, future) of async callers waiting for a concurrency slot; a released slot is handed to the first.
+        self._waiters: deque = deque()
+        self._next_slot = 0.0
+        self._next_token_slot = 0.0
+        self.configure(max_concurrency, requests_per_minute, tokens_per_minute)
+
+    def configure(self, max_concurrency: int = 0, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        """
+        0 means unlimited for all values.
+        """
+        with self._lock:
+            self.max_concurrency = max_concurrency
+            self.requests_per_minute = requests_per_minute
+            self.tokens_per_minute = tokens_per_minute
+            while self._waiters and (not max_concurrency or self._active < max_concurrency):
+                loop, waiter = self._waiters.popleft()
+                self._active += 1
+                loop.call_soon_threadsafe(self._hand_over, waiter)
+            self._released.notify_all()
+
+    def _acquire(self):
+        with self._lock:
+            while self.max_concurrency and self._active >= self.max_concurrency:
+                self._released.wait()
+            self._active += 1
+
+    async def _aacquire(self):
+        with self._lock:
+            if not self.max_concurrency or self._active < self.max_concurrency:
+                self._active += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if (loop, waiter) in self._waiters:
+                    self._waiters.remove((loop, waiter))
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before the cancellation.
+                self._release()
+            raise
+
+    def _release(self):
+        with self._lock:
+            if self._waiters and (not self.max_concurrency or self._active <= self.max_concurrency):
+                loop, waiter = self._waiters.popleft()
+                loop.call_soon_threadsafe(self._hand_over, waiter)
+                return
+            self._active -= 1
+            self._released.notify()
+
+    def _hand_over(self, waiter: asyncio.Future):
+        if waiter.done():
+            # Cancelled while the slot was on its way; pass it on.
+            self._release()
+        else:
+            waiter.set_result(None)
+
+    def _reserve_delay(self, tokens: int = 0) -> float:
+        if not self.requests_per_minute and not (self.tokens_per_minute and tokens):
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            delay = 0.0
+            if self.requests_per_minute:
+                slot = max(now, self._next_slot)
+                self._next_slot = slot + 60.0 / self.requests_per_minute
+                delay = slot - now
+            if self.tokens_per_minute and tokens:
+                slot = max(now, self._next_token_slot)
+                self._next_token_slot = slot + tokens * 60.0 / self.tokens_per_minute
+                delay = max(delay, slot - now)
+            return delay
+
+    def acquire(self, tokens: int = 0):
+        """
+        Takes a concurrency slot and waits for the rate limits. Every acquire() needs one release().
+        """
+        self._acquire()
+        delay = self._reserve_delay(tokens)
+        if delay:
+            time.sleep(delay)
+
+    def release(self):
+        self._release()
+
+    @contextmanager
+    def slot(self, tokens: int = 0):
+        self.acquire(tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, tokens: int = 0):
+        await self._aacquire()
+        try:
+            delay = self._reserve_delay(tokens)
+            if delay:
+                await asyncio.sleep(delay)
+            yield
+        finally:
+            self._release()
+
+
+LLM_LIMITER = Limiter("llm")
+CONTEXT7_LIMITER = Limiter("context7")
+
+
+def configure_limits(llm_concurrency: int = 0, llm_rpm: int = 0,
+                     context7_concurrency: int = 0, context7_rpm: int = 0, llm_tpm: int = 0):
+    LLM_LIMITER.configure(llm_concurrency, llm_rpm, llm_tpm)
+    CONTEXT7_LIMITER.configure(context7_concurrency, context7_rpm)
+    logger.info(
+        f"Limits: LLM concurrency={llm_concurrency or 'unlimited'}, rpm={llm_rpm or 'unlimited'}, "
+        f"tpm={llm_tpm or 'unlimited'}; "
+        f"Context7 concurrency={context7_concurrency or 'unlimited'}, rpm={context7_rpm or 'unlimited'}"
+    )
@@ -0,0 +1,284 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import SystemMessage
+
+from agents.tools.io.json_handlers import load_json_file
+from agents.tools.limits import LLM_LIMITER, Limiter
+from agents.tools.telemetry import current_metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+CHARS_PER_TOKEN = 4
+
+# 408/5xx timeouts, 429 rate limited and 529 overloaded are transient; everything else is the caller's problem.
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504, 529}
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+                    "OverloadedError", "ConnectError", "ReadTimeout", "RemoteProtocolError"}
+
+_lock = threading.Lock()
+_models: Dict[Tuple[str, float], ChatAnthropic] = {}
+_model_limiters: Dict[str, Limiter] = {}
+_hedge_after: Dict[str, float] = {}
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+
+def chat_model(model: str, temperature: float = 0) -> ChatAnthropic:
+    """
+    Returns the shared client for a model, so all nodes reuse one HTTP connection pool per model.
+    Retries are done by the gateway, not by the SDK.
+    """
+    key = (model, temperature)
+    with _lock:
+        if key not in _models:
+            _models[key] = ChatAnthropic(
+                model_name=model,
+                temperature=temperature,
+                api_key=os.getenv("ANTHROPIC_API_KEY"),
+                max_retries=0
+            )
+        return _models[key]
+
+
+def cached_block(text: str) -> Dict[str, Any]:
+    """
+    Text content block marked as a prompt-cache breakpoint: everything up to and including it
+    is cached and reused by later requests with the same prefix.
+    """
+    return {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+
+
+def cached_system_message(text: str) -> SystemMessage:
+    return SystemMessage(content=[cached_block(text)])
+
+
+def configure_model_limits(model: str, max_concurrency: int = 0, requests_per_minute: int = 0,
+                           tokens_per_minute: int = 0, hedge_after_seconds: float = 0):
+    """
+    Per-model limits on top of the global LLM limiter. 0 means unlimited / no hedging.
+    """
+    _model_limiter(model).configure(max_concurrency, requests_per_minute, tokens_per_minute)
+    _hedge_after[model] = hedge_after_seconds
+    logger.info(
+        f"LLM gateway: {model} concurrency={max_concurrency or 'unlimited'}, "
+        f"rpm={requests_per_minute or 'unlimited'}, tpm={tokens_per_minute or 'unlimited'}, "
+        f"hedge after={hedge_after_seconds or 'off'}"
+    )
+
+
+def load_model_limits(path: str):
+    """
+    Reads per-model limits from JSON: {"<model>": {"concurrency": 4, "rpm": 50, "tpm": 40000, "hedge_after": 30}}.
+    """
+    limits = load_json_file(path)
+    if not isinstance(limits, dict) or not limits:
+        raise ValueError(f"Model limits file {path} must be a non-empty JSON object keyed by model name.")
+
+    for model, values in limits.items():
+        if not isinstance(values, dict):
+            raise ValueError(f"Model limits file {path}: the limits of {model} must be an object like "
+                             f'{{"concurrency": 4, "rpm": 50}}, got {values!r}.')
+        unknown = set(values) - {"concurrency", "rpm", "tpm", "hedge_after"}
+        if unknown:
+            raise ValueError(f"Model limits file {path}: unknown keys for {model}: {', '.join(sorted(unknown))}.")
+        try:
+            configure_model_limits(
+                model,
+                max_concurrency=int(values.get("concurrency", 0)),
+                requests_per_minute=int(values.get("rpm", 0)),
+                tokens_per_minute=int(values.get("tpm", 0)),
+                hedge_after_seconds=float(values.get("hedge_after", 0))
+            )
+        except (TypeError, ValueError):
+            raise ValueError(f"Model limits file {path}: the limits of {model} must be numbers, got {values!r}.")
+
+
+def _model_limiter(model: str) -> Limiter:
+    with _lock:
+        if model not in _model_limiters:
+            _model_limiters[model] = Limiter(f"llm:{model}")
+        return _model_limiters[model]
+
+
+def _estimate_tokens(payload: Any) -> int:
+    if isinstance(payload, list):
+        text = "".join(str(getattr(message, "content", message)) for message in payload)
+    else:
+        text = str(payload)
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def _backoff_delay(attempt: int, error: Exception) -> float:
+    # Full jitter keeps many concurrent callers from retrying in lockstep.
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        delay = retry_after + random.uniform(0, BACKOFF_BASE_SECONDS)
+    return delay
+
+
+def _should_retry(attempt: int, error: Exception, model: str) -> Optional[float]:
+    if attempt + 1 >= MAX_ATTEMPTS or not _is_retryable(error):
+        return None
+    delay = _backoff_delay(attempt, error)
+    current_metrics().count("retries.llm")
+    logger.warning(f"LLM gateway: {model} call failed ({type(error).__name__}: {error}). "
+                   f"Retry {attempt + 1}/{MAX_ATTEMPTS - 1} in {delay:.1f}s.")
+    return delay
+
+
+class _Lease:
+    """
+    The limiter slots of one request. They are released once: when the request finishes, or earlier
+    when a hedged twin has already won and the request is only left running because a thread cannot be cancelled.
+    """
+
+    def __init__(self, limiters: Tuple[Limiter, ...], tokens: int):
+        self._limiters: List[Limiter] = []
+        self._lock = threading.Lock()
+        for limiter in limiters:
+            limiter.acquire(tokens)
+            self._limiters.append(limiter)
+
+    def release(self):
+        with self._lock:
+            limiters, self._limiters = self._limiters, []
+        for limiter in reversed(limiters):
+            limiter.release()
+
+
+def invoke(runnable, payload: Any, model: str, config: Optional[Dict] = None) -> Any:
+    """
+    Invokes a model (or a chain ending in one) under the global and per-model limits,
+    retrying transient errors with backoff and hedging slow calls if configured.
+    """
+    tokens = _estimate_tokens(payload)
+    limiter = _model_limiter(model)
+
+    def attempt_once(leases: List[_Lease]):
+        lease = _Lease((LLM_LIMITER, limiter), tokens)
+        leases.append(lease)
+        try:
+            return runnable.invoke(payload, config=config)
+        finally:
+            lease.release()
+
+    attempt = 0
+    while True:
+        try:
+            return _hedged(attempt_once, _hedge_after.get(model, 0), model)
+        except Exception as e:
+            delay = _should_retry(attempt, e, model)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+
+async def ainvoke(runnable, payload: Any, model: str, config: Optional[Dict] = None) -> Any:
+    """
+    Async counterpart of invoke().
+    """
+    tokens = _estimate_tokens(payload)
+    limiter = _model_limiter(model)
+
+    async def attempt_once():
+        async with LLM_LIMITER.aslot(tokens), limiter.aslot(tokens):
+            return await runnable.ainvoke(payload, config=config)
+
+    attempt = 0
+    while True:
+        try:
+            return await _ahedged(attempt_once, _hedge_after.get(model, 0), model)
+        except Exception as e:
+            delay = _should_retry(attempt, e, model)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def _hedged(call: Callable[[List[_Lease]], Any], hedge_after: float, model: str) -> Any:
+    leases: List[_Lease] = []
+    if not hedge_after:
+        return call(leases)
+
+    # Callbacks (token tracking, telemetry) live in context variables; carry them into the worker threads.
+    primary = _hedge_pool.submit(contextvars.copy_context().run, call, leases)
+    done, _ = wait([primary], timeout=hedge_after)
+    if done:
+        return primary.result()
+
+    logger.info(f"LLM gateway: {model} call slower than {hedge_after}s. Sending a hedged request.")
+    current_metrics().count("hedges.llm")
+    pending = {primary, _hedge_pool.submit(contextvars.copy_context().run, call, leases)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                # The slower request cannot be cancelled once running; its result is discarded and
+                # its limiter slots go to the next caller right away.
+                for lease in list(leases):
+                    lease.release()
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def _ahedged(call: Callable[[], Any], hedge_after: float, model: str) -> Any:
+    if not hedge_after:
+        return await call()
+
+    primary = asyncio.ensure_future(call())
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+    if done:
+        return primary.result()
+
+    logger.info(f"LLM gateway: {model} call slower than {hedge_after}s. Sending a hedged request.")
+    current_metrics().count("hedges.llm")
+    pending = {primary, asyncio.ensure_future(call())}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
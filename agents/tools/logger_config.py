@@ -1,6 +1,8 @@
 ﻿import logging
 import os
 
+LOG_PATH = "agent.log"
+
 
 def setup_logger():
     """
@@ -25,6 +27,8 @@ def setup_logger():
         force=True
     )
 
+    global LOG_PATH
+    LOG_PATH = log_filename
     print(f"Logs are written to: {log_filename}")
 
     return logging.getLogger(__name__)
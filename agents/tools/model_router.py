@@ -0,0 +1,126 @@
+import re
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+from agents.tools.telemetry import CURRENT_ROUTE, current_metrics
+
+logger = logging.getLogger(__name__)
+
+FAST_MODEL = "claude-haiku-4-5-20251001"
+BALANCED_MODEL = "claude-sonnet-4-5-20250929"
+TOP_MODEL = "claude-opus-4-6"
+
+# Thresholds are in characters of prompt context. run_metrics.json reports calls and failures
+# per route and model, which is what they should be tuned against.
+SMALL_CONTEXT_CHARS = 12_000
+LARGE_CONTEXT_CHARS = 60_000
+MAX_FAST_FILES = 3
+MAX_BALANCED_FILES = 8
+
+MECHANICAL_HINTS = re.compile(r"\b(renam\w*|argument|parameter|keyword|kwarg|import|alias|spelling|moved to)\b", re.I)
+SEMANTIC_HINTS = re.compile(r"\b(behaviou?r|logic|semantic\w*|return type|restructur\w*|rewrite|no longer returns)\b",
+                            re.I)
+
+T = TypeVar("T")
+
+_routing_enabled = True
+
+
+def set_routing(enabled: bool):
+    """
+    With routing disabled every call goes to the top model, as before.
+    """
+    global _routing_enabled
+    _routing_enabled = enabled
+
+
+def classify_task(task: Dict) -> str:
+    """
+    "mechanical" for renames and signature tweaks, "semantic" for everything that changes behaviour.
+    """
+    text = f"{task.get('title', '')}\n{task.get('description', '')}"
+    if MECHANICAL_HINTS.search(text) and not SEMANTIC_HINTS.search(text):
+        return "mechanical"
+    return "semantic"
+
+
+def choose_model(route: str, signals: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Picks a model tier for one request. Returns (model, reason).
+    """
+    if not _routing_enabled:
+        return TOP_MODEL, "routing disabled"
+    if signals.get("attempts", 1) > 1:
+        return TOP_MODEL, "task is being retried"
+
+    chars = signals.get("chars", 0)
+    files = signals.get("files", 1)
+
+    if route == "discovery":
+        return FAST_MODEL, "single short question"
+
+    if route in ("extraction", "refine"):
+        if chars <= SMALL_CONTEXT_CHARS:
+            return FAST_MODEL, "small input"
+        if chars <= LARGE_CONTEXT_CHARS:
+            return BALANCED_MODEL, "medium input"
+        return TOP_MODEL, "large input"
+
+    if route == "planning":
+        return BALANCED_MODEL, "planning batch"
+
+    if route == "fixing":
+        if signals.get("fix_iteration", 0) > 1:
+            return TOP_MODEL, "repeated fix iteration"
+        return BALANCED_MODEL, "first fix iteration"
+
+    if route == "code":
+        if chars > LARGE_CONTEXT_CHARS or files > MAX_BALANCED_FILES:
+            return TOP_MODEL, "large change set"
+        if signals.get("kind") == "mechanical" and chars <= SMALL_CONTEXT_CHARS and files <= MAX_FAST_FILES:
+            return FAST_MODEL, "small mechanical edit"
+        return BALANCED_MODEL, "regular edit"
+
+    return TOP_MODEL, "unknown route"
+
+
+def call_routed(route: str, signals: Dict[str, Any], call: Callable[[str], T]) -> T:
+    """
+    Runs call(model) on the chosen tier. If it fails (invalid structured output, bad tool call,
+    or errors left after the gateway's own retries) it is repeated once on the top model,
+    unless the error says another model cannot help (escalate = False, e.g. a replay miss).
+    """
+    model, reason = choose_model(route, signals)
+    token = CURRENT_ROUTE.set(route)
+    try:
+        while True:
+            try:
+                with current_metrics().span(route, "route", model=model, reason=reason, **signals):
+                    return call(model)
+            except Exception as e:
+                if model == TOP_MODEL or not getattr(e, "escalate", True):
+                    raise
+                logger.warning(f"Router: {route} on {model} failed ({e}). Escalating to {TOP_MODEL}.")
+                model, reason = TOP_MODEL, f"escalated from {model}"
+    finally:
+        CURRENT_ROUTE.reset(token)
+
+
+async def acall_routed(route: str, signals: Dict[str, Any], call: Callable[[str], Awaitable[T]]) -> T:
+    """
+    Async counterpart of call_routed().
+    """
+    model, reason = choose_model(route, signals)
+    token = CURRENT_ROUTE.set(route)
+    try:
+        while True:
+            try:
+                async with current_metrics().aspan(route, "route", model=model, reason=reason, **signals):
+                    return await call(model)
+            except Exception as e:
+                if model == TOP_MODEL or not getattr(e, "escalate", True):
+                    raise
+                logger.warning(f"Router: {route} on {model} failed ({e}). Escalating to {TOP_MODEL}.")
+                model, reason = TOP_MODEL, f"escalated from {model}"
+    finally:
+        CURRENT_ROUTE.reset(token)
@@ -0,0 +1,210 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import functools
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL_SECONDS = 0.01
+MAX_STACK_DEPTH = 80
+TOP_N = 25
+MEMORY_FRAMES = 1
+MIN_SNAPSHOT_SECONDS = 10
+OTHER = "other"
+
+# Leaf frames of threads that are waiting (event loop, locks, queues, sockets, subprocesses), not using CPU.
+IDLE_LEAVES = {
+    ("selectors.py", "select"), ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"), ("socket.py", "readinto"), ("ssl.py", "read"), ("ssl.py", "recv_into"),
+    ("subprocess.py", "_communicate"), ("subprocess.py", "_wait"), ("thread.py", "_worker"),
+    ("socketserver.py", "serve_forever"), ("subprocess.py", "_try_wait"), ("core.py", "_connection_worker_thread")
+}
+
+ACTIVE: Optional["Profiler"] = None
+
+
+class Profiler:
+    """
+    Low-overhead profiler for a whole run.
+    A background thread samples the Python stacks of all threads every SAMPLE_INTERVAL_SECONDS and
+    attributes them to the graph node that is running; tool calls made by the node (LLM, Serena,
+    git, ruff) show up inside its stacks. RSS is recorded at every node boundary.
+    With memory=True, tracemalloc also takes a snapshot at every boundary. That slows down
+    allocation-heavy code several times, so it is meant for chasing a memory problem, not for every run.
+    """
+
+    def __init__(self, output_dir: str, interval: float = SAMPLE_INTERVAL_SECONDS, top_n: int = TOP_N,
+                 memory: bool = False):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.top_n = top_n
+        self.memory = memory
+
+        self._stacks: Dict[str, Counter] = {}
+        self._idle: Counter = Counter()
+        self._nodes: List[str] = []
+        self._memory_report: List[str] = []
+        self._snapshot = None
+        self._snapshot_at = 0.0
+        self._invocations: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        global ACTIVE
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(MEMORY_FRAMES)
+        self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+        self._thread.start()
+        ACTIVE = self
+        logger.info(f"Profiler: Sampling every {self.interval * 1000:.0f} ms, memory snapshots "
+                    f"{'on' if self.memory else 'off'}.")
+
+    def stop(self) -> str:
+        global ACTIVE
+        ACTIVE = None
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._write()
+        return self.output_dir
+
+    @contextmanager
+    def node(self, name: str):
+        with self._lock:
+            self._nodes.append(name)
+            self._invocations[name] += 1
+            invocation = self._invocations[name]
+        if tracemalloc.is_tracing():
+            if self._snapshot is None:
+                self._snapshot, self._snapshot_at = tracemalloc.take_snapshot(), time.time()
+            tracemalloc.reset_peak()
+        rss_before = _rss_mb()
+        started = time.time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._nodes.remove(name)
+            self._record_memory(name, invocation, rss_before, time.time() - started)
+
+    def _active_node(self) -> str:
+        with self._lock:
+            return self._nodes[-1] if self._nodes else OTHER
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            node = self._active_node()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = _stack(frame)
+                if stack[-1][0] in IDLE_LEAVES:
+                    self._idle[node] += 1
+                    continue
+                folded = ";".join(label for _, label in stack)
+                self._stacks.setdefault(node, Counter())[folded] += 1
+
+    def _record_memory(self, name: str, invocation: int, rss_before: float, seconds: float):
+        rss_after = _rss_mb()
+        lines = [f"== {name} #{invocation} ({seconds:.1f}s): RSS {rss_before:.1f} -> {rss_after:.1f} MB"]
+
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            lines[0] += f", traced {current / 2 ** 20:.1f} MB, peak {peak / 2 ** 20:.1f} MB"
+            # Snapshots cost about a second per 50 MB traced, so short node runs (one coder task) are
+            # folded into the next snapshot; growth is measured since the previous one.
+            if time.time() - self._snapshot_at >= MIN_SNAPSHOT_SECONDS:
+                snapshot = tracemalloc.take_snapshot()
+                for stat in snapshot.compare_to(self._snapshot, "lineno")[:self.top_n]:
+                    if stat.size_diff:
+                        lines.append(f"  {stat.size_diff / 1024:+10.1f} KB {stat.count_diff:+8d} blocks  "
+                                     f"{stat.traceback}")
+                self._snapshot, self._snapshot_at = snapshot, time.time()
+
+        self._memory_report.append("\n".join(lines))
+
+    def _write(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        for node, stacks in self._stacks.items():
+            with open(os.path.join(self.output_dir, f"{node}.folded"), "w", encoding="utf-8") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+            with open(os.path.join(self.output_dir, f"{node}.txt"), "w", encoding="utf-8") as f:
+                f.write(self._top_report(node, stacks))
+        if self._memory_report:
+            with open(os.path.join(self.output_dir, "memory.txt"), "w", encoding="utf-8") as f:
+                f.write("\n\n".join(self._memory_report) + "\n")
+
+    def _top_report(self, node: str, stacks: Counter) -> str:
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for label in set(frames):
+                total_counts[label] += count
+
+        samples = sum(stacks.values())
+        lines = [f"{node}: {samples} busy samples ({samples * self.interval:.1f}s), "
+                 f"{self._idle[node]} waiting (I/O, locks, subprocesses)", "", "Top by own time:"]
+        lines += [f"  {count / samples:6.1%}  {label}" for label, count in self_counts.most_common(self.top_n)]
+        lines += ["", "Top by total time:"]
+        lines += [f"  {count / samples:6.1%}  {label}" for label, count in total_counts.most_common(self.top_n)]
+        return "\n".join(lines) + "\n"
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        import resource
+        # Peak RSS: KB on Linux, bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def _stack(frame) -> List[Tuple[Tuple[str, str], str]]:
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        stack.append(((filename, code.co_name), f"{code.co_name} ({filename}:{code.co_firstlineno})"))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def profiled(name: str):
+    """
+    Decorator that attributes a sync or async graph node to the active profiler, if any.
+    """
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if ACTIVE is None:
+                    return await func(*args, **kwargs)
+                with ACTIVE.node(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if ACTIVE is None:
+                return func(*args, **kwargs)
+            with ACTIVE.node(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
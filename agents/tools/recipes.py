@@ -0,0 +1,467 @@
+import io
+import os
+import re
+import ast
+import time
+import keyword
+import logging
+import builtins
+import threading
+import tokenize
+from string import Template
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from agents.searcher.symbol_resolver import is_foreign, resolve_symbols
+from agents.tools.advice_pack import pack_key
+from agents.tools.git_ops import get_commit_diff, read_file_at
+from agents.tools.io.json_handlers import iter_jsonl, load_json_file, save_json_file
+from agents.tools.response_cache import CACHE_ROOT
+from agents.tools.telemetry import current_metrics
+
+logger = logging.getLogger(__name__)
+
+RECIPES_PATH = os.path.join(CACHE_ROOT, "recipes.json")
+RECIPE_FORMAT = 1
+# A recipe is replayed once it was green in this many runs and at least MIN_CONFIDENCE of its uses were green.
+MIN_SUCCESSES = 2
+MIN_CONFIDENCE = 0.75
+MAX_RULES = 20
+
+# What a slot of a rule matches in another repository: a name, a number or a one-line string literal.
+SLOT_PATTERN = r"""(?:[A-Za-z_]\w*|\d[\w.]*|[rRbBuU]{0,2}(?:"[^"\n]*"|'[^'\n]*'))"""
+PLACEHOLDER = re.compile(r"\$(?:(\$)|\{(\w+)\})")
+SKIPPED_TOKENS = {tokenize.NEWLINE, tokenize.NL, tokenize.ENDMARKER, tokenize.INDENT, tokenize.DEDENT}
+BUILTIN_NAMES = set(dir(builtins))
+OPENING, CLOSING = "([{", ")]}"
+
+
+def recipe_key(library: str, old_version: str, new_version: str, symbol: str) -> str:
+    return "|".join((*pack_key(library, old_version, new_version), symbol))
+
+
+def confidence(recipe: Dict) -> float:
+    uses = recipe.get("successes", 0) + recipe.get("failures", 0)
+    return recipe.get("successes", 0) / uses if uses else 0.0
+
+
+def is_usable(recipe: Optional[Dict]) -> bool:
+    return bool(recipe and recipe.get("rules") and recipe.get("successes", 0) >= MIN_SUCCESSES
+                and confidence(recipe) >= MIN_CONFIDENCE)
+
+
+class RecipeStore:
+    """
+    Rewrite recipes learned from green task commits, keyed by library, versions and qualified symbol.
+    Shared by every run of the process (the repositories of a fleet) and saved to a JSON file,
+    so later runs and later processes replay them instead of asking the LLM again.
+    """
+
+    def __init__(self, path: str = RECIPES_PATH):
+        self.path = path
+        self._recipes: Optional[Dict[str, Dict]] = None
+        self._lock = threading.Lock()
+
+    def _loaded(self) -> Dict[str, Dict]:
+        if self._recipes is None:
+            data = load_json_file(self.path) if os.path.exists(self.path) else {}
+            if isinstance(data, dict) and data.get("format") == RECIPE_FORMAT:
+                self._recipes = data.get("recipes", {})
+            else:
+                if data:
+                    logger.warning(f"Recipes: Ignoring {self.path}, expected recipe format {RECIPE_FORMAT}.")
+                self._recipes = {}
+        return self._recipes
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            return self._loaded().get(key)
+
+    def learn(self, spec: Dict, symbol: str, rules: List[Dict]):
+        """
+        Adds the rules of one green commit to the recipe of symbol, which counts as a success.
+        """
+        key = recipe_key(spec["library"], spec["old_version"], spec["new_version"], symbol)
+        with self._lock:
+            recipe = self._loaded().setdefault(key, {
+                "library": spec["library"], "old_version": spec["old_version"], "new_version": spec["new_version"],
+                "symbol": symbol, "rules": [], "successes": 0, "failures": 0
+            })
+            for rule in rules:
+                if rule not in recipe["rules"] and len(recipe["rules"]) < MAX_RULES:
+                    recipe["rules"].append(rule)
+            recipe["successes"] += 1
+            recipe["updated_at"] = int(time.time())
+
+    def record(self, key: str, success: bool):
+        with self._lock:
+            recipe = self._loaded().get(key)
+            if recipe is None:
+                return
+            recipe["successes" if success else "failures"] += 1
+            recipe["updated_at"] = int(time.time())
+
+    def save(self):
+        with self._lock:
+            if self._recipes is None:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            save_json_file(self.path, {"format": RECIPE_FORMAT, "recipes": dict(sorted(self._recipes.items()))})
+
+
+_store: Optional[RecipeStore] = RecipeStore()
+
+
+def configure_recipes(enabled: bool = True, path: str = RECIPES_PATH):
+    """
+    Turns recipe replay and learning on or off and sets the file the recipes are kept in.
+    """
+    global _store
+    _store = RecipeStore(path) if enabled else None
+
+
+def current_recipes() -> Optional[RecipeStore]:
+    return _store
+
+
+def import_bindings(content: str, module: str) -> Tuple[Set[str], Set[str]]:
+    """
+    (names bound to the module itself, names imported from it) in a file:
+    `import pandas as pd` binds pd, `from pandas import concat` imports concat.
+    """
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return set(), set()
+
+    aliases, imported = set(), set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name == module or (not alias.asname and alias.name.split(".")[0] == module):
+                    aliases.add(alias.asname or module)
+        elif isinstance(node, ast.ImportFrom) and node.module and node.module.split(".")[0] == module:
+            imported.update(alias.asname or alias.name for alias in node.names)
+    return aliases, imported
+
+
+def _tokens(line: str) -> Optional[List[tokenize.TokenInfo]]:
+    try:
+        return [token for token in tokenize.generate_tokens(io.StringIO(line).readline)
+                if token.type not in SKIPPED_TOKENS]
+    except (tokenize.TokenError, SyntaxError):
+        # Part of a statement that spans several lines.
+        return None
+
+
+def _roles(tokens: List[tokenize.TokenInfo], aliases: Set[str], imported: Set[str]) -> List[str]:
+    """
+    "lib" for the module alias, "slot" for tokens a rule may generalize (variables and literals),
+    "" for tokens that must match literally (API names, keyword arguments, operators).
+    """
+    roles, depth = [], 0
+    for index, token in enumerate(tokens):
+        previous = tokens[index - 1].string if index else ""
+        following = tokens[index + 1].string if index + 1 < len(tokens) else ""
+        if token.string in OPENING:
+            depth += 1
+        elif token.string in CLOSING:
+            depth -= 1
+
+        if token.type == tokenize.NAME and previous != ".":
+            if token.string in aliases:
+                roles.append("lib")
+            elif (keyword.iskeyword(token.string) or token.string in BUILTIN_NAMES or token.string in imported
+                  or (depth > 0 and following == "=")):
+                roles.append("")
+            else:
+                roles.append("slot")
+        elif token.type in (tokenize.NUMBER, tokenize.STRING):
+            roles.append("slot")
+        else:
+            roles.append("")
+    return roles
+
+
+def _template(line: str, tokens: List[tokenize.TokenInfo], roles: List[str], slots: Dict[str, str]) -> str:
+    parts, position = [], 0
+    for token, role in zip(tokens, roles):
+        parts.append(line[position:token.start[1]].replace("$", "$$"))
+        if role == "lib":
+            parts.append("${lib}")
+        elif role == "slot" and token.string in slots:
+            parts.append("${" + slots[token.string] + "}")
+        else:
+            parts.append(token.string.replace("$", "$$"))
+        position = token.end[1]
+    parts.append(line[position:].replace("$", "$$"))
+    return "".join(parts)
+
+
+def generalize(before: str, after: str, method: str, aliases: Set[str], imported: Set[str]) -> Optional[Dict]:
+    """
+    Turns one rewritten line into a rule {"before", "after"}: the module alias becomes ${lib}, and variables
+    and literals kept by the rewrite become slots ${v0}, ${v1}, ... Returns None if the line is not a whole
+    statement, does not use method, or only changed its formatting.
+    """
+    before_tokens, after_tokens = _tokens(before), _tokens(after)
+    if not before_tokens or not after_tokens:
+        return None
+    if not any(token.type == tokenize.NAME and token.string == method for token in before_tokens):
+        return None
+    if [token.string for token in before_tokens] == [token.string for token in after_tokens]:
+        return None
+
+    before_roles, after_roles = _roles(before_tokens, aliases, imported), _roles(after_tokens, aliases, imported)
+    kept = {token.string for token, role in zip(after_tokens, after_roles) if role == "slot"}
+    slots: Dict[str, str] = {}
+    for token, role in zip(before_tokens, before_roles):
+        if role == "slot" and token.string in kept and token.string not in slots:
+            slots[token.string] = f"v{len(slots)}"
+
+    rule = {
+        "before": _template(before, before_tokens, before_roles, slots),
+        "after": _template(after, after_tokens, after_roles, slots)
+    }
+    # Names the rewrite starts using from `from module import ...`; other files must import them too.
+    requires = ({token.string for token in after_tokens if token.string in imported}
+                - {token.string for token in before_tokens})
+    if requires:
+        rule["requires"] = sorted(requires)
+    return rule
+
+
+@lru_cache(maxsize=1024)
+def _rule_regex(before: str, alias: str) -> re.Pattern:
+    parts, position, seen = [], 0, set()
+    for match in PLACEHOLDER.finditer(before):
+        parts.append(r"\s+".join(re.escape(piece) for piece in re.split(r"\s+", before[position:match.start()])))
+        name = match.group(2)
+        if match.group(1):
+            parts.append(re.escape("$"))
+        elif name == "lib":
+            parts.append(re.escape(alias))
+        elif name in seen:
+            parts.append(f"(?P={name})")
+        else:
+            seen.add(name)
+            parts.append(f"(?P<{name}>{SLOT_PATTERN})")
+        position = match.end()
+    parts.append(r"\s+".join(re.escape(piece) for piece in re.split(r"\s+", before[position:])))
+    return re.compile("".join(parts))
+
+
+def _rewrite_line(body: str, rules: List[Dict], aliases: Set[str], imported: Set[str]) -> Optional[str]:
+    for rule in rules:
+        if not imported.issuperset(rule.get("requires", [])):
+            continue
+        uses_alias = "${lib}" in rule["before"] or "${lib}" in rule["after"]
+        for alias in (sorted(aliases) if uses_alias else [""]):
+            match = _rule_regex(rule["before"], alias).fullmatch(body)
+            if match:
+                return Template(rule["after"]).substitute(lib=alias, **match.groupdict())
+    return None
+
+
+def _uses_symbol(symbols: Set[str], symbol: str) -> bool:
+    """
+    Whether a line's resolved symbols include symbol, also under an internal path
+    (pandas.core.frame.DataFrame.append for pandas.DataFrame.append).
+    """
+    tail = "." + symbol.split(".", 1)[-1]
+    return any(found == symbol or (not is_foreign(found) and found.endswith(tail)) for found in symbols)
+
+
+def replay(recipe: Dict, content: str) -> Optional[str]:
+    """
+    Rewrites the lines of a file that statically resolve to the recipe's symbol with the recipe's rules.
+    Other lines calling a method of the same name (rows.append on a list) are left alone.
+    Returns the new content, or None if the file has no such line or one of them matches no rule;
+    a recipe is only replayed where it covers every usage.
+    """
+    module, method = recipe["symbol"].split(".")[0], recipe["symbol"].rsplit(".", 1)[-1]
+    aliases, imported = import_bindings(content, module)
+    uses_method = re.compile(rf"\b{re.escape(method)}\b")
+    symbols = resolve_symbols(content, [module])
+
+    lines = content.splitlines(keepends=True)
+    changed = False
+    for number, line in enumerate(lines):
+        body = line.rstrip("\r\n")
+        stripped = body.strip()
+        if not uses_method.search(body) or stripped.startswith(("#", "import ", "from ")):
+            continue
+        if not _uses_symbol(symbols.get(number + 1, set()), recipe["symbol"]):
+            continue
+        rewritten = _rewrite_line(stripped, recipe["rules"], aliases, imported)
+        if rewritten is None:
+            return None
+        indent = body[:len(body) - len(body.lstrip())]
+        lines[number] = indent + rewritten + line[len(body):]
+        changed = True
+    return "".join(lines) if changed else None
+
+
+def replay_files(recipe: Dict, project_path: str, files: Iterable[str], read) -> Optional[Dict[str, str]]:
+    """
+    Replays a recipe on every file; {file: new content}, or None unless all of them could be rewritten.
+    read(full_path) returns a file's content or None.
+    """
+    edits = {}
+    for file_path in files:
+        content = read(os.path.join(project_path, file_path))
+        rewritten = replay(recipe, content) if content is not None else None
+        if rewritten is None:
+            return None
+        edits[file_path] = rewritten
+    return edits
+
+
+def recipe_task(pattern: Dict, spec: Dict, project_path: str, read) -> Optional[Dict]:
+    """
+    A task that replays a usable recipe for the pattern's symbol, if the recipe covers every usage in the
+    pattern's files. The coder applies it without an LLM call.
+    """
+    store = current_recipes()
+    if store is None or not pattern.get("symbol") or not pattern.get("affected_files"):
+        return None
+    key = recipe_key(spec["library"], spec["old_version"], spec["new_version"], pattern["symbol"])
+    recipe = store.get(key)
+    if not is_usable(recipe) or replay_files(recipe, project_path, pattern["affected_files"], read) is None:
+        return None
+
+    current_metrics().count("recipes.planned")
+    logger.info(f"Recipes: {pattern['symbol']} is covered by a recipe ({recipe['successes']} green uses).")
+    return {
+        "title": f"Apply recipe for {pattern['symbol']}",
+        "description": f"{pattern.get('migration_guide', '')}\n\n"
+                       f"Rewrite rules that were green {recipe['successes']} times:\n"
+                       + "\n".join(f"{rule['before']}  ->  {rule['after']}" for rule in recipe["rules"]),
+        "files": list(pattern["affected_files"]),
+        "pattern_ids": [pattern["pattern_id"]],
+        "status": "pending",
+        "library": pattern.get("library") or spec["library"],
+        "recipe": key
+    }
+
+
+def replay_task(task: Dict, project_path: str, read) -> Optional[Dict[str, str]]:
+    """
+    The edits of a recipe task, or None if its recipe no longer covers the files (the coder then asks the LLM).
+    """
+    store = current_recipes()
+    recipe = store.get(task["recipe"]) if store is not None else None
+    edits = replay_files(recipe, project_path, task.get("files", []), read) if recipe else None
+    current_metrics().count("recipes.replayed" if edits is not None else "recipes.fallbacks")
+    return edits
+
+
+def recipe_failed(task: Dict):
+    """
+    Records that a recipe task broke the build and turns the task into a regular LLM task.
+    """
+    key = task.pop("recipe", None)
+    store = current_recipes()
+    if key and store is not None:
+        store.record(key, success=False)
+        store.save()
+        logger.info(f"Recipes: {key} introduced errors; its confidence is now lower.")
+
+
+def _diff_hunks(diff: str) -> Dict[str, List[Tuple[List[str], List[str]]]]:
+    """
+    file -> [(removed lines, added lines), ...] of a --unified=0 diff.
+    """
+    hunks: Dict[str, List[Tuple[List[str], List[str]]]] = {}
+    file_path = None
+    for line in diff.splitlines():
+        if line.startswith("+++ "):
+            file_path = line[6:] if line.startswith("+++ b/") else None
+        elif line.startswith("--- "):
+            continue
+        elif line.startswith("@@") and file_path:
+            hunks.setdefault(file_path, []).append(([], []))
+        elif file_path and file_path in hunks and line[:1] in ("-", "+"):
+            hunks[file_path][-1][0 if line[0] == "-" else 1].append(line[1:])
+    return hunks
+
+
+def _file_rules(hunks: List[Tuple[List[str], List[str]]], methods: Dict[str, str], aliases: Set[str],
+                imported: Set[str]) -> Optional[Dict[str, List[Dict]]]:
+    """
+    symbol -> rules of one file's changes, or None if any change is not a line-for-line rewrite of a usage
+    of exactly one of the symbols (added imports, moved code, reformatting).
+    """
+    rules: Dict[str, List[Dict]] = {}
+    for removed, added in hunks:
+        if not any(line.strip() for line in removed + added):
+            # Blank lines added or dropped, e.g. at the end of the file.
+            continue
+        if len(removed) != len(added):
+            return None
+        for before, after in zip(removed, added):
+            indent = before[:len(before) - len(before.lstrip())]
+            if not after.startswith(indent):
+                return None
+            symbols = [symbol for symbol, method in methods.items() if re.search(rf"\b{re.escape(method)}\b", before)]
+            if len(symbols) != 1:
+                return None
+            method = methods[symbols[0]]
+            rule = generalize(before.strip(), after.strip(), method, aliases, imported)
+            if rule is None:
+                return None
+            rules.setdefault(symbols[0], []).append(rule)
+    return rules
+
+
+def learn_from_run(project_path: str, plan_path: str, usage_path: str, libraries: List[Dict]) -> int:
+    """
+    After a green run: counts a success for every recipe that was replayed and learns recipes from the
+    commits of the LLM tasks. Neither counts for files later touched by fix tasks, since their first
+    rewrite was not good enough. Returns the number of recipes learned or confirmed.
+    """
+    store = current_recipes()
+    plan = load_json_file(plan_path)
+    if store is None or not isinstance(plan, list):
+        return 0
+
+    specs = {spec["library"]: spec for spec in libraries}
+    patterns = {pattern["pattern_id"]: pattern for pattern in iter_jsonl(usage_path) if pattern.get("symbol")}
+    fixed_files = {file_path for task in plan if not task.get("pattern_ids") and task.get("commit")
+                   for file_path in task.get("files", [])}
+
+    replayed = {task["recipe"] for task in plan if task.get("recipe") and task.get("status") == "done"
+                and fixed_files.isdisjoint(task.get("files", []))}
+    for key in replayed:
+        store.record(key, success=True)
+
+    # (library, symbol) -> rules from every file rewritten for it; one green run is one success.
+    learned: Dict[Tuple[str, str], List[Dict]] = {}
+    for task in plan:
+        if task.get("recipe") or task.get("status") != "done" or not task.get("commit"):
+            continue
+        task_patterns = [patterns[pattern_id] for pattern_id in task.get("pattern_ids", []) if pattern_id in patterns]
+        spec = specs.get(task.get("library")) or (libraries[0] if len(libraries) == 1 else None)
+        if not task_patterns or spec is None:
+            continue
+
+        methods = {pattern["symbol"]: pattern["symbol"].rsplit(".", 1)[-1] for pattern in task_patterns}
+        module = task_patterns[0]["symbol"].split(".")[0]
+        for file_path, hunks in _diff_hunks(get_commit_diff(project_path, task["commit"])).items():
+            if file_path in fixed_files:
+                continue
+            content = read_file_at(project_path, f"{task['commit']}^", file_path)
+            if content is None:
+                continue
+            for symbol, rules in (_file_rules(hunks, methods, *import_bindings(content, module)) or {}).items():
+                learned.setdefault((spec["library"], symbol), []).extend(rules)
+
+    for (library, symbol), rules in learned.items():
+        store.learn(specs[library], symbol, rules)
+
+    if replayed or learned:
+        store.save()
+        current_metrics().count("recipes.learned", len(learned))
+        logger.info(f"Recipes: {len(replayed)} replayed recipes confirmed, {len(learned)} recipes learned "
+                    f"from green commits. Saved to {store.path}")
+    return len(replayed) + len(learned)
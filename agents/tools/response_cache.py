@@ -0,0 +1,178 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Any, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.messages import messages_from_dict, messages_to_dict
+from langchain_core.outputs import ChatGeneration
+
+from agents.tools.shared_cache import ALL_CACHES
+from agents.tools.telemetry import current_metrics
+
+logger = logging.getLogger(__name__)
+
+OFF = "off"
+ON = "on"
+RECORD = "record"
+REPLAY = "replay"
+MODES = (OFF, ON, RECORD, REPLAY)
+
+CACHE_ROOT = os.environ.get("MIGRATOR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ai-migrator"))
+DEFAULT_CACHE_DIR = os.path.join(CACHE_ROOT, "llm")
+DEFAULT_MAX_MB = 1024
+
+
+class ReplayMissError(Exception):
+    """
+    Raised in replay mode when a request was never recorded. No API call is made.
+    """
+
+    # A bigger model is not in the recording either; the router must not retry on it.
+    escalate = False
+
+
+class ResponseCache(BaseCache):
+    """
+    Content-addressed on-disk cache of chat model responses.
+    LangChain keys lookups by the serialized messages and the model parameters, which include
+    the model name, temperature and bound tools / structured output schema. Entries are
+    evicted least-recently-used once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, directory: str, mode: str = ON, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.name = "llm_response"
+        self.directory = directory
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(os.path.getsize(path) for path in self._entries())
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    yield os.path.join(root, name)
+
+    def _path(self, prompt: str, llm_string: str) -> str:
+        key = hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Any]]:
+        path = self._path(prompt, llm_string)
+        if self.mode != RECORD:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    generations = [ChatGeneration(message=message)
+                                   for message in messages_from_dict(json.load(f)["messages"])]
+                os.utime(path)
+                with self._lock:
+                    self.hits += 1
+                current_metrics().cache_lookup(self.name, hit=True)
+                return generations
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"Response cache: Dropping unreadable entry {path}: {e}")
+
+        with self._lock:
+            self.misses += 1
+        current_metrics().cache_lookup(self.name, hit=False)
+        if self.mode == REPLAY:
+            raise ReplayMissError(f"No recorded response for this request (cache entry {os.path.basename(path)}).")
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Any]):
+        if self.mode == REPLAY:
+            return
+
+        messages = [generation.message for generation in return_val if hasattr(generation, "message")]
+        if len(messages) != len(return_val):
+            return
+
+        # Replayed calls cost nothing, so they must not count against token budgets.
+        messages = [message.model_copy(update={"usage_metadata": None}) if getattr(message, "usage_metadata", None)
+                    else message for message in messages]
+
+        path = self._path(prompt, llm_string)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"messages": messages_to_dict(messages)}, f)
+
+        with self._lock:
+            # An entry written again (record mode, or a concurrent miss on the same request) replaces the old one.
+            try:
+                self._size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(temp_path, path)
+            self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda path: os.path.getmtime(path))
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for path in entries:
+            if self._size <= target:
+                break
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+            removed += 1
+        logger.info(f"Response cache: Evicted {removed} entries, {self._size // 1024} KB left.")
+
+    def clear(self, **kwargs: Any):
+        with self._lock:
+            for path in list(self._entries()):
+                os.remove(path)
+            self._size = 0
+
+
+RESPONSE_CACHE: Optional[ResponseCache] = None
+
+
+def configure_response_cache(mode: str = OFF, directory: str = DEFAULT_CACHE_DIR, max_mb: int = DEFAULT_MAX_MB):
+    """
+    Installs the cache for every chat model in the process (or removes it for mode "off").
+    "on" reads and writes, "record" only writes, "replay" only reads and fails on misses.
+    """
+    global RESPONSE_CACHE
+
+    if mode not in MODES:
+        raise ValueError(f"Unknown LLM cache mode '{mode}'. Use one of: {', '.join(MODES)}.")
+
+    if RESPONSE_CACHE in ALL_CACHES:
+        ALL_CACHES.remove(RESPONSE_CACHE)
+
+    if mode == OFF:
+        RESPONSE_CACHE = None
+        set_llm_cache(None)
+        return None
+
+    RESPONSE_CACHE = ResponseCache(directory, mode, max_mb * 1024 * 1024)
+    ALL_CACHES.append(RESPONSE_CACHE)
+    set_llm_cache(RESPONSE_CACHE)
+    logger.info(f"LLM response cache: {mode} in {directory} (max {max_mb} MB)")
+    return RESPONSE_CACHE
+
+
+def replaying() -> bool:
+    return RESPONSE_CACHE is not None and RESPONSE_CACHE.mode == REPLAY
+
+
+def replay_misses() -> int:
+    if RESPONSE_CACHE is None or RESPONSE_CACHE.mode != REPLAY:
+        return 0
+    return RESPONSE_CACHE.misses
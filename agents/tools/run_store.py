@@ -0,0 +1,56 @@
+import os
+import time
+import logging
+from typing import Dict, List, Optional
+
+from agents.tools.io.json_handlers import load_json_file, save_json_file
+
+logger = logging.getLogger(__name__)
+
+RUN_DIR_NAME = ".migrator"
+CHECKPOINT_DB = "checkpoints.sqlite"
+RUN_INFO_FILE = "run.json"
+
+
+def get_run_dir(project_path: str) -> str:
+    """
+    Returns the per-project directory for run artifacts (plan, errors, checkpoints).
+    The directory ignores itself in git, so atomic commits never pick it up.
+    """
+    run_dir = os.path.join(project_path, RUN_DIR_NAME)
+    os.makedirs(run_dir, exist_ok=True)
+
+    gitignore_path = os.path.join(run_dir, ".gitignore")
+    if not os.path.exists(gitignore_path):
+        with open(gitignore_path, "w", encoding="utf-8") as f:
+            f.write("*\n")
+
+    return run_dir
+
+
+def get_checkpoint_path(project_path: str) -> str:
+    return os.path.join(get_run_dir(project_path), CHECKPOINT_DB)
+
+
+def new_run_info(project_path: str, library: str, old_version: str, new_version: str,
+                 streaming: bool = False, libraries: Optional[List[Dict]] = None) -> Dict:
+    migrations = libraries or [{"library": library, "old_version": old_version, "new_version": new_version}]
+    name = "+".join(f"{spec['library']}-{spec['old_version']}-{spec['new_version']}" for spec in migrations)
+    run_info = {
+        "thread_id": f"{name}-{int(time.time())}",
+        "library": library,
+        "old_version": old_version,
+        "new_version": new_version,
+        "streaming": streaming
+    }
+    if libraries:
+        run_info["libraries"] = libraries
+    save_json_file(os.path.join(get_run_dir(project_path), RUN_INFO_FILE), run_info)
+    return run_info
+
+
+def load_run_info(project_path: str) -> Optional[Dict]:
+    run_info = load_json_file(os.path.join(project_path, RUN_DIR_NAME, RUN_INFO_FILE))
+    if not isinstance(run_info, dict) or not run_info.get("thread_id"):
+        return None
+    return run_info
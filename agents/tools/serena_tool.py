@@ -1,24 +1,80 @@
+import time
 import logging
 import json
 import asyncio
 from pathlib import Path
-from typing import List, Any
-from serena.agent import SerenaAgent
+from typing import Any, Dict, List, Tuple
+
+from agents.tools.telemetry import current_metrics, traced
 
 logger = logging.getLogger(__name__)
 
+# Started agents by workspace, with their last use. Only filled when keep_warm() is on (server mode),
+# so a one-shot CLI run never keeps a language server alive.
+WARM_AGENTS: Dict[str, Tuple[Any, float]] = {}
+# Workspace -> number of SerenaTools currently using its warm agent; leased agents are never evicted.
+_leases: Dict[str, int] = {}
+_keep_warm_seconds = 0.0
+
+
+def keep_warm(idle_seconds: float):
+    """
+    Keeps started Serena agents (and their LSP index) for reuse until they were idle for idle_seconds.
+    """
+    global _keep_warm_seconds
+    _keep_warm_seconds = idle_seconds
+
+
+def evict_idle(now: float = None) -> int:
+    """
+    Shuts down agents idle for longer than the keep-warm period and not in use by a job.
+    Returns the number evicted.
+    """
+    now = now or time.time()
+    expired = [path for path, (_, last_used) in WARM_AGENTS.items()
+               if now - last_used > _keep_warm_seconds and not _leases.get(path)]
+    for path in expired:
+        agent, _ = WARM_AGENTS.pop(path)
+        logger.info(f"Serena: Shutting down idle agent for {path}.")
+        _shutdown(agent)
+    return len(expired)
+
+
+def _shutdown(agent):
+    shutdown = getattr(agent, "on_shutdown", None) or getattr(agent, "shutdown", None)
+    if shutdown is None:
+        return
+    try:
+        shutdown()
+    except Exception as e:
+        logger.warning(f"Serena: Shutdown failed: {e}")
+
 
 class SerenaTool:
     def __init__(self, workspace_path: str):
         self.workspace_path = Path(workspace_path)
         self.agent = None
+        self._leased = False
 
+    @traced("serena")
     async def start(self):
         if not self.workspace_path.exists():
             raise FileNotFoundError(f"Path {self.workspace_path} not found!")
 
+        key = str(self.workspace_path.resolve())
+        if key in WARM_AGENTS:
+            self.agent, _ = WARM_AGENTS[key]
+            WARM_AGENTS[key] = (self.agent, time.time())
+            self._lease(key)
+            current_metrics().count("serena.warm_starts")
+            logger.info(f"Serena: Reusing the warm agent for {self.workspace_path}.")
+            return
+
         logger.info(f"Launch Serena in the workspace: {self.workspace_path}")
         try:
+            # Serena pulls in the language-server stack; load it only when a search actually starts.
+            from serena.agent import SerenaAgent
+
             self.agent = SerenaAgent()
             self.agent.load_project_from_path_or_name(str(self.workspace_path), autogenerate=True)
             self.agent.activate_project_from_path_or_name(str(self.workspace_path))
@@ -26,11 +82,39 @@ class SerenaTool:
             logger.info("Waiting for LSP server initialization...")
             await asyncio.sleep(5)
             logger.info("Serena LSP is ready for analysis.")
+            if _keep_warm_seconds:
+                WARM_AGENTS[key] = (self.agent, time.time())
+                self._lease(key)
         except Exception as e:
             logger.error(f"Error when starting Serena: {e}")
             raise
 
+    def _lease(self, key: str):
+        if not self._leased:
+            _leases[key] = _leases.get(key, 0) + 1
+            self._leased = True
+
+    def release(self):
+        """
+        Ends this tool's use of a warm agent, which may then be evicted once it was idle long enough.
+        """
+        if not self._leased:
+            return
+        key = str(self.workspace_path.resolve())
+        _leases[key] -= 1
+        if not _leases[key]:
+            del _leases[key]
+        self._leased = False
+        self._touch()
+
+    def _touch(self):
+        key = str(self.workspace_path.resolve())
+        if key in WARM_AGENTS:
+            WARM_AGENTS[key] = (self.agent, time.time())
+
+    @traced("serena")
     async def find_candidate_files(self, search_patterns: List[str]) -> List[str]:
+        self._touch()
         search_tool = self.agent.get_tool_by_name("search_for_pattern")
         all_found_files = set()
 
@@ -49,7 +133,9 @@ class SerenaTool:
 
         return list(all_found_files)
 
+    @traced("serena")
     async def read_file(self, file_path: str) -> str:
+        self._touch()
         read_tool = self.agent.get_tool_by_name("read_file")
         try:
             return read_tool.apply(relative_path=file_path)
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from agents.tools.telemetry import current_metrics
+
+logger = logging.getLogger(__name__)
+
+ALL_MEMOS: List["AsyncMemo"] = []
+# Every cache with process-wide name/hits/misses (memos and the LLM response cache) for the server's health check.
+# run_metrics.json reports the lookups of each run separately.
+ALL_CACHES: List[Any] = []
+
+
+class AsyncMemo:
+    """
+    Process-wide memo for async lookups. Hits and misses are counted process-wide and for the current run.
+    Concurrent callers asking for the same key share one in-flight request, so repositories
+    migrated side by side never fetch identical advice twice.
+    With max_entries, the least recently used values are evicted beyond that many.
+    """
+
+    def __init__(self, name: str, max_entries: Optional[int] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self._values: Dict[Hashable, Any] = {}
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        ALL_MEMOS.append(self)
+        ALL_CACHES.append(self)
+
+    async def get_or_create(self, key: Hashable, factory: Callable[[], Awaitable[Any]],
+                            should_cache: Callable[[Any], bool] = bool) -> Any:
+        """
+        Returns the memoized value for key, creating it with factory on a miss.
+        Values rejected by should_cache (empty results by default) are shared with waiters but not stored.
+        """
+        if key in self._values:
+            self._count(hit=True)
+            return self._touch(key)
+
+        pending = self._pending.get(key)
+        if pending is not None and pending.get_loop() is asyncio.get_running_loop():
+            self._count(hit=True)
+            return await asyncio.shield(pending)
+
+        self._count(hit=False)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            value = await factory()
+        except BaseException as e:
+            if not future.done():
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    future.exception()
+            raise
+        finally:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+        if should_cache(value):
+            self.put(key, value)
+        future.set_result(value)
+        return value
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Returns the stored value for key, or None. Counts as a hit or a miss.
+        """
+        if key in self._values:
+            self._count(hit=True)
+            return self._touch(key)
+        self._count(hit=False)
+        return None
+
+    def _count(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        current_metrics().cache_lookup(self.name, hit)
+
+    def put(self, key: Hashable, value: Any):
+        self._values.pop(key, None)
+        self._values[key] = value
+        if self.max_entries is not None and len(self._values) > self.max_entries:
+            del self._values[next(iter(self._values))]
+
+    def _touch(self, key: Hashable) -> Any:
+        if self.max_entries is None:
+            return self._values[key]
+        # Dicts keep insertion order, so re-inserting moves the key to the most recently used end.
+        value = self._values[key] = self._values.pop(key)
+        return value
+
+    def clear(self):
+        self._values.clear()
+        self._pending.clear()
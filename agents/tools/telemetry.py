@@ -0,0 +1,336 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import threading
+from contextvars import ContextVar
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from agents.tools.io.json_handlers import save_json_file
+from agents.tools.profiler import profiled
+
+logger = logging.getLogger(__name__)
+
+# Route (extraction, refine, planning, code, fixing) of the LLM call in progress, set by the model router.
+CURRENT_ROUTE: ContextVar[Optional[str]] = ContextVar("current_route", default=None)
+
+
+class RunMetrics:
+    """
+    Collects spans for graph nodes and external calls (LLM, Context7, Serena, git, ruff) of one run.
+    Spans are exported as a Chrome trace (loadable in Perfetto or chrome://tracing) and aggregated
+    into run_metrics.json.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self.counters: Dict[str, int] = {}
+        # cache name -> [hits, misses] of the lookups made by this run.
+        self.cache_lookups: Dict[str, List[int]] = {}
+        self._lanes: Dict[Any, int] = {}
+
+    def _lane(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = ("task", id(task)) if task else ("thread", threading.get_ident())
+        with self._lock:
+            return self._lanes.setdefault(key, len(self._lanes) + 1)
+
+    def add_span(self, name: str, category: str, start: float, duration: float, lane: int = 0, **attrs):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "category": category,
+                "start": start,
+                "duration": duration,
+                "lane": lane,
+                "attrs": attrs
+            })
+
+    def count(self, counter: str, value: int = 1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def cache_lookup(self, cache: str, hit: bool):
+        with self._lock:
+            self.cache_lookups.setdefault(cache, [0, 0])[0 if hit else 1] += 1
+
+    @contextmanager
+    def span(self, name: str, category: str, **attrs):
+        lane = self._lane()
+        start = time.time()
+        try:
+            yield attrs
+        except Exception as e:
+            attrs["error"] = str(e)
+            raise
+        finally:
+            self.add_span(name, category, start, time.time() - start, lane, **attrs)
+
+    @asynccontextmanager
+    async def aspan(self, name: str, category: str, **attrs):
+        lane = self._lane()
+        start = time.time()
+        try:
+            yield attrs
+        except Exception as e:
+            attrs["error"] = str(e)
+            raise
+        finally:
+            self.add_span(name, category, start, time.time() - start, lane, **attrs)
+
+    def summary(self) -> Dict[str, Any]:
+        nodes: Dict[str, Dict[str, Any]] = {}
+        categories: Dict[str, Dict[str, Any]] = {}
+        routing: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+
+        for span in spans:
+            category = categories.setdefault(span["category"], {"calls": 0, "seconds": 0.0, "errors": 0})
+            category["calls"] += 1
+            category["seconds"] += span["duration"]
+            if span["attrs"].get("error"):
+                category["errors"] += 1
+
+            if span["category"] == "node":
+                node = nodes.setdefault(span["name"], _empty_node())
+                node["runs"] += 1
+                node["seconds"] += span["duration"]
+            elif span["category"] == "llm":
+                node = nodes.setdefault(span["attrs"].get("node") or "outside_graph", _empty_node())
+                node["llm_calls"] += 1
+                node["llm_seconds"] += span["duration"]
+                for key in ("input_tokens", "output_tokens", "cache_read_tokens", "cache_creation_tokens"):
+                    node[key] += span["attrs"].get(key, 0)
+                if span["attrs"].get("route") and span["attrs"].get("output_tokens"):
+                    # Billed model calls only: responses served from the response cache report no usage.
+                    route = _route_entry(routing, span["attrs"]["route"], span["attrs"].get("model", "unknown"))
+                    route["llm_calls"] += 1
+                    route["llm_seconds"] += span["duration"]
+                    route["input_tokens"] += span["attrs"].get("input_tokens", 0)
+                    route["output_tokens"] += span["attrs"].get("output_tokens", 0)
+            elif span["category"] == "route":
+                route = _route_entry(routing, span["name"], span["attrs"].get("model", "unknown"))
+                route["calls"] += 1
+                route["seconds"] += span["duration"]
+                if span["attrs"].get("error"):
+                    route["failures"] += 1
+
+        for node in nodes.values():
+            node["cache_read_ratio"] = round(node["cache_read_tokens"] / node["input_tokens"], 3) \
+                if node["input_tokens"] else 0.0
+
+        with self._lock:
+            cache_lookups = {name: list(counts) for name, counts in self.cache_lookups.items()}
+        caches = {
+            name: {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 3)}
+            for name, (hits, misses) in cache_lookups.items()
+        }
+
+        return {
+            "wall_seconds": round(time.time() - self.started, 3),
+            "nodes": nodes,
+            "categories": categories,
+            "counters": counters,
+            "caches": caches,
+            "routing": routing
+        }
+
+    def usage_by_model(self) -> Dict[str, Dict[str, int]]:
+        """
+        Input, output and prompt-cache tokens per model, for cost accounting.
+        """
+        with self._lock:
+            spans = [span for span in self.spans if span["category"] == "llm"]
+        usage: Dict[str, Dict[str, int]] = {}
+        for span in spans:
+            model = usage.setdefault(span["attrs"].get("model") or span["name"], {
+                "input_tokens": 0, "output_tokens": 0, "cache_read_tokens": 0, "cache_creation_tokens": 0
+            })
+            for key in model:
+                model[key] += span["attrs"].get(key, 0)
+        return usage
+
+    def trace_events(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            spans = list(self.spans)
+        return [
+            {
+                "name": span["name"],
+                "cat": span["category"],
+                "ph": "X",
+                "ts": int((span["start"] - self.started) * 1_000_000),
+                "dur": max(1, int(span["duration"] * 1_000_000)),
+                "pid": 1,
+                "tid": span["lane"],
+                "args": {key: value for key, value in span["attrs"].items() if value is not None}
+            }
+            for span in spans
+        ]
+
+    def write(self, directory: str) -> Dict[str, str]:
+        metrics_path = os.path.join(directory, "run_metrics.json")
+        trace_path = os.path.join(directory, "trace.json")
+        save_json_file(metrics_path, self.summary())
+        save_json_file(trace_path, {"traceEvents": self.trace_events(), "displayTimeUnit": "ms"})
+        return {"metrics": metrics_path, "trace": trace_path}
+
+
+def _route_entry(routing: Dict[str, Dict[str, Dict[str, Any]]], route: str, model: str) -> Dict[str, Any]:
+    return routing.setdefault(route, {}).setdefault(model, {
+        "calls": 0, "failures": 0, "seconds": 0.0, "llm_calls": 0, "llm_seconds": 0.0,
+        "input_tokens": 0, "output_tokens": 0
+    })
+
+
+def _empty_node() -> Dict[str, Any]:
+    return {
+        "runs": 0, "seconds": 0.0, "llm_calls": 0, "llm_seconds": 0.0,
+        "input_tokens": 0, "output_tokens": 0, "cache_read_tokens": 0, "cache_creation_tokens": 0
+    }
+
+
+RUN_METRICS = RunMetrics()
+_CURRENT_METRICS: ContextVar[RunMetrics] = ContextVar("current_metrics", default=RUN_METRICS)
+
+
+def current_metrics() -> RunMetrics:
+    return _CURRENT_METRICS.get()
+
+
+def use_metrics(metrics: RunMetrics):
+    _CURRENT_METRICS.set(metrics)
+
+
+def traced(category: str, name: Optional[str] = None):
+    """
+    Decorator that records a span for every call of a sync or async function.
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                async with current_metrics().aspan(span_name, category):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with current_metrics().span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def instrument_node(name: str, node):
+    """
+    Wraps a graph node so each run of it is recorded as a "node" span and, with --profile, profiled.
+    """
+    return traced("node", name)(profiled(name)(node))
+
+
+class TelemetryCallback(BaseCallbackHandler):
+    """
+    Records one "llm" span per model call with model, graph node, tokens and prompt-cache reads.
+    """
+
+    def __init__(self, metrics: RunMetrics):
+        self.metrics = metrics
+        self._calls: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, serialized, metadata):
+        metadata = metadata or {}
+        model = metadata.get("ls_model_name") or (serialized or {}).get("name", "llm")
+        with self._lock:
+            self._calls[run_id] = {
+                "start": time.time(),
+                "model": model,
+                "node": metadata.get("langgraph_node"),
+                "route": CURRENT_ROUTE.get(),
+                "lane": self.metrics._lane()
+            }
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, serialized, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, serialized, metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if not call:
+            return
+
+        attrs = {"model": call["model"], "node": call["node"], "route": call["route"], "input_tokens": 0,
+                 "output_tokens": 0, "cache_read_tokens": 0, "cache_creation_tokens": 0}
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if not usage:
+                    continue
+                details = usage.get("input_token_details") or {}
+                attrs["input_tokens"] += usage.get("input_tokens", 0)
+                attrs["output_tokens"] += usage.get("output_tokens", 0)
+                attrs["cache_read_tokens"] += details.get("cache_read", 0) or 0
+                attrs["cache_creation_tokens"] += details.get("cache_creation", 0) or 0
+
+        self.metrics.add_span(call["model"], "llm", call["start"], time.time() - call["start"],
+                              call["lane"], **attrs)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if call:
+            self.metrics.add_span(call["model"], "llm", call["start"], time.time() - call["start"],
+                                  call["lane"], model=call["model"], node=call["node"], error=str(error))
+
+    def on_retry(self, retry_state, *, run_id, **kwargs):
+        self.metrics.count("retries.llm")
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """
+    Renders the per-node summary as a plain-text table for the console.
+    """
+    header = f"{'node':<14}{'runs':>6}{'wall s':>10}{'llm calls':>11}{'in tok':>11}{'out tok':>10}{'cache rd':>10}"
+    lines = [header, "-" * len(header)]
+    for name, node in summary["nodes"].items():
+        lines.append(
+            f"{name:<14}{node['runs']:>6}{node['seconds']:>10.1f}{node['llm_calls']:>11}"
+            f"{node['input_tokens']:>11}{node['output_tokens']:>10}{node['cache_read_ratio']:>10.0%}"
+        )
+
+    lines.append("")
+    for category, stats in summary["categories"].items():
+        if category == "node":
+            continue
+        lines.append(f"{category:<14}{stats['calls']:>6} calls {stats['seconds']:>9.1f}s  errors: {stats['errors']}")
+
+    for route, models in summary.get("routing", {}).items():
+        for model, stats in models.items():
+            lines.append(f"route {route:<10} {model:<28}{stats['calls']:>5} calls {stats['failures']:>4} failed")
+
+    for cache, stats in summary["caches"].items():
+        lines.append(f"cache {cache}: {stats['hits']}/{stats['hits'] + stats['misses']} hits ({stats['hit_rate']:.0%})")
+
+    for counter, value in summary["counters"].items():
+        lines.append(f"{counter}: {value}")
+
+    lines.append(f"total wall time: {summary['wall_seconds']:.1f}s")
+    return "\n".join(lines)
@@ -1,5 +1,8 @@
 import os
+import re
+import hashlib
 import logging
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
@@ -10,6 +13,8 @@ class RuntimeErrorData(BaseModel):
     message: str
     context: str
     file: str
+    line: Optional[int] = None
+    type: str = "RuntimeError"
 
 
 def get_code_context(file_path: str, line_number: int, context_window: int = 10) -> str:
@@ -38,4 +43,21 @@ def get_code_context(file_path: str, line_number: int, context_window: int = 10)
         return "\n".join(snippet)
     except Exception as e:
         logger.error(f"Failed to read context from {file_path}: {e}")
-        return "Error reading code context."
\ No newline at end of file
+        return "Error reading code context."
+
+
+def fingerprint_error(error: Dict) -> str:
+    """
+    Builds a stable identifier for an error.
+    Line numbers and other digits are ignored, so the fingerprint survives unrelated edits in the file.
+    """
+    message = re.sub(r"\d+", "N", str(error.get("message", "")))
+    raw = f"{error.get('file', '')}|{error.get('type', '')}|{message}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def fingerprint_errors(errors: List[Dict]) -> List[str]:
+    """
+    Returns the sorted, de-duplicated fingerprint set of an error list.
+    """
+    return sorted({fingerprint_error(err) for err in errors})
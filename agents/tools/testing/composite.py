@@ -0,0 +1,190 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional
+
+from agents.tools.telemetry import current_metrics
+from agents.tools.testing.common import get_code_context
+from agents.tools.testing.python.run_strategies import STRATEGIES, TestRunner
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKS = "ruff"
+
+PASSED = "passed"
+FAILED = "failed"
+TIMED_OUT = "timeout"
+BROKEN = "error"
+SKIPPED = "skipped"
+
+
+class CheckResult:
+    """
+    Outcome of one checker: its status, the errors it reported and how long it ran.
+    """
+
+    def __init__(self, name: str, status: str, errors: Optional[List[Dict]] = None, seconds: float = 0.0):
+        self.name = name
+        self.status = status
+        self.errors = errors or []
+        self.seconds = seconds
+
+
+def parse_checks(spec: str) -> List[TestRunner]:
+    """
+    "ruff,mypy:300,pytest" -> runners in that order; ":N" overrides the checker's timeout in seconds.
+    """
+    runners = []
+    for item in (spec or DEFAULT_CHECKS).split(","):
+        name, _, timeout = item.strip().partition(":")
+        if name not in STRATEGIES:
+            raise ValueError(f"Unknown check {name!r}. Available: {', '.join(STRATEGIES)}.")
+        runner = STRATEGIES[name]()
+        if timeout:
+            try:
+                runner.timeout = float(timeout)
+            except ValueError:
+                raise ValueError(f"Invalid timeout {timeout!r} for check {name}.")
+        if any(existing.name == name for existing in runners):
+            raise ValueError(f"Check {name} is listed twice.")
+        runners.append(runner)
+    return runners
+
+
+_checks = DEFAULT_CHECKS
+_fail_fast = False
+
+
+def configure_checks(spec: str = DEFAULT_CHECKS, fail_fast: bool = False):
+    """
+    Sets the checkers the tester runs. With fail_fast, slower checkers are stopped as soon as a fast one
+    (ruff) reports errors.
+    """
+    global _checks, _fail_fast
+    parse_checks(spec)
+    _checks = spec
+    _fail_fast = fail_fast
+
+
+def configured_runner() -> "CompositeRunner":
+    return CompositeRunner(parse_checks(_checks), fail_fast=_fail_fast)
+
+
+def merge_errors(results: List[CheckResult], project_path: str) -> List[Dict]:
+    """
+    Merges the errors of several checkers into the errors.json schema. A file and line another checker
+    already reported is left to the first checker in the list; distinct errors of one checker on the same
+    line are all kept. Error ids are renumbered.
+    """
+    merged, seen, reported_lines = [], set(), {}
+    for index, result in enumerate(results):
+        for error in result.errors:
+            line = error.get("line")
+            key = (error.get("file"), line, error.get("type"), error.get("message"))
+            if key in seen or (line and reported_lines.get((error.get("file"), line), index) != index):
+                continue
+            seen.add(key)
+            if line:
+                reported_lines.setdefault((error.get("file"), line), index)
+            context = error.get("context")
+            if not context and line:
+                context = get_code_context(os.path.join(project_path, error.get("file", "")), line)
+            merged.append({
+                "error_id": len(merged) + 1,
+                "type": error.get("type", "UNKNOWN"),
+                "message": error.get("message", ""),
+                "file": error.get("file", ""),
+                "line": line,
+                "context": context or ""
+            })
+    return merged
+
+
+class CompositeRunner:
+    """
+    Runs several checkers concurrently, each in its own subprocess with its own timeout,
+    and yields their results as they finish.
+    """
+
+    def __init__(self, runners: List[TestRunner], fail_fast: bool = False):
+        self.runners = runners
+        self.fail_fast = fail_fast
+        self._processes: Dict[str, subprocess.Popen] = {}
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def _run_one(self, runner: TestRunner, project_path: str) -> CheckResult:
+        started = time.time()
+        with current_metrics().span(runner.name, "check"):
+            with self._lock:
+                if self._cancelled:
+                    return CheckResult(runner.name, SKIPPED)
+                try:
+                    process = subprocess.Popen(runner.command(project_path), cwd=project_path, text=True,
+                                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                except OSError as e:
+                    logger.error(f"Tester: Cannot start {runner.name}: {e}")
+                    return CheckResult(runner.name, BROKEN)
+                self._processes[runner.name] = process
+
+            try:
+                output, _ = process.communicate(timeout=runner.timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                logger.warning(f"Tester: {runner.name} timed out after {runner.timeout:.0f}s.")
+                return CheckResult(runner.name, TIMED_OUT, seconds=time.time() - started)
+
+            seconds = time.time() - started
+            if self._cancelled and process.returncode < 0:
+                return CheckResult(runner.name, SKIPPED, seconds=seconds)
+            errors = runner.parse(process.returncode, output, project_path)
+            if errors is None:
+                logger.error(f"Tester: {runner.name} failed (RC={process.returncode}) without usable output.")
+                return CheckResult(runner.name, BROKEN, seconds=seconds)
+            return CheckResult(runner.name, FAILED if errors else PASSED, errors, seconds)
+
+    def _cancel(self, reason: str):
+        with self._lock:
+            self._cancelled = True
+            running = [(name, process) for name, process in self._processes.items() if process.poll() is None]
+        for name, process in running:
+            logger.info(f"Tester: Stopping {name}: {reason}")
+            process.kill()
+
+    def iter_results(self, project_path: str) -> Iterator[CheckResult]:
+        with ThreadPoolExecutor(max_workers=len(self.runners), thread_name_prefix="check") as pool:
+            futures = {pool.submit(contextvars.copy_context().run, self._run_one, runner, project_path): runner
+                       for runner in self.runners}
+            for future in as_completed(futures):
+                result = future.result()
+                yield result
+                if self.fail_fast and result.status == FAILED and futures[future].fast:
+                    self._cancel(f"{result.name} reported {len(result.errors)} errors")
+
+    def collect(self, project_path: str, on_result: Optional[Callable[[List[Dict]], None]] = None
+                ) -> Optional[List[Dict]]:
+        """
+        Runs all checkers and returns their merged errors, [] if all passed, or None if no checker
+        reported errors but one of them timed out or failed without usable output.
+        on_result is called with the errors merged so far each time a checker finishes.
+        """
+        results: Dict[str, CheckResult] = {}
+        for result in self.iter_results(project_path):
+            results[result.name] = result
+            logger.info(f"Tester: {result.name} {result.status} in {result.seconds:.1f}s "
+                        f"({len(result.errors)} errors).")
+            current_metrics().count(f"tester.checks_{result.status}")
+            if on_result is not None:
+                on_result(merge_errors([results[r.name] for r in self.runners if r.name in results], project_path))
+
+        errors = merge_errors([results[runner.name] for runner in self.runners], project_path)
+        if errors:
+            return errors
+        if any(result.status in (TIMED_OUT, BROKEN) for result in results.values()):
+            return None
+        return []
@@ -25,8 +25,10 @@ def parse_python_traceback(stderr: str, project_path: str) -> List[Dict]:
 
         error_match = error_msg_pattern.search(block)
         error_message = "Unknown Runtime Error"
+        error_type = "RuntimeError"
         if error_match:
             error_message = f"{error_match.group('type')}: {error_match.group('msg')}"
+            error_type = error_match.group("type")
 
         matches = list(file_pattern.finditer(block))
         relevant_match = None
@@ -63,7 +65,9 @@ def parse_python_traceback(stderr: str, project_path: str) -> List[Dict]:
                 error_id=error_id_counter,
                 message=error_message,
                 context=context_code,
-                file=rel_path
+                file=rel_path,
+                line=line_no,
+                type=error_type
             )
             errors.append(error_obj.model_dump())
 
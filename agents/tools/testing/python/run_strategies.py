@@ -1,34 +1,126 @@
-import subprocess
+import os
+import re
+import json
 import logging
+from typing import Dict, List, Optional
+
+from agents.tools.testing.python.error_parser import parse_python_traceback
 
 logger = logging.getLogger(__name__)
 
 
 class TestRunner:
-    def run(self, project_path: str) -> tuple[int, str]:
+    """
+    One checker. The composite runner starts command() in a subprocess (cwd = project) and turns its
+    output into errors with parse(). Fast checkers may short-circuit slower ones when they find errors.
+    """
+    name = "check"
+    timeout = 300
+    fast = False
+
+    def command(self, project_path: str) -> List[str]:
+        raise NotImplementedError
+
+    def parse(self, return_code: int, output: str, project_path: str) -> Optional[List[Dict]]:
         """
-        Returns (return_code, stderr_output)
+        Returns the errors found ({type, message, file, line}), [] if there are none,
+        or None if the output is not usable.
         """
         raise NotImplementedError
 
 
+def _relative(file_path: str, project_path: str) -> str:
+    return os.path.relpath(file_path, project_path) if os.path.isabs(file_path) else os.path.normpath(file_path)
+
+
 class RuffRunner(TestRunner):
-    def run(self, project_path: str) -> tuple[int, str]:
-        logger.info("Strategy: Ruff Static Analysis (Critical .py only)")
+    name = "ruff"
+    timeout = 120
+    fast = True
 
-        cmd = [
-            "ruff", "check", project_path,
+    def command(self, project_path: str) -> List[str]:
+        logger.info("Strategy: Ruff Static Analysis (Critical .py only)")
+        return [
+            "ruff", "check", os.path.abspath(project_path),
             "--select", "E9,F63,F7",
             "--exclude", "*.ipynb",
             "--output-format", "json"
         ]
 
+    def parse(self, return_code: int, output: str, project_path: str) -> Optional[List[Dict]]:
+        if return_code == 0:
+            return []
+        if not output or not output.strip():
+            logger.warning("Ruff returned non-zero code but output is empty.")
+            return None
         try:
-            res = subprocess.run(cmd, capture_output=True, text=True)
-            return res.returncode, res.stdout
-        except FileNotFoundError:
-            logger.error("Ruff is not installed. Please install it via 'pip install ruff'.")
-            return -1, "[]"
-        except Exception as e:
-            logger.error(f"Ruff execution error: {e}")
-            return -1, "[]"
\ No newline at end of file
+            ruff_errors = json.loads(output)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse Ruff JSON output: {e}")
+            return None
+
+        return [{
+            "type": err.get("code") or "UNKNOWN",
+            "message": err.get("message", "Unknown error"),
+            "file": _relative(err.get("filename", ""), project_path),
+            "line": err["location"]["row"]
+        } for err in ruff_errors] or None
+
+
+MYPY_LINE = re.compile(r"^(?P<file>[^:\n]+):(?P<line>\d+)(?::\d+)?: error: (?P<message>.*?)(?:\s+\[(?P<code>[\w-]+)\])?$",
+                       re.M)
+
+
+class MypyRunner(TestRunner):
+    name = "mypy"
+    timeout = 600
+
+    def command(self, project_path: str) -> List[str]:
+        logger.info("Strategy: Mypy Type Check")
+        return ["mypy", ".", "--show-error-codes", "--no-error-summary", "--no-color-output",
+                "--hide-error-context", "--ignore-missing-imports"]
+
+    def parse(self, return_code: int, output: str, project_path: str) -> Optional[List[Dict]]:
+        if return_code == 0:
+            return []
+        errors = [{
+            "type": f"mypy[{match.group('code') or 'error'}]",
+            "message": match.group("message"),
+            "file": _relative(match.group("file"), project_path),
+            "line": int(match.group("line"))
+        } for match in MYPY_LINE.finditer(output)]
+        return errors or None
+
+
+PYTEST_SUMMARY_LINE = re.compile(r"^(?:FAILED|ERROR) (?P<file>[^\s:]+)(?:::\S+)?(?: - (?P<message>.*))?$", re.M)
+# Exit codes: 0 all passed, 1 tests failed, 5 no tests collected.
+PYTEST_CLEAN_CODES = {0, 5}
+
+
+class PytestRunner(TestRunner):
+    name = "pytest"
+    timeout = 900
+
+    def command(self, project_path: str) -> List[str]:
+        logger.info("Strategy: Pytest")
+        return ["pytest", "-q", "--tb=native", "-rfE", "-p", "no:cacheprovider"]
+
+    def parse(self, return_code: int, output: str, project_path: str) -> Optional[List[Dict]]:
+        if return_code in PYTEST_CLEAN_CODES:
+            return []
+        errors = parse_python_traceback(output, project_path)
+        for error in errors:
+            error["file"] = _relative(error["file"], project_path)
+        if errors:
+            return errors
+        # No tracebacks (e.g. a failed collection): one error per failed test from the short summary.
+        errors = [{
+            "type": "pytest",
+            "message": match.group("message") or "Test failed",
+            "file": _relative(match.group("file"), project_path),
+            "line": None
+        } for match in PYTEST_SUMMARY_LINE.finditer(output)]
+        return errors or None
+
+
+STRATEGIES = {runner.name: runner for runner in (RuffRunner, MypyRunner, PytestRunner)}
@@ -0,0 +1,61 @@
+import logging
+import threading
+from contextvars import ContextVar
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+
+class TokenUsageTracker(BaseCallbackHandler):
+    """
+    Accumulates token usage reported by every LLM call made inside the graph.
+    Pass it in the graph config callbacks; nested LLM calls inherit it automatically.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.carried_tokens = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.carried_tokens + self.input_tokens + self.output_tokens
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if not usage:
+                    continue
+                with self._lock:
+                    self.input_tokens += usage.get("input_tokens", 0)
+                    self.output_tokens += usage.get("output_tokens", 0)
+
+    def reset(self, carried_tokens: int = 0):
+        """
+        Clears the counters. carried_tokens keeps the spend of an earlier, resumed run in the total.
+        """
+        with self._lock:
+            self.input_tokens = 0
+            self.output_tokens = 0
+            self.carried_tokens = carried_tokens
+
+
+RUN_USAGE = TokenUsageTracker()
+_CURRENT_USAGE: ContextVar[TokenUsageTracker] = ContextVar("current_usage", default=RUN_USAGE)
+
+
+def current_usage() -> TokenUsageTracker:
+    """
+    Returns the tracker of the run executing in the current context.
+    Fleet runs bind their own tracker with use_tracker, so budgets never mix between repositories.
+    """
+    return _CURRENT_USAGE.get()
+
+
+def use_tracker(tracker: TokenUsageTracker):
+    _CURRENT_USAGE.set(tracker)
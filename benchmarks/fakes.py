@@ -0,0 +1,295 @@
+import os
+import re
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+def _text(message: BaseMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(part.get("text", "") for part in message.content if isinstance(part, dict))
+
+
+def _json_after(text: str, marker: str) -> Any:
+    start = text.find(marker)
+    if start == -1:
+        return []
+    try:
+        return json.loads(text[start + len(marker):].strip())
+    except json.JSONDecodeError:
+        return []
+
+
+class FakeChatAnthropic(BaseChatModel):
+    """
+    Deterministic stand-in for ChatAnthropic.
+    It answers every structured request the pipeline makes (discovery, usage extraction, planning,
+    fixing, coding, refinement) from the prompt alone. Latency and token counts are configurable.
+    """
+
+    model_name: str = "fake-claude"
+    latency_ms: float = 0.0
+    ms_per_output_token: float = 0.0
+    chars_per_token: int = 4
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-anthropic"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    def bind_tools(self, tools, tool_choice: Optional[str] = None, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[List[Dict]]) -> AIMessage:
+        system = "\n".join(_text(m) for m in messages if m.type == "system")
+        human = "\n".join(_text(m) for m in messages if m.type != "system")
+        tool_names = [tool["function"]["name"] for tool in tools or []]
+
+        tool_calls = []
+        content = ""
+        if "DiscoveryResult" in tool_names:
+            library = human.rsplit(":", 1)[-1].strip()
+            tool_calls.append(("DiscoveryResult", {"import_names": [library]}))
+        elif "FileAnalysisResult" in tool_names:
+            tool_calls.append(("FileAnalysisResult", {"usages": self._extract_usages(system, human)}))
+        elif "MigrationBatch" in tool_names:
+            tool_calls.append(("MigrationBatch", {"tasks": self._plan(human)}))
+        elif "RefinedAdviceBatch" in tool_names:
+            elements = re.findall(r"^=== ELEMENT: (.+?) ===$", human, re.M)
+            tool_calls.append(("RefinedAdviceBatch", {"advices": [{
+                "element": element,
+                "status": "Changed",
+                "instruction": f"Use the {element} API of the target version.",
+                "example": {"before": "old_call(x)", "after": "new_call(x)"}
+            } for element in elements]}))
+        elif "edit_file" in tool_names:
+            tool_calls, content = self._tool_loop_turn(messages, human, tool_names)
+        elif "write_file" in tool_names:
+            for path, code in self._rewrite_files(system, human):
+                tool_calls.append(("write_file", {"file_path": path, "content": code}))
+        else:
+            element = re.search(r"element['\"]?\s*[:=]?\s*['\"]?([\w.]+)", human)
+            content = json.dumps({
+                "status": "Changed",
+                "instruction": f"Use the {element.group(1) if element else 'new'} API of the target version.",
+                "example": {"before": "old_call(x)", "after": "new_call(x)"}
+            })
+
+        output_text = content + "".join(json.dumps(args) for _, args in tool_calls)
+        input_tokens = max(1, len(system + human) // self.chars_per_token)
+        output_tokens = max(1, len(output_text) // self.chars_per_token)
+
+        return AIMessage(
+            content=content,
+            tool_calls=[{"name": name, "args": args, "id": f"call_{i}"} for i, (name, args) in enumerate(tool_calls)],
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens
+            }
+        )
+
+    @staticmethod
+    def _extract_usages(system: str, human: str) -> List[Dict]:
+        library_match = re.search(r"usages of the library '([^']+)'", system)
+        library = library_match.group(1) if library_match else ""
+        code = human.split("```", 2)[1] if human.count("```") >= 2 else human
+
+        prefixes, bare_names = set(), set()
+        for line in code.splitlines():
+            alias = re.match(rf"\s*import {re.escape(library)}(?: as (\w+))?\s*$", line)
+            if alias:
+                prefixes.add(alias.group(1) or library)
+            names = re.match(rf"\s*from {re.escape(library)} import (.+)$", line)
+            if names:
+                bare_names.update(name.strip().split(" as ")[-1] for name in names.group(1).split(","))
+
+        usages = []
+        for number, line in enumerate(code.splitlines(), start=1):
+            for prefix, method in re.findall(r"(?:\b(\w+)\.)?\b(\w+)\(", line):
+                if (prefix and prefix in prefixes) or (not prefix and method in bare_names):
+                    usages.append({"method_name": method, "code_snippet": line.strip(), "line_number": number})
+        return usages
+
+    @staticmethod
+    def _plan(human: str) -> List[Dict]:
+        if "Fix these runtime errors:" in human:
+            errors = _json_after(human, "Fix these runtime errors:")
+            files = sorted({err.get("file", "") for err in errors if err.get("file")})
+            return [{"task_id": 0, "title": f"FIX: {path}", "description": "Fix reported errors.",
+                     "files": [path], "status": "pending"} for path in files]
+
+        patterns = _json_after(human, "Analyze this batch of usage patterns:")
+        return [{
+            "task_id": 0,
+            "title": f"Migrate {pattern.get('title', '')}",
+            "description": pattern.get("migration_guide", ""),
+            "files": pattern.get("affected_files", []),
+            "pattern_ids": [pattern.get("pattern_id", 0)],
+            "status": "pending"
+        } for pattern in patterns]
+
+    @staticmethod
+    def _rewrite_files(system: str, human: str) -> List[tuple]:
+        title_match = re.search(r"Title: (.+)", human) or re.search(r"Title: (.+)", system)
+        title = title_match.group(1).strip() if title_match else "task"
+        marker = f"# migrated: {title}"
+
+        rewritten = []
+        for path, code in re.findall(r"--- FILE: (.+?) ---\n(.*?)(?=\n--- FILE: |\nCURRENT TASK:|\Z)", human, re.S):
+            if marker not in code:
+                rewritten.append((path, code.rstrip("\n") + f"\n{marker}\n"))
+        return rewritten
+
+    @staticmethod
+    def _tool_loop_turn(messages: List[BaseMessage], human: str, tool_names: List[str]) -> tuple:
+        """
+        One turn of the coder's tool loop: grep each file for the task marker and read its first line,
+        then add the marker after that line with edit_file, then finish.
+        """
+        title_match = re.search(r"Title: (.+)", human)
+        marker = f"# migrated: {title_match.group(1).strip() if title_match else 'task'}"
+        files_match = re.search(r"FILES TO EDIT:\n(.+)", human)
+        files = [path.strip() for path in files_match.group(1).split(",")] if files_match else []
+
+        last_ai = next((m for m in reversed(messages) if m.type == "ai"), None)
+        if last_ai is None:
+            if "read_file_range" not in tool_names:
+                return [], "Done."
+            calls = []
+            for path in files:
+                calls.append(("grep_in_file", {"file_path": path, "pattern": re.escape(marker)}))
+                calls.append(("read_file_range", {"file_path": path, "start_line": 1, "end_line": 1}))
+            return calls, ""
+
+        results = {m.tool_call_id: _text(m) for m in messages if m.type == "tool"}
+        previous = [(call["name"], call["args"], results.get(call["id"], "")) for call in last_ai.tool_calls]
+        needs_edit = {args["file_path"] for name, args, result in previous
+                      if name == "grep_in_file" and result.startswith("No matches")}
+        calls = []
+        for name, args, result in previous:
+            first_line = re.match(r"^\s*1\t(.*)$", result, re.M)
+            if name == "read_file_range" and args["file_path"] in needs_edit and first_line:
+                line = first_line.group(1)
+                calls.append(("edit_file", {"file_path": args["file_path"], "old_text": line,
+                                            "new_text": f"{line}\n{marker}"}))
+        return calls, "" if calls else "Done."
+
+    def _delay(self, message: AIMessage) -> float:
+        output_tokens = message.usage_metadata["output_tokens"] if message.usage_metadata else 0
+        return (self.latency_ms + self.ms_per_output_token * output_tokens) / 1000.0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._respond(messages, kwargs.get("tools"))
+        time.sleep(self._delay(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._respond(messages, kwargs.get("tools"))
+        await asyncio.sleep(self._delay(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class FakeContext7Server:
+    """
+    Local HTTP server that mimics the two Context7 endpoints the pipeline uses.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, advice_kb: int = 4):
+        self.latency_ms = latency_ms
+        self.advice_kb = advice_kb
+        self.requests = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/api/v2"
+
+    def start(self) -> "FakeContext7Server":
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                time.sleep(server.latency_ms / 1000.0)
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+
+                if url.path.endswith("/libs/search"):
+                    name = params.get("libraryName", ["lib"])[0]
+                    body = json.dumps({"results": [{"id": f"/fake/{name}"}]}).encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    query = params.get("query", [""])[0]
+                    # One relevant section among unrelated ones, like a real Context7 answer.
+                    section = f"### {query[:80]}\n**Status**: Changed\n**Instruction**: Use the new API.\n"
+                    filler = "Lorem ipsum documentation text. " * 32
+                    unrelated = [f"### Unrelated topic {i}\n{filler}" for i in range(max(1, server.advice_kb))]
+                    text = "\n--------------------------------\n".join([section + filler] + unrelated)
+                    body = text.encode("utf-8")
+                    content_type = "text/plain"
+
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+class LocalSerena:
+    """
+    Filesystem-only stand-in for SerenaTool, for machines without a language server.
+    """
+
+    def __init__(self, workspace_path: str):
+        self.workspace_path = workspace_path
+
+    async def start(self):
+        return None
+
+    def release(self):
+        return None
+
+    async def find_candidate_files(self, search_patterns: List[str]) -> List[str]:
+        found = []
+        for root, dirs, files in os.walk(self.workspace_path):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if not name.endswith(".py"):
+                    continue
+                path = os.path.join(root, name)
+                with open(path, "r", encoding="utf-8") as f:
+                    content = f.read()
+                if any(pattern in content for pattern in search_patterns):
+                    found.append(os.path.relpath(path, self.workspace_path))
+        return sorted(found)
+
+    async def read_file(self, file_path: str) -> str:
+        with open(os.path.join(self.workspace_path, file_path), "r", encoding="utf-8") as f:
+            return f.read()
@@ -0,0 +1,67 @@
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+from typing import List
+
+import typer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be loaded just by importing main (only when a stage that needs them runs).
+HEAVY_MODULES = ["langgraph", "langchain_anthropic", "anthropic", "langchain_core", "serena", "httpx"]
+
+app = typer.Typer(help="Cold-start regression check for the CLI entry point.")
+
+
+def _timed_run(args: List[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=REPO_ROOT, capture_output=True, check=False)
+    return time.perf_counter() - start
+
+
+def _loaded_heavy_modules() -> List[str]:
+    probe = (
+        "import sys, json, main; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run([sys.executable, "-c", probe], cwd=REPO_ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing main failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+@app.command()
+def run(
+    repeats: int = typer.Option(5, "--repeats", help="Cold starts per measurement; the median is reported"),
+    max_seconds: float = typer.Option(0.8, "--max-seconds", help="Allowed median time for `main.py --help`")
+):
+    """
+    Measure cold start of `import main` and `main.py --help`, and fail if heavy dependencies load eagerly.
+    """
+    heavy = _loaded_heavy_modules()
+    import_seconds = statistics.median(_timed_run(["-c", "import main"]) for _ in range(repeats))
+    help_seconds = statistics.median(_timed_run(["main.py", "--help"]) for _ in range(repeats))
+
+    typer.echo(json.dumps({
+        "import_main_seconds": round(import_seconds, 3),
+        "help_seconds": round(help_seconds, 3),
+        "heavy_modules_loaded": heavy
+    }, indent=2))
+
+    failures = []
+    if heavy:
+        failures.append(f"`import main` loads heavy modules eagerly: {', '.join(heavy)}")
+    if help_seconds > max_seconds:
+        failures.append(f"`main.py --help` took {help_seconds:.2f}s (limit {max_seconds:.2f}s)")
+
+    if failures:
+        typer.echo("Cold start regressions:\n  " + "\n  ".join(failures))
+        raise typer.Exit(code=1)
+    typer.echo("Cold start OK.")
+
+
+if __name__ == "__main__":
+    app()
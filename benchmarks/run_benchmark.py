@@ -0,0 +1,190 @@
+import os
+import json
+import asyncio
+import tempfile
+from typing import Dict, Optional
+
+import typer
+
+from benchmarks.fakes import FakeChatAnthropic, FakeContext7Server, LocalSerena
+from benchmarks.synthetic_repo import generate_repo
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# Lower is better for every compared metric.
+COMPARED_METRICS = ["wall_seconds", "search_seconds", "analyzer_seconds", "coder_seconds", "tester_seconds"]
+
+app = typer.Typer(help="End-to-end pipeline benchmark on synthetic repositories with local LLM/Context7 fakes.")
+
+
+def _install_fakes(llm_latency_ms: float, ms_per_output_token: float, real_serena: bool):
+    """
+    Points the LLM gateway at FakeChatAnthropic and, unless asked otherwise,
+    replaces Serena with a filesystem scan.
+    """
+    import agents.searcher.searcher as searcher
+    import agents.tools.llm_gateway as llm_gateway
+
+    def factory(**kwargs):
+        return FakeChatAnthropic(
+            model_name=kwargs.get("model_name") or kwargs.get("model") or "fake-claude",
+            latency_ms=llm_latency_ms,
+            ms_per_output_token=ms_per_output_token
+        )
+
+    llm_gateway.ChatAnthropic = factory
+    llm_gateway._models.clear()
+
+    if not real_serena:
+        searcher.SerenaTool = LocalSerena
+
+
+def _stage_report(summary: Dict, run_dir: str, repo_info: Dict) -> Dict:
+    nodes = summary["nodes"]
+
+    def seconds(*names: str) -> float:
+        return round(sum(nodes.get(name, {}).get("seconds", 0.0) for name in names), 3)
+
+    def count(path: str, predicate=lambda item: True) -> int:
+        try:
+            with open(os.path.join(run_dir, path), "r", encoding="utf-8") as f:
+                return sum(1 for item in json.load(f) if predicate(item))
+        except (OSError, json.JSONDecodeError):
+            return 0
+
+    from agents.tools.io.json_handlers import iter_jsonl
+
+    patterns = sum(1 for _ in iter_jsonl(os.path.join(run_dir, "usage.jsonl")))
+    tasks = count("migration_plan.json", lambda task: task.get("status") == "done")
+    search_seconds = seconds("searcher", "pipeline")
+    coder_seconds = seconds("coder")
+
+    def rate(amount: int, duration: float) -> float:
+        return round(amount / duration, 2) if duration else 0.0
+
+    return {
+        "wall_seconds": summary["wall_seconds"],
+        "search_seconds": search_seconds,
+        "analyzer_seconds": seconds("analyzer"),
+        "coder_seconds": coder_seconds,
+        "tester_seconds": seconds("tester"),
+        "files_scanned_per_s": rate(repo_info["files"], search_seconds),
+        "patterns_per_s": rate(patterns, search_seconds),
+        "tasks_per_s": rate(tasks, coder_seconds or search_seconds),
+        "patterns": patterns,
+        "tasks_done": tasks,
+        "llm_calls": sum(node.get("llm_calls", 0) for node in nodes.values()),
+        "input_tokens": sum(node.get("input_tokens", 0) for node in nodes.values()),
+        "output_tokens": sum(node.get("output_tokens", 0) for node in nodes.values())
+    }
+
+
+async def run_scenario(files: int, call_sites: int, aliases: int, llm_latency_ms: float,
+                       ms_per_output_token: float, context7_latency_ms: float, advice_kb: int,
+                       stream: bool, real_serena: bool, llm_cache: str = "off",
+                       llm_cache_dir: Optional[str] = None) -> Dict:
+    import main
+    from agents.tools.shared_cache import ALL_MEMOS
+    from agents.tools.response_cache import DEFAULT_CACHE_DIR, configure_response_cache
+    from agents.tools.telemetry import current_metrics
+    from agents.tools.token_usage import TokenUsageTracker, use_tracker
+    from agents.tools.run_store import get_run_dir
+    from agents.tools.recipes import configure_recipes
+
+    workdir = tempfile.mkdtemp(prefix="migrator-bench-")
+    repo_path = os.path.join(workdir, "repo")
+    repo_info = generate_repo(repo_path, files=files, call_sites=call_sites, aliases=aliases)
+
+    server = FakeContext7Server(latency_ms=context7_latency_ms, advice_kb=advice_kb).start()
+    os.environ["CONTEXT7_BASE_URL"] = server.base_url
+    os.environ["CONTEXT7_API_KEY"] = "benchmark"
+    os.environ["ANTHROPIC_API_KEY"] = "benchmark"
+    # init_migration_branch writes to the global git config; keep that out of the user's config.
+    os.environ["GIT_CONFIG_GLOBAL"] = os.path.join(workdir, "gitconfig")
+    # Nor recipes learned from fake edits in the user's recipe store.
+    configure_recipes(True, os.path.join(workdir, "recipes.json"))
+
+    _install_fakes(llm_latency_ms, ms_per_output_token, real_serena)
+    configure_response_cache(llm_cache, llm_cache_dir or DEFAULT_CACHE_DIR)
+    for memo in ALL_MEMOS:
+        memo.clear()
+        memo.hits = memo.misses = 0
+    use_tracker(TokenUsageTracker())
+
+    try:
+        # Fake latencies must not end up in the history the dry-run estimator projects from.
+        final_state = await main.run_migration(repo_path, "pandas", "1.5.3", "2.2.0", stream=stream,
+                                               record_history=False)
+    finally:
+        server.stop()
+
+    summary = current_metrics().summary()
+    report = _stage_report(summary, get_run_dir(repo_path), repo_info)
+    report["routing"] = summary["routing"]
+    report["caches"] = summary["caches"]
+    report["final_status"] = final_state.get("final_status", final_state.get("status"))
+    report["context7_requests"] = server.requests
+    return report
+
+
+def _scenario_name(files: int, call_sites: int, aliases: int, stream: bool) -> str:
+    return f"files{files}-sites{call_sites}-aliases{aliases}{'-stream' if stream else ''}"
+
+
+def _compare(report: Dict, baseline: Optional[Dict], tolerance: float) -> list:
+    if not baseline:
+        return []
+    regressions = []
+    for metric in COMPARED_METRICS:
+        old, new = baseline.get(metric, 0.0), report.get(metric, 0.0)
+        if old and new > old * (1 + tolerance):
+            regressions.append(f"{metric}: {old:.3f}s -> {new:.3f}s (+{(new / old - 1):.0%})")
+    return regressions
+
+
+@app.command()
+def run(
+    files: int = typer.Option(20, "--files", help="Python files in the synthetic repository"),
+    call_sites: int = typer.Option(100, "--call-sites", help="Library call sites spread over the files"),
+    aliases: int = typer.Option(4, "--aliases", help="Number of different import styles (1-4)"),
+    llm_latency_ms: float = typer.Option(50.0, "--llm-latency-ms", help="Fixed latency of each fake LLM call"),
+    ms_per_output_token: float = typer.Option(0.0, "--ms-per-output-token", help="Extra fake LLM latency per token"),
+    context7_latency_ms: float = typer.Option(30.0, "--context7-latency-ms", help="Latency of the fake Context7"),
+    advice_kb: int = typer.Option(4, "--advice-kb", help="Approximate size of each fake Context7 answer"),
+    stream: bool = typer.Option(False, "--stream", help="Benchmark the streaming pipeline"),
+    real_serena: bool = typer.Option(False, "--real-serena", help="Use Serena instead of a filesystem scan"),
+    save_baseline: bool = typer.Option(False, "--save-baseline", help="Store this result as the new baseline"),
+    tolerance: float = typer.Option(0.2, "--tolerance", help="Allowed slowdown against the baseline (0.2 = 20%)"),
+    llm_cache: str = typer.Option("off", "--llm-cache", help="LLM response cache mode: off, on, record or replay"),
+    llm_cache_dir: Optional[str] = typer.Option(None, "--llm-cache-dir", help="Directory of the LLM response cache")
+):
+    """
+    Run one benchmark scenario, print per-stage throughput and compare it with the stored baseline.
+    """
+    report = asyncio.run(run_scenario(files, call_sites, aliases, llm_latency_ms, ms_per_output_token,
+                                      context7_latency_ms, advice_kb, stream, real_serena, llm_cache,
+                                      llm_cache_dir))
+    name = _scenario_name(files, call_sites, aliases, stream)
+    typer.echo(json.dumps({name: report}, indent=2))
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    regressions = _compare(report, baselines.get(name), tolerance)
+
+    if save_baseline:
+        baselines[name] = report
+        with open(BASELINES_PATH, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2)
+        typer.echo(f"Baseline for {name} saved to {BASELINES_PATH}")
+    elif regressions:
+        typer.echo("Performance regressions against the baseline:\n  " + "\n  ".join(regressions))
+        raise typer.Exit(code=1)
+    elif name in baselines:
+        typer.echo(f"No regressions against the baseline for {name}.")
+
+
+if __name__ == "__main__":
+    app()
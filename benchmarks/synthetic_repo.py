@@ -0,0 +1,69 @@
+import os
+import random
+import subprocess
+from typing import Dict
+
+METHODS = [
+    "read_csv", "DataFrame", "concat", "merge", "to_datetime", "read_json",
+    "pivot_table", "get_dummies", "Series", "date_range", "isna", "cut"
+]
+
+IMPORT_STYLES = [
+    ("import {library} as pd", "pd.{method}"),
+    ("import {library}", "{library}.{method}"),
+    ("import {library} as {library}_lib", "{library}_lib.{method}"),
+    ("from {library} import {method}", "{method}"),
+]
+
+
+def generate_repo(path: str, library: str = "pandas", files: int = 20, call_sites: int = 100,
+                  aliases: int = 4, seed: int = 0) -> Dict[str, int]:
+    """
+    Creates a git repository with `files` Python modules that contain `call_sites` calls
+    into `library`, imported through up to `aliases` different import styles.
+    """
+    rng = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    styles = IMPORT_STYLES[:max(1, min(aliases, len(IMPORT_STYLES)))]
+
+    per_file = [call_sites // files + (1 if i < call_sites % files else 0) for i in range(files)]
+
+    for index, sites in enumerate(per_file):
+        package = os.path.join(path, f"pkg_{index % 5}")
+        os.makedirs(package, exist_ok=True)
+        init_path = os.path.join(package, "__init__.py")
+        if not os.path.exists(init_path):
+            open(init_path, "w", encoding="utf-8").close()
+
+        import_template, call_template = styles[index % len(styles)]
+        methods = [rng.choice(METHODS) for _ in range(sites)]
+
+        if "{method}" in import_template:
+            imports = sorted({import_template.format(library=library, method=method) for method in methods})
+        else:
+            imports = [import_template.format(library=library)]
+
+        lines = imports + ["", ""]
+        lines.append(f"def job_{index}(data):")
+        if not methods:
+            lines.append("    return data")
+        for site, method in enumerate(methods):
+            call = call_template.format(library=library, method=method)
+            lines.append(f"    result_{site} = {call}(data)")
+        if methods:
+            lines.append(f"    return result_{len(methods) - 1}")
+
+        with open(os.path.join(package, f"module_{index}.py"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    _git(path, "init", "-q")
+    _git(path, "config", "user.email", "bench@example.com")
+    _git(path, "config", "user.name", "Benchmark")
+    _git(path, "add", ".")
+    _git(path, "commit", "-q", "-m", "Synthetic benchmark repository")
+
+    return {"files": files, "call_sites": call_sites, "aliases": len(styles)}
+
+
+def _git(path: str, *args: str):
+    subprocess.run(["git", "-C", path, *args], check=True, capture_output=True)
@@ -1,14 +1,18 @@
+import os
+import sys
 import asyncio
+import time
+import functools
 import typer
 from dotenv import load_dotenv
-from typing import Optional, TypedDict
-from langgraph.graph import StateGraph, START, END
+from typing import Dict, List, Optional, TypedDict
 from agents.tools.logger_config import setup_logger
-from agents.tools.git_ops import init_migration_branch, cleanup_migration_artifacts
-from agents.searcher.searcher import searcher_node
-from agents.analyzer.analyzer import analyzer_node
-from agents.coder.coder import coder_node
-from agents.tester.tester import tester_node
+from agents.tester.convergence import DEFAULT_MAX_ITERATIONS
+from agents.tools.run_store import get_run_dir, get_checkpoint_path, new_run_info, load_run_info
+from agents.tools.libraries import describe_libraries, parse_libraries, state_libraries
+
+# langgraph, LangChain, Serena and the node modules are imported inside the functions that need them,
+# so `--help`, argument validation and `--resume` lookups start without paying for them.
 
 load_dotenv()
 logger = setup_logger()
@@ -18,6 +22,8 @@ class MigrationState(TypedDict, total=False):
     library: str
     old_version: str
     new_version: str
+    # Set when several libraries are migrated together; library/old_version/new_version hold the first one.
+    libraries: List[Dict]
     message: Optional[str]
     usage_path: str
     plan_path: str
@@ -25,9 +31,23 @@ class MigrationState(TypedDict, total=False):
     status: str
     has_pending_tasks: bool
     needs_analysis: bool
+    final_status: str
+    started_at: float
+    max_iterations: int
+    max_wall_seconds: int
+    max_tokens: int
+    fix_iteration: int
+    fix_base_commit: str
+    error_history: List[List[str]]
+    reverted_tasks: List[str]
+    tokens_used: int
+    migration_base_commit: str
 
 
 def route_after_coder(state: MigrationState) -> str:
+    if state.get("status") == "budget_exhausted":
+        logger.info("Router: Budget exhausted. Checking the committed work before finishing.")
+        return "tester"
     if state.get("has_pending_tasks"):
         logger.info("Router: Pending tasks remain. Returning to coder.")
         return "coder"
@@ -37,21 +57,49 @@ def route_after_coder(state: MigrationState) -> str:
 
 def route_after_tester(state: MigrationState) -> str:
     if state.get("needs_analysis"):
-        logger.info("Router: Test errors detected. Returning to analyzer.")
-        return "analyzer"
+        logger.info("Router: Test errors detected. Bisecting task commits.")
+        return "bisector"
     logger.info("Router: Tests complete. Finishing.")
     return "end"
 
 
-def build_graph():
+def route_after_bisector(state: MigrationState) -> str:
+    if state.get("has_pending_tasks"):
+        logger.info("Router: Breaking tasks re-queued. Returning to coder.")
+        return "coder"
+    logger.info("Router: Errors not attributable to a task. Returning to analyzer.")
+    return "analyzer"
+
+
+def build_graph(checkpointer=None, streaming: bool = False):
+    from langgraph.graph import StateGraph, START, END
+    from agents.searcher.searcher import searcher_node
+    from agents.analyzer.analyzer import analyzer_node
+    from agents.coder.coder import coder_node
+    from agents.tester.tester import tester_node
+    from agents.bisector.bisector import bisector_node
+    from agents.tools.telemetry import instrument_node
+
     builder = StateGraph(MigrationState)
-    builder.add_node("searcher", searcher_node)
-    builder.add_node("analyzer", analyzer_node)
-    builder.add_node("coder", coder_node)
-    builder.add_node("tester", tester_node)
+    builder.add_node("analyzer", instrument_node("analyzer", analyzer_node))
+    builder.add_node("coder", instrument_node("coder", coder_node))
+    builder.add_node("tester", instrument_node("tester", tester_node))
+    builder.add_node("bisector", instrument_node("bisector", bisector_node))
+
+    if streaming:
+        from agents.pipeline.streaming import streaming_node
+        builder.add_node("pipeline", instrument_node("pipeline", streaming_node))
+        builder.add_edge(START, "pipeline")
+        builder.add_conditional_edges(
+            "pipeline",
+            route_after_coder,
+            {"coder": "coder", "tester": "tester"}
+        )
+    else:
+        builder.add_node("searcher", instrument_node("searcher", searcher_node))
+        builder.add_edge(START, "searcher")
+        builder.add_edge("searcher", "analyzer")
 
-    builder.add_edge(START, "searcher")
-    builder.add_edge("searcher", "analyzer")
     builder.add_edge("analyzer", "coder")
     builder.add_conditional_edges(
         "coder",
@@ -61,50 +109,655 @@ def build_graph():
     builder.add_conditional_edges(
         "tester",
         route_after_tester,
-        {"analyzer": "analyzer", "end": END}
+        {"bisector": "bisector", "end": END}
     )
-    return builder.compile()
+    builder.add_conditional_edges(
+        "bisector",
+        route_after_bisector,
+        {"coder": "coder", "analyzer": "analyzer"}
+    )
+    return builder.compile(checkpointer=checkpointer)
+
+
+@functools.lru_cache(maxsize=None)
+def get_graph(streaming: bool = False):
+    """
+    Compiled graph without a checkpointer, built on first use.
+    """
+    return build_graph(streaming=streaming)
+
+
+def __getattr__(name: str):
+    # `main.GRAPH` used to be built at import time; it is now compiled when first accessed.
+    if name == "GRAPH":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def run_migration(project_path: str, library: str, old_version: str, new_version: str,
+                        message: Optional[str] = None, max_iterations: int = DEFAULT_MAX_ITERATIONS,
+                        max_wall_seconds: int = 0, max_tokens: int = 0, resume: bool = False,
+                        stream: bool = False, run_info: Optional[dict] = None, budget: Optional[str] = None,
+                        libraries: Optional[List[Dict]] = None, record_history: bool = True) -> dict:
+    """
+    Runs (or resumes) one migration with checkpointing and returns the final graph state.
+    With libraries (several {"library", "old_version", "new_version"}), they are migrated together:
+    one repository scan, one merged plan and one shared fix loop.
+    Token usage is recorded in the tracker bound to the current context. Timings, tokens and
+    cache hit rates are written to run_metrics.json and trace.json in the run directory.
+    With a budget ("500k", "$25", "90min"), patterns are processed by priority and the run stops
+    cleanly when it is spent; the patterns left are written to budget_report.json.
+    Successful runs against the real API are added to the dry-run estimator's history unless record_history
+    is False (benchmarks with fake latencies).
+    """
+    from agents.tools.token_usage import current_usage
+    from agents.tools.telemetry import RunMetrics, use_metrics
+    from agents.tools.budget import Budget, use_budget
+    from agents.coder.file_tools import FileCache, use_file_cache
+    from agents.tools.io.json_handlers import save_json_file
+    from agents.estimator.estimator import record_run
+    from agents.tools.response_cache import replaying
 
+    tracker = current_usage()
+    metrics = RunMetrics()
+    use_metrics(metrics)
+    run_budget = Budget.parse(budget) if budget else None
+    use_budget(run_budget)
+    use_file_cache(FileCache())
+
+    final_state = None
+    try:
+        final_state = await _run_graph(project_path, library, old_version, new_version, message, max_iterations,
+                                       max_wall_seconds, max_tokens, resume, stream, run_info, tracker, metrics,
+                                       libraries if libraries and len(libraries) > 1 else None)
+        return final_state
+    finally:
+        # Failed, cut-short and replayed runs would skew the projected calls and latencies.
+        if record_history and final_state and final_state.get("final_status") == "success" and not replaying():
+            record_run(metrics.summary())
+        if os.path.isdir(project_path):
+            paths = metrics.write(get_run_dir(project_path))
+            logger.info(f"Run metrics written to {paths['metrics']}, trace to {paths['trace']}")
+            if run_budget is not None:
+                report_path = os.path.join(get_run_dir(project_path), "budget_report.json")
+                save_json_file(report_path, run_budget.report())
+                logger.info(f"Budget: {run_budget.describe()} used, {len(run_budget.deferred_patterns)} patterns "
+                            f"left. Report written to {report_path}")
+
+
+async def _run_graph(project_path: str, library: str, old_version: str, new_version: str,
+                     message: Optional[str], max_iterations: int, max_wall_seconds: int, max_tokens: int,
+                     resume: bool, stream: bool, run_info: Optional[dict], tracker, metrics,
+                     libraries: Optional[List[Dict]] = None) -> dict:
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    from agents.tools.git_ops import init_migration_branch, cleanup_migration_artifacts, get_head_commit
+    from agents.coder.coder import reset_interrupted_tasks
+    from agents.tools.telemetry import TelemetryCallback
+    from agents.tools.recipes import learn_from_run
+
+    init_migration_branch(project_path, resume=resume)
+    run_dir = get_run_dir(project_path)
+    current_run = run_info if resume else new_run_info(project_path, library, old_version, new_version,
+                                                       streaming=stream, libraries=libraries)
+    config = {
+        "configurable": {"thread_id": current_run["thread_id"]},
+        "callbacks": [tracker, TelemetryCallback(metrics)]
+    }
+
+    finished_before = False
+    async with AsyncSqliteSaver.from_conn_string(get_checkpoint_path(project_path)) as checkpointer:
+        graph = build_graph(checkpointer, streaming=stream)
+
+        if resume:
+            snapshot = await graph.aget_state(config)
+            if not snapshot.values:
+                raise Exception(f"No checkpoint found for run {current_run['thread_id']}.")
+            if not snapshot.next:
+                logger.info("Resume: The previous run already finished.")
+                final_state = snapshot.values
+                # Its recipes were learned when it finished.
+                finished_before = True
+            else:
+                logger.info(f"Resume: Continuing from checkpoint before {list(snapshot.next)}.")
+                await _exclude_downtime(graph, config, snapshot)
+                reset_interrupted_tasks(snapshot.values.get("plan_path", ""))
+                tracker.reset(carried_tokens=snapshot.values.get("tokens_used", 0))
+                final_state = await graph.ainvoke(None, config=config)
+        else:
+            initial_state: MigrationState = {
+                "project_path": project_path,
+                "library": library,
+                "old_version": old_version,
+                "new_version": new_version,
+                "message": message,
+                "usage_path": os.path.join(run_dir, "usage.jsonl"),
+                "plan_path": os.path.join(run_dir, "migration_plan.json"),
+                "errors_path": os.path.join(run_dir, "errors.json"),
+                "started_at": time.time(),
+                "max_iterations": max_iterations,
+                "max_wall_seconds": max_wall_seconds,
+                "max_tokens": max_tokens,
+                "migration_base_commit": get_head_commit(project_path)
+            }
+            if libraries:
+                initial_state["libraries"] = libraries
+
+            tracker.reset()
+            final_state = await graph.ainvoke(initial_state, config=config)
+
+    if final_state.get("final_status") == "success" and not finished_before:
+        try:
+            # Reads git history; off the event loop so the other repositories of a fleet keep running.
+            await asyncio.to_thread(learn_from_run, project_path, final_state["plan_path"],
+                                    final_state["usage_path"], state_libraries(final_state))
+        except Exception as e:
+            logger.error(f"Recipes: Learning from the run failed: {e}")
+    cleanup_migration_artifacts(project_path)
+    return final_state
+
+
+async def _exclude_downtime(graph, config: dict, snapshot):
+    """
+    Moves started_at forward by the time between the last checkpoint and now, so --max-minutes only counts
+    the time the run was actually working. Work after the last checkpoint is redone and counts again.
+    """
+    from datetime import datetime
+
+    started_at = snapshot.values.get("started_at")
+    if not started_at or not snapshot.created_at:
+        return
+    downtime = time.time() - datetime.fromisoformat(snapshot.created_at).timestamp()
+    if downtime > 0:
+        await graph.aupdate_state(config, {"started_at": started_at + downtime})
+        logger.info(f"Resume: {downtime / 60:.1f} minutes since the interruption do not count against the "
+                    f"wall-clock budget.")
 
-GRAPH = build_graph()
 
 app = typer.Typer(help="AI Migrator — tool for automatic library updates.")
 
 @app.command()
 def migrate(
     project_path: str = typer.Argument("/project", help="Path to the project inside the container"),
-    library: str = typer.Option(..., "--lib", "-l", help="Library name"),
-    old_version: str = typer.Option(..., "--from", "-ov", help="Current version"),
-    new_version: str = typer.Option(..., "--to", "-nv", help="Target version"),
-    message: Optional[str] = typer.Option(None, "--message", "-m", help="Additional instructions for AI")
+    library: Optional[List[str]] = typer.Option(None, "--lib", "-l",
+                                                help="Library name; repeat --lib/--from/--to to migrate several "
+                                                     "libraries in one run, the one the others build on first"),
+    old_version: Optional[List[str]] = typer.Option(None, "--from", "-ov", help="Current version (one per --lib)"),
+    new_version: Optional[List[str]] = typer.Option(None, "--to", "-nv", help="Target version (one per --lib)"),
+    message: Optional[str] = typer.Option(None, "--message", "-m", help="Additional instructions for AI"),
+    max_iterations: int = typer.Option(DEFAULT_MAX_ITERATIONS, "--max-iterations",
+                                       help="Maximum fix iterations after the first test run (0 = unlimited)"),
+    max_minutes: int = typer.Option(0, "--max-minutes", help="Wall-clock budget in minutes (0 = unlimited)"),
+    max_tokens: int = typer.Option(0, "--max-tokens", help="LLM token budget for the whole run (0 = unlimited)"),
+    budget: Optional[str] = typer.Option(None, "--budget",
+                                         help="Spend limit in tokens (500k), USD ($25) or time (90min); "
+                                              "patterns run by priority and the run stops cleanly when it is spent"),
+    dry_run: bool = typer.Option(False, "--dry-run",
+                                 help="Only scan the repository and project LLM/Context7 calls, tokens, cost and time"),
+    resume: bool = typer.Option(False, "--resume", help="Continue the last interrupted run from its checkpoint"),
+    stream: bool = typer.Option(False, "--stream",
+                                help="Overlap search, planning and coding instead of running them one after another"),
+    model_limits: Optional[str] = typer.Option(None, "--model-limits",
+                                               help="JSON file with per-model concurrency, rpm, tpm and hedging"),
+    model_routing: bool = typer.Option(True, "--model-routing/--no-model-routing",
+                                       help="Pick a model tier per request instead of always using the top model"),
+    llm_cache: str = typer.Option("off", "--llm-cache",
+                                  help="LLM response cache: on, off, record (write only) or replay (offline, strict)"),
+    llm_cache_dir: Optional[str] = typer.Option(None, "--llm-cache-dir", help="Directory of the LLM response cache"),
+    llm_cache_max_mb: int = typer.Option(1024, "--llm-cache-max-mb", help="Size limit of the LLM response cache"),
+    api_diff: bool = typer.Option(True, "--api-diff/--no-api-diff",
+                                  help="Skip Context7 for symbols a local diff of both versions shows as unchanged"),
+    wheelhouse: Optional[str] = typer.Option(None, "--wheelhouse",
+                                             help="Directory with wheels/sdists of both versions for the API diff"),
+    advice_packs: Optional[List[str]] = typer.Option(None, "--advice-pack",
+                                                     help="Advice pack file or directory that answers lookups "
+                                                          "before Context7 (repeatable)"),
+    checks: str = typer.Option("ruff", "--checks",
+                               help="Checkers the tester runs concurrently: ruff, mypy, pytest; "
+                                    "name:seconds sets a timeout, e.g. ruff,mypy:300,pytest"),
+    check_fail_fast: bool = typer.Option(False, "--check-fail-fast",
+                                         help="Stop slower checkers once ruff reports errors"),
+    recipes: bool = typer.Option(True, "--recipes/--no-recipes",
+                                 help="Replay rewrite recipes learned from earlier green runs instead of "
+                                      "planning those symbols with the LLM, and learn new ones"),
+    server: Optional[str] = typer.Option(None, "--server", envvar="MIGRATOR_SERVER",
+                                         help="Submit the job to a running `serve` process, e.g. http://127.0.0.1:8765"),
+    profile: bool = typer.Option(False, "--profile",
+                                 help="Sample CPU stacks and RSS per node; reports go next to agent.log"),
+    profile_memory: bool = typer.Option(False, "--profile-memory",
+                                        help="With --profile, also take tracemalloc snapshots (slower)")
 ):
-    logger.info(f"Library migration: {library} ({old_version} -> {new_version})")
+    """
+    Migrate one repository to a new library version.
+    """
+    if not resume and not (library and old_version and new_version):
+        raise typer.BadParameter("--lib, --from and --to are required unless --resume is given.")
+    libraries = None
+    if not resume:
+        try:
+            libraries = parse_libraries(library, old_version, new_version)
+        except ValueError as e:
+            raise typer.BadParameter(str(e))
+    _validate_budget(budget)
+    if server:
+        # A single library is sent as plain values, several as lists of the same length.
+        scalar = libraries is None or len(libraries) == 1
+        _submit_to_server(server, {
+            "project_path": os.path.abspath(project_path),
+            "library": library[0] if scalar and library else library,
+            "from": old_version[0] if scalar and old_version else old_version,
+            "to": new_version[0] if scalar and new_version else new_version,
+            "message": message, "max_iterations": max_iterations,
+            "max_minutes": max_minutes, "max_tokens": max_tokens, "budget": budget, "stream": stream,
+            "resume": resume, "advice_packs": [os.path.abspath(path) for path in advice_packs or []]
+        })
+        return
+    _apply_model_limits(model_limits)
+    _apply_model_routing(model_routing)
+    _apply_llm_cache(llm_cache, llm_cache_dir, llm_cache_max_mb)
+    _apply_api_diff(api_diff, wheelhouse)
+    _apply_advice_packs(advice_packs)
+    _apply_checks(checks, check_fail_fast)
+    _apply_recipes(recipes)
+
+    if dry_run:
+        if resume:
+            raise typer.BadParameter("--dry-run cannot be combined with --resume.")
+        if len(libraries) > 1:
+            raise typer.BadParameter("--dry-run estimates one library at a time.")
+        _dry_run(project_path, **libraries[0])
+        return
+
+    run_info = None
+    if resume:
+        run_info = load_run_info(project_path)
+        if not run_info:
+            raise typer.BadParameter(f"No previous run found in {project_path} to resume.")
+        libraries = state_libraries(run_info)
+        stream = run_info.get("streaming", False)
+        logger.info(f"Resuming library migration: {describe_libraries(libraries)}")
+    else:
+        logger.info(f"Library migration: {describe_libraries(libraries)}")
     if message:
         logger.info(f"Additional prompt: {message}")
 
     async def run_async_migration():
+        from agents.tools.token_usage import current_usage
+        from agents.tools.telemetry import current_metrics, format_summary
+
         try:
-            init_migration_branch(project_path)
-            initial_state: MigrationState = {
-                "project_path": project_path,
-                "library": library,
-                "old_version": old_version,
-                "new_version": new_version,
-                "message": message,
-                "usage_path": "usage.json",
-                "plan_path": "migration_plan.json",
-                "errors_path": "errors.json"
-            }
+            final_state = await run_migration(
+                project_path, **libraries[0], message=message,
+                max_iterations=max_iterations, max_wall_seconds=max_minutes * 60, max_tokens=max_tokens,
+                resume=resume, stream=stream, run_info=run_info, budget=budget, libraries=libraries
+            )
 
-            final_state = await GRAPH.ainvoke(initial_state)
-            cleanup_migration_artifacts(project_path)
-            logger.info(f"Migration finished with status: {final_state.get('status')}")
+            final_status = final_state.get("final_status", final_state.get("status"))
+            logger.info(f"Migration finished with status: {final_status}")
+            typer.echo(format_summary(current_metrics().summary()))
+            typer.echo(
+                f"Final status: {final_status} "
+                f"(fix iterations: {final_state.get('fix_iteration', 0)}, tokens: {current_usage().total_tokens})"
+            )
 
         except Exception as e:
             logger.error(f"Error during migration: {e}")
             raise typer.Exit(code=1)
 
-    asyncio.run(run_async_migration())
+    profiler = _start_profiler(profile_memory) if profile else None
+    try:
+        asyncio.run(run_async_migration())
+    finally:
+        if profiler:
+            typer.echo(f"Profile written to {profiler.stop()}")
+    _fail_on_replay_misses()
+
+
+@app.command()
+def fleet(
+    manifest: str = typer.Argument(..., help="JSON manifest with the repositories and target versions"),
+    report: str = typer.Option("fleet_report.json", "--report", help="Where to write the per-repo status report"),
+    max_parallel: int = typer.Option(0, "--max-parallel", help="Repositories migrated at once (0 = all)"),
+    pilot: int = typer.Option(0, "--pilot",
+                              help="Migrate this many repositories first, so the rest replay the recipes "
+                                   "learned from them (0 = all at once)"),
+    llm_concurrency: int = typer.Option(8, "--llm-concurrency", help="Concurrent LLM requests across the fleet"),
+    llm_rpm: int = typer.Option(0, "--llm-rpm", help="LLM requests per minute across the fleet (0 = unlimited)"),
+    llm_tpm: int = typer.Option(0, "--llm-tpm", help="LLM input tokens per minute across the fleet (0 = unlimited)"),
+    context7_concurrency: int = typer.Option(4, "--context7-concurrency",
+                                             help="Concurrent Context7 requests across the fleet"),
+    context7_rpm: int = typer.Option(0, "--context7-rpm",
+                                     help="Context7 requests per minute across the fleet (0 = unlimited)"),
+    max_iterations: int = typer.Option(DEFAULT_MAX_ITERATIONS, "--max-iterations",
+                                       help="Maximum fix iterations per repository (0 = unlimited)"),
+    max_minutes: int = typer.Option(0, "--max-minutes", help="Wall-clock budget per repository (0 = unlimited)"),
+    max_tokens: int = typer.Option(0, "--max-tokens", help="LLM token budget per repository (0 = unlimited)"),
+    budget: Optional[str] = typer.Option(None, "--budget",
+                                         help="Spend limit per repository in tokens (500k), USD ($25) or time (90min)"),
+    stream: bool = typer.Option(False, "--stream", help="Use the streaming pipeline for every repository"),
+    model_limits: Optional[str] = typer.Option(None, "--model-limits",
+                                               help="JSON file with per-model concurrency, rpm, tpm and hedging"),
+    model_routing: bool = typer.Option(True, "--model-routing/--no-model-routing",
+                                       help="Pick a model tier per request instead of always using the top model"),
+    llm_cache: str = typer.Option("off", "--llm-cache",
+                                  help="LLM response cache: on, off, record (write only) or replay (offline, strict)"),
+    llm_cache_dir: Optional[str] = typer.Option(None, "--llm-cache-dir", help="Directory of the LLM response cache"),
+    llm_cache_max_mb: int = typer.Option(1024, "--llm-cache-max-mb", help="Size limit of the LLM response cache"),
+    api_diff: bool = typer.Option(True, "--api-diff/--no-api-diff",
+                                  help="Skip Context7 for symbols a local diff of both versions shows as unchanged"),
+    wheelhouse: Optional[str] = typer.Option(None, "--wheelhouse",
+                                             help="Directory with wheels/sdists of both versions for the API diff"),
+    advice_packs: Optional[List[str]] = typer.Option(None, "--advice-pack",
+                                                     help="Advice pack file or directory that answers lookups "
+                                                          "before Context7 (repeatable)"),
+    checks: str = typer.Option("ruff", "--checks",
+                               help="Checkers the tester runs concurrently: ruff, mypy, pytest; "
+                                    "name:seconds sets a timeout, e.g. ruff,mypy:300,pytest"),
+    check_fail_fast: bool = typer.Option(False, "--check-fail-fast",
+                                         help="Stop slower checkers once ruff reports errors"),
+    recipes: bool = typer.Option(True, "--recipes/--no-recipes",
+                                 help="Replay rewrite recipes learned from earlier green runs instead of "
+                                      "planning those symbols with the LLM, and learn new ones")
+):
+    """
+    Migrate many repositories concurrently under shared rate limits and caches.
+    """
+    from agents.fleet.fleet import load_manifest, run_fleet
+    from agents.tools.limits import configure_limits
+
+    try:
+        jobs = load_manifest(manifest)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    if not jobs:
+        raise typer.BadParameter(f"Manifest {manifest} contains no repositories.")
+
+    _validate_budget(budget)
+    logger.info(f"Fleet migration of {len(jobs)} repositories.")
+    configure_limits(llm_concurrency, llm_rpm, context7_concurrency, context7_rpm, llm_tpm=llm_tpm)
+    _apply_model_limits(model_limits)
+    _apply_model_routing(model_routing)
+    _apply_llm_cache(llm_cache, llm_cache_dir, llm_cache_max_mb)
+    _apply_api_diff(api_diff, wheelhouse)
+    _apply_advice_packs(advice_packs)
+    _apply_checks(checks, check_fail_fast)
+    _apply_recipes(recipes)
+
+    async def run_job(job: dict) -> dict:
+        libraries = parse_libraries(job["library"], job["from"], job["to"])
+        return await run_migration(
+            job["project_path"], **libraries[0], message=job.get("message"),
+            max_iterations=max_iterations, max_wall_seconds=max_minutes * 60, max_tokens=max_tokens,
+            stream=stream, budget=job.get("budget", budget), libraries=libraries
+        )
+
+    results = asyncio.run(run_fleet(jobs, run_job, report, max_parallel=max_parallel, pilot=pilot))
+
+    for entry in results:
+        typer.echo(f"{entry['project_path']}: {entry['final_status']} "
+                   f"({entry['duration_seconds']}s, tokens: {entry['tokens']})")
+    typer.echo(f"Fleet report written to {report}")
+    _fail_on_replay_misses()
+
+    if any(entry["final_status"] == "error" for entry in results):
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", "--host", help="Interface to listen on"),
+    port: int = typer.Option(8765, "--port", help="Port to listen on"),
+    token: Optional[str] = typer.Option(None, "--token", envvar="MIGRATOR_SERVER_TOKEN",
+                                        help="Shared token every request must send in X-Migrator-Token; "
+                                             "required to listen beyond localhost"),
+    workers: int = typer.Option(2, "--workers", help="Jobs run at once (jobs on the same project never overlap)"),
+    serena_idle_minutes: int = typer.Option(30, "--serena-idle-minutes",
+                                            help="Shut down a project's Serena agent after this long without jobs"),
+    llm_concurrency: int = typer.Option(8, "--llm-concurrency", help="Concurrent LLM requests across all jobs"),
+    llm_rpm: int = typer.Option(0, "--llm-rpm", help="LLM requests per minute across all jobs (0 = unlimited)"),
+    llm_tpm: int = typer.Option(0, "--llm-tpm", help="LLM input tokens per minute across all jobs (0 = unlimited)"),
+    context7_concurrency: int = typer.Option(4, "--context7-concurrency",
+                                             help="Concurrent Context7 requests across all jobs"),
+    context7_rpm: int = typer.Option(0, "--context7-rpm",
+                                     help="Context7 requests per minute across all jobs (0 = unlimited)"),
+    model_limits: Optional[str] = typer.Option(None, "--model-limits",
+                                               help="JSON file with per-model concurrency, rpm, tpm and hedging"),
+    model_routing: bool = typer.Option(True, "--model-routing/--no-model-routing",
+                                       help="Pick a model tier per request instead of always using the top model"),
+    llm_cache: str = typer.Option("off", "--llm-cache",
+                                  help="LLM response cache: on, off, record (write only) or replay (offline, strict)"),
+    llm_cache_dir: Optional[str] = typer.Option(None, "--llm-cache-dir", help="Directory of the LLM response cache"),
+    llm_cache_max_mb: int = typer.Option(1024, "--llm-cache-max-mb", help="Size limit of the LLM response cache"),
+    api_diff: bool = typer.Option(True, "--api-diff/--no-api-diff",
+                                  help="Skip Context7 for symbols a local diff of both versions shows as unchanged"),
+    wheelhouse: Optional[str] = typer.Option(None, "--wheelhouse",
+                                             help="Directory with wheels/sdists of both versions for the API diff"),
+    advice_packs: Optional[List[str]] = typer.Option(None, "--advice-pack",
+                                                     help="Advice pack file or directory that answers lookups "
+                                                          "before Context7 (repeatable)"),
+    checks: str = typer.Option("ruff", "--checks",
+                               help="Checkers the tester runs concurrently: ruff, mypy, pytest; "
+                                    "name:seconds sets a timeout, e.g. ruff,mypy:300,pytest"),
+    check_fail_fast: bool = typer.Option(False, "--check-fail-fast",
+                                         help="Stop slower checkers once ruff reports errors"),
+    recipes: bool = typer.Option(True, "--recipes/--no-recipes",
+                                 help="Replay rewrite recipes learned from earlier green runs instead of "
+                                      "planning those symbols with the LLM, and learn new ones")
+):
+    """
+    Run a long-lived server that accepts migration jobs and keeps Serena, clients and caches warm.
+    """
+    from agents.server.daemon import MigrationServer, check_listen_address
+    from agents.tools.limits import configure_limits
+
+    try:
+        check_listen_address(host, token)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    configure_limits(llm_concurrency, llm_rpm, context7_concurrency, context7_rpm, llm_tpm=llm_tpm)
+    _apply_model_limits(model_limits)
+    _apply_model_routing(model_routing)
+    _apply_llm_cache(llm_cache, llm_cache_dir, llm_cache_max_mb)
+    _apply_api_diff(api_diff, wheelhouse)
+    _apply_advice_packs(advice_packs)
+    _apply_checks(checks, check_fail_fast)
+    _apply_recipes(recipes)
+
+    async def run_job(job: dict) -> dict:
+        if not job.get("advice_packs"):
+            return await run_server_job(job)
+        from agents.tools.advice_pack import reset_job_packs, use_job_packs
+
+        # A job's packs must not answer lookups of the jobs that run after it or next to it.
+        token = use_job_packs(job["advice_packs"])
+        try:
+            return await run_server_job(job)
+        finally:
+            reset_job_packs(token)
+
+    async def run_server_job(job: dict) -> dict:
+        run_info = None
+        if job.get("resume"):
+            run_info = load_run_info(job["project_path"])
+            if not run_info:
+                raise ValueError(f"No previous run found in {job['project_path']} to resume.")
+            libraries = state_libraries(run_info)
+        else:
+            libraries = parse_libraries(job.get("library"), job.get("from"), job.get("to"))
+
+        return await run_migration(
+            job["project_path"], **libraries[0], message=job.get("message"),
+            max_iterations=job.get("max_iterations", DEFAULT_MAX_ITERATIONS),
+            max_wall_seconds=job.get("max_minutes", 0) * 60, max_tokens=job.get("max_tokens", 0),
+            resume=bool(job.get("resume")),
+            stream=run_info.get("streaming", False) if run_info else bool(job.get("stream")), run_info=run_info,
+            budget=job.get("budget"), libraries=libraries
+        )
+
+    migration_server = MigrationServer(run_job, workers=workers, serena_idle_seconds=serena_idle_minutes * 60,
+                                       token=token)
+    asyncio.run(migration_server.serve(host, port))
+
+
+@app.command("export-advice")
+def export_advice(
+    project_path: str = typer.Argument("/project", help="Project whose last run's advice is exported"),
+    output: Optional[str] = typer.Option(None, "--output", "-o",
+                                         help="Pack file (default: advice-<lib>-<from>-<to>.json); "
+                                              "an existing pack for the same versions is merged")
+):
+    """
+    Export the refined migration advice of the last run into a reusable advice pack
+    (one pack per library for a multi-library run).
+    """
+    from agents.tools.advice_pack import default_pack_name, export_pack
+
+    run_info = load_run_info(project_path)
+    if not run_info:
+        raise typer.BadParameter(f"No previous run found in {project_path}.")
+    libraries = state_libraries(run_info)
+    if output and len(libraries) > 1:
+        raise typer.BadParameter("--output cannot be used for a run with several libraries; "
+                                 "each library gets its default pack name.")
+
+    run_dir = get_run_dir(project_path)
+    usage_path = os.path.join(run_dir, "usage.jsonl")
+    if not os.path.exists(usage_path):
+        usage_path = os.path.join(run_dir, "usage.json")
+
+    for spec in libraries:
+        library, old_version, new_version = spec["library"], spec["old_version"], spec["new_version"]
+        pack_path = output or default_pack_name(library, old_version, new_version)
+        try:
+            exported, total = export_pack(usage_path, library, old_version, new_version, pack_path)
+        except ValueError as e:
+            raise typer.BadParameter(str(e))
+        typer.echo(f"Exported {exported} entries for {library} {old_version} -> {new_version} "
+                   f"to {pack_path} ({total} in the pack).")
+
+
+def _submit_to_server(server: str, job: dict):
+    from agents.server.daemon import submit_job
+
+    try:
+        entry = submit_job(server, job)
+    except Exception as e:
+        logger.error(f"Submitting to {server} failed: {e}")
+        raise typer.Exit(code=1)
+
+    typer.echo(f"Final status: {entry.get('final_status')} "
+               f"(fix iterations: {entry.get('fix_iterations', 0)}, tokens: {entry.get('tokens', 0)}, "
+               f"{entry.get('duration_seconds')}s on the server)")
+    if entry.get("final_status") == "error":
+        raise typer.Exit(code=1)
+
+
+def _validate_budget(budget: Optional[str]):
+    if not budget:
+        return
+    from agents.tools.budget import Budget
+
+    try:
+        Budget.parse(budget)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+
+def _dry_run(project_path: str, library: str, old_version: str, new_version: str):
+    from agents.estimator.estimator import estimate_run, format_estimate, write_estimate
+
+    estimate = asyncio.run(estimate_run(project_path, library, old_version, new_version))
+    typer.echo(format_estimate(estimate))
+    typer.echo(f"Estimate written to {write_estimate(estimate, get_run_dir(project_path))}")
+
+
+def _apply_model_limits(path: Optional[str]):
+    if not path:
+        return
+    from agents.tools.llm_gateway import load_model_limits
+
+    try:
+        load_model_limits(path)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+
+def _apply_model_routing(enabled: bool):
+    from agents.tools.model_router import set_routing
+
+    set_routing(enabled)
+
+
+def _apply_llm_cache(mode: str, directory: Optional[str], max_mb: int):
+    from agents.tools.response_cache import DEFAULT_CACHE_DIR, configure_response_cache
+
+    try:
+        configure_response_cache(mode, directory or DEFAULT_CACHE_DIR, max_mb)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+
+def _apply_api_diff(enabled: bool, wheelhouse: Optional[str]):
+    from agents.tools.api_diff import configure_api_diff
+
+    configure_api_diff(enabled, wheelhouse)
+
+
+def _apply_advice_packs(paths: Optional[List[str]]):
+    if not paths:
+        return
+    from agents.tools.advice_pack import load_packs
+
+    try:
+        entries = load_packs(paths)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    logger.info(f"Advice packs: {entries} entries loaded.")
+
+
+def _apply_checks(checks: str, fail_fast: bool):
+    from agents.tools.testing.composite import configure_checks
+
+    try:
+        configure_checks(checks, fail_fast)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+
+def _apply_recipes(enabled: bool):
+    from agents.tools.recipes import configure_recipes
+
+    configure_recipes(enabled)
+
+
+def _start_profiler(memory: bool):
+    from agents.tools import logger_config
+    from agents.tools.profiler import Profiler
+
+    log_dir = os.path.dirname(os.path.abspath(logger_config.LOG_PATH))
+    profiler = Profiler(os.path.join(log_dir, "profile", time.strftime("%Y%m%d-%H%M%S")), memory=memory)
+    profiler.start()
+    return profiler
+
+
+def _fail_on_replay_misses():
+    from agents.tools.response_cache import replay_misses
+
+    misses = replay_misses()
+    if misses:
+        logger.error(f"Replay: {misses} LLM requests were not in the recording.")
+        raise typer.Exit(code=1)
+
+
+def _default_to_migrate():
+    """
+    Keeps the original single-command syntax working: `python main.py /project --lib ...`.
+    """
+    command_names = {cmd.name or cmd.callback.__name__ for cmd in app.registered_commands}
+    if len(sys.argv) > 1 and sys.argv[1] not in command_names and sys.argv[1] not in (
+            "--help", "--install-completion", "--show-completion"):
+        sys.argv.insert(1, "migrate")
+
 
 if __name__ == "__main__":
+    _default_to_migrate()
     app()